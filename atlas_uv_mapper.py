@@ -4,8 +4,11 @@ from dataclasses import dataclass
 import json
 import drawsvg as draw
 from frd import FRD
+from frd_cache import FRDCache
 from quad_packer import AtlasPacker, make_atlas
+from profiling import Profiler, profiled
 
+@profiled("texture_atlas_svg")
 def texture_atlas_svg(atlas: AtlasPacker, frd: FRD, /, filename, sx=0.0, sy=0.0):
 	"""level texture data overlaid on a packed atlas"""
 
@@ -95,6 +98,7 @@ class TextureUvEntry:
 	texture_size: int
 	id: int
 
+@profiled("atlas_mapping")
 def atlas_mapping(atlas: AtlasPacker, frd: FRD, /, filename, sy=0.0):
 
 	atlas_texture = {t.id: t for t in atlas.packed}
@@ -134,6 +138,7 @@ def atlas_mapping(atlas: AtlasPacker, frd: FRD, /, filename, sy=0.0):
 
 if __name__ == "__main__":
 	import sys, os, argparse
+	from contextlib import nullcontext
 	parser = argparse.ArgumentParser(
 		prog="atlas_uv_mapper",
 		description="Maps texture UVs to an atlas",
@@ -143,6 +148,8 @@ if __name__ == "__main__":
 	parser.add_argument("frd_file")
 
 	parser.add_argument("--shift-y", type=float, default=0.0)
+	parser.add_argument("--no-cache", action="store_true", help="parse the FRD file without the on-disk cache")
+	parser.add_argument("--profile", help="write per-stage timings and peak memory as JSON to this file")
 
 	args = parser.parse_args()
 	
@@ -150,18 +157,22 @@ if __name__ == "__main__":
 	track_id = args.track_id
 	frd_filename = args.frd_file
 	
-	if os.path.isfile(frd_filename):
-		with open(frd_filename, "rb") as f:
-			frd = FRD(f.read())
-	else:
+	if not os.path.isfile(frd_filename):
 		print(f"Unable to find FRD file \"{frd_filename}\"")
 		sys.exit(1)
 
-	# 1024
-	atlas = make_atlas(track_id, atlas_size)
+	profiler = Profiler()
+	with profiler if args.profile else nullcontext():
+		frd = FRD.open(frd_filename, cache=None if args.no_cache else FRDCache())
 
-	atlas.image.save(f"{track_id}.png")
-	atlas.image_mask.save(f"{track_id}-a.png")
-	atlas_mapping(atlas, frd, filename=f"{track_id}-uv_mapping.json", sy=args.shift_y)
-	texture_atlas_svg(atlas, frd, filename=f"{track_id}-mapping.svg", sy=args.shift_y)
+		# 1024
+		atlas = make_atlas(track_id, atlas_size)
+
+		atlas.image.save(f"{track_id}.png")
+		atlas.image_mask.save(f"{track_id}-a.png")
+		atlas_mapping(atlas, frd, filename=f"{track_id}-uv_mapping.json", sy=args.shift_y)
+		texture_atlas_svg(atlas, frd, filename=f"{track_id}-mapping.svg", sy=args.shift_y)
+
+	if args.profile:
+		profiler.write(args.profile)
 
@@ -1,7 +1,10 @@
-from io import BytesIO
+from io import SEEK_SET, SEEK_CUR, SEEK_END
 from dataclasses import dataclass
-from struct import unpack
+from struct import Struct, unpack, unpack_from, calcsize
 from enum import Enum
+from collections.abc import Sequence
+import mmap
+import numpy as np
 
 class PolygonType(Enum):
 	TRACK = 0
@@ -10,8 +13,66 @@ class PolygonType(Enum):
 	OBJECT = 3
 	EXTRAOBJECT = 4
 
-def unpack_one(data: BytesIO, length: int, pattern: str):
-	return unpack(pattern, data.read(length))[0]
+LONG = Struct("<l")
+SHORT = Struct("<h")
+BYTE = Struct("<B")
+
+class Cursor:
+	"""
+	Read position over a bytes-like object, memoryview or mmap.
+	Values are unpacked in place with precompiled Structs and arrays are
+	np.frombuffer views, so no intermediate bytes objects are created.
+	"""
+
+	def __init__(self, buffer, offset=0):
+		self.buffer = buffer
+		self.offset = offset
+
+	def unpack(self, struct: Struct):
+		values = struct.unpack_from(self.buffer, self.offset)
+		self.offset += struct.size
+		return values
+
+	def array(self, dtype: np.dtype, count: int):
+		"""count fixed-size records as a structured array view"""
+		array = np.frombuffer(self.buffer, dtype, count, self.offset)
+		self.offset += dtype.itemsize * count
+		return array
+
+	def read(self, length: int):
+		view = memoryview(self.buffer)[self.offset:self.offset+length]
+		self.offset += length
+		return view
+
+	def seek(self, offset: int, whence=SEEK_SET):
+		if whence == SEEK_CUR:
+			offset += self.offset
+		elif whence == SEEK_END:
+			offset += len(self.buffer)
+		self.offset = offset
+		return self.offset
+
+	def tell(self):
+		return self.offset
+
+def unpack_one(data: Cursor, struct: Struct):
+	return data.unpack(struct)[0]
+
+def unpack_at(pattern: str, buffer, offset: int):
+	"""unpack_from that also accepts seekable file objects"""
+	if isinstance(buffer, (bytes, bytearray, memoryview, mmap.mmap)):
+		return unpack_from(pattern, buffer, offset)
+	buffer.seek(offset, SEEK_SET)
+	return unpack(pattern, buffer.read(calcsize(pattern)))
+
+def record_dtype(fields: dict, itemsize: int):
+	"""structured dtype with explicit offsets, unknown bytes are left as padding"""
+	return np.dtype({
+		"names": list(fields),
+		"formats": [f for f, o in fields.values()],
+		"offsets": [o for f, o in fields.values()],
+		"itemsize": itemsize,
+	})
 
 @dataclass(frozen=True)
 class FloatPoint:
@@ -19,9 +80,16 @@ class FloatPoint:
 	z: float
 	y: float
 
+	dtype = np.dtype([("x", "<f4"), ("z", "<f4"), ("y", "<f4")])
+	struct = Struct("<fff")
+
+	@staticmethod
+	def read(data: Cursor):
+		return FloatPoint(*data.unpack(FloatPoint.struct))
+
 	@staticmethod
-	def read(data: BytesIO):
-		return FloatPoint(*unpack("fff", data.read(12)))
+	def from_array(array: np.ndarray):
+		return [FloatPoint(*p) for p in array.tolist()]
 
 @dataclass(frozen=True)
 class IntPoint:
@@ -33,9 +101,16 @@ class IntPoint:
 	z: int
 	y: int
 
+	dtype = np.dtype([("x", "<i4"), ("z", "<i4"), ("y", "<i4")])
+	struct = Struct("<iii")
+
+	@staticmethod
+	def read(data: Cursor):
+		i = data.unpack(IntPoint.struct)
+		return IntPoint(i[0] / 2**16, i[1] / 2**16, i[2] / 2**16)
+
 	@staticmethod
-	def read(data: BytesIO):
-		i = unpack("iii", data.read(12))
+	def from_tuple(i: tuple[int]):
 		return IntPoint(i[0] / 2**16, i[1] / 2**16, i[2] / 2**16)
 
 @dataclass(frozen=True)
@@ -45,9 +120,16 @@ class VertexColor:
 	r: int
 	a: int
 
+	dtype = np.dtype([("b", "u1"), ("g", "u1"), ("r", "u1"), ("a", "u1")])
+	struct = Struct("<BBBB")
+
+	@staticmethod
+	def read(data: Cursor):
+		return VertexColor(*data.unpack(VertexColor.struct))
+
 	@staticmethod
-	def read(data: BytesIO):
-		return VertexColor(*unpack("BBBB", data.read(4)))
+	def from_array(array: np.ndarray):
+		return [VertexColor(*c) for c in array.tolist()]
 
 @dataclass(frozen=True)
 class PolygonData:
@@ -60,16 +142,41 @@ class PolygonData:
 	flags: int
 	unknown2: int
 
+	dtype = np.dtype([("vertex", "<i2", 4), ("texture", "<i2"), ("unknown", "<i2"), ("flags", "u1"), ("unknown2", "u1")])
+	struct = Struct("<hhhhhhBB")
+
+	@staticmethod
+	def read(data: Cursor):
+		*vertices, texture, unknown, flags, unknown2 = data.unpack(PolygonData.struct)
+		return PolygonData(tuple(vertices), texture, unknown, flags, unknown2)
+
 	@staticmethod
-	def read(data: BytesIO):
-		vertices = unpack("hhhh", data.read(8))
-		other = unpack("hhBB", data.read(6))
-		return PolygonData(vertices, *other)
+	def from_record(record: tuple):
+		vertex, *other = record
+		return PolygonData(tuple(vertex), *other)
 	
 	@property
 	def doublesided(self):
 		return self.flags & 0x10
 
+class PolygonList(Sequence):
+	"""Read-only view yielding PolygonData objects from a structured polygon array"""
+
+	def __init__(self, array: np.ndarray):
+		self.array = array
+
+	def __len__(self):
+		return len(self.array)
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return PolygonList(self.array[i])
+		return PolygonData.from_record(self.array[i].tolist())
+
+	def __iter__(self):
+		for record in self.array.tolist():
+			yield PolygonData.from_record(record)
+
 @dataclass
 class NeighborData:
 	"""
@@ -77,9 +184,16 @@ class NeighborData:
 	"""
 	block: int
 
+	dtype = record_dtype({"block": ("<i2", 0)}, 4)
+	struct = Struct("<hxx")
+
+	@staticmethod
+	def read(data: Cursor):
+		return NeighborData(*data.unpack(NeighborData.struct))
+
 	@staticmethod
-	def read(data: BytesIO):
-		return NeighborData(*unpack("hxx", data.read(4)))
+	def from_array(array: np.ndarray):
+		return [NeighborData(b) for b in array["block"].tolist()]
 
 @dataclass(frozen=True)
 class PositionData:
@@ -91,18 +205,37 @@ class PositionData:
 	extraNeighbor1: int
 	extraNeighbor2: int
 
+	dtype = record_dtype({
+		"polygon": ("<i2", 0),
+		"nPolygons": ("u1", 2),
+		"extraNeighbor1": ("<i2", 4),
+		"extraNeighbor2": ("<i2", 6),
+	}, 8)
+	struct = Struct("<hBxhh")
+
+	@staticmethod
+	def read(data: Cursor):
+		return PositionData(*data.unpack(PositionData.struct))
+
 	@staticmethod
-	def read(data: BytesIO):
-		return PositionData(*unpack("hBxhh", data.read(8)))
+	def from_array(array: np.ndarray):
+		return [PositionData(*p) for p in array.tolist()]
 
 @dataclass(frozen=True)
 class PolyVroadData:
 	vroadEntry: int
 	flags: int
 
+	dtype = record_dtype({"vroadEntry": ("u1", 0), "flags": ("u1", 1)}, 8)
+	struct = Struct("<BBxxxxxx")
+
 	@staticmethod
-	def read(data: BytesIO):
-		return PolyVroadData(*unpack("BBxxxxxx", data.read(8)))
+	def read(data: Cursor):
+		return PolyVroadData(*data.unpack(PolyVroadData.struct))
+
+	@staticmethod
+	def from_array(array: np.ndarray):
+		return [PolyVroadData(*p) for p in array.tolist()]
 	
 @dataclass(frozen=True)
 class VroadData:
@@ -113,9 +246,16 @@ class VroadData:
 	zForw: int
 	yForw: int
 
+	dtype = np.dtype([(name, "<i2") for name in ("xNorm", "zNorm", "yNorm", "xForw", "zForw", "yForw")])
+	struct = Struct("<hhhhhh")
+
 	@staticmethod
-	def read(data: BytesIO):
-		return VroadData(*unpack("hhhhhh", data.read(12)))
+	def read(data: Cursor):
+		return VroadData(*data.unpack(VroadData.struct))
+
+	@staticmethod
+	def from_array(array: np.ndarray):
+		return [VroadData(*v) for v in array.tolist()]
 
 @dataclass(frozen=True)
 class RefXobj:
@@ -123,9 +263,20 @@ class RefXobj:
 	globalno: int
 	crossindex: int
 
+	dtype = record_dtype({
+		"point": (IntPoint.dtype, 0),
+		"globalno": ("<i2", 14),
+		"crossindex": ("u1", 18),
+	}, 20)
+	struct = Struct("<xxhxxBx")
+
 	@staticmethod
-	def read(data: BytesIO):
-		return RefXobj(IntPoint.read(data), *unpack("xxhxxBx", data.read(8)))
+	def read(data: Cursor):
+		return RefXobj(IntPoint.read(data), *data.unpack(RefXobj.struct))
+
+	@staticmethod
+	def from_array(array: np.ndarray):
+		return [RefXobj(IntPoint.from_tuple(p), g, c) for p, g, c in array.tolist()]
 
 @dataclass(frozen=True)
 class RefPolyObject:
@@ -135,14 +286,16 @@ class RefPolyObject:
 	point: IntPoint
 	crossindex: int
 
+	struct = Struct("<BB")
+
 	@staticmethod
-	def read(data: BytesIO):
-		entrysize = unpack("h", data.read(2))[0]
+	def read(data: Cursor):
+		entrysize = unpack_one(data, SHORT)
 
 		if entrysize == 16:
-			return RefPolyObject(entrysize, *unpack("BB", data.read(2)), IntPoint.read(data), -1)
+			return RefPolyObject(entrysize, *data.unpack(RefPolyObject.struct), IntPoint.read(data), -1)
 		elif entrysize == 20:
-			return RefPolyObject(entrysize, *unpack("BB", data.read(2)), IntPoint.read(data), *unpack("i", data.read(4)))
+			return RefPolyObject(entrysize, *data.unpack(RefPolyObject.struct), IntPoint.read(data), unpack_one(data, LONG))
 		else:
 			raise "Unexpected entry size"
 
@@ -151,18 +304,30 @@ class Soundsrc:
 	refpoint: IntPoint
 	type: int
 
+	dtype = np.dtype([("refpoint", IntPoint.dtype), ("type", "<i4")])
+
 	@staticmethod
-	def read(data: BytesIO):
-		return Soundsrc(IntPoint.read(data), *unpack("i", data.read(4)))
+	def read(data: Cursor):
+		return Soundsrc(IntPoint.read(data), unpack_one(data, LONG))
+
+	@staticmethod
+	def from_array(array: np.ndarray):
+		return [Soundsrc(IntPoint.from_tuple(p), t) for p, t in array.tolist()]
 	
 @dataclass(frozen=True)
 class Lightsrc:
 	refpoint: IntPoint
 	type: int
 
+	dtype = np.dtype([("refpoint", IntPoint.dtype), ("type", "<i4")])
+
+	@staticmethod
+	def read(data: Cursor):
+		return Lightsrc(IntPoint.read(data), unpack_one(data, LONG))
+
 	@staticmethod
-	def read(data: BytesIO):
-		return Lightsrc(IntPoint.read(data), *unpack("i", data.read(4)))
+	def from_array(array: np.ndarray):
+		return [Lightsrc(IntPoint.from_tuple(p), t) for p, t in array.tolist()]
 
 @dataclass(frozen=True)
 class AnimData:
@@ -171,9 +336,16 @@ class AnimData:
 	costheta: float
 	sintheta: float
 
+	dtype = np.dtype([("point", IntPoint.dtype), ("costheta", "<f4"), ("sintheta", "<f4")])
+	struct = Struct("<ff")
+
+	@staticmethod
+	def read(data: Cursor):
+		return AnimData(IntPoint.read(data), *data.unpack(AnimData.struct))
+
 	@staticmethod
-	def read(data: BytesIO):
-		return AnimData(IntPoint.read(data), *unpack("ff", data.read(8)))
+	def from_array(array: np.ndarray):
+		return [AnimData(IntPoint.from_tuple(p), c, s) for p, c, s in array.tolist()]
 
 @dataclass(frozen=True)
 class TextureData:
@@ -186,14 +358,25 @@ class TextureData:
 	isLane: int
 	texture: int
 
+	dtype = record_dtype({
+		"width": ("<i2", 0),
+		"height": ("<i2", 2),
+		"unknown": ("<i4", 4),
+		"corners": (("<f4", 8), 8),
+		"unknown2": ("<i4", 40),
+		"isLane": ("?", 44),
+		"texture": ("<i2", 45),
+	}, 47)
+	struct = Struct("<hhl8fl?h")
+
+	@staticmethod
+	def read(data: Cursor):
+		width, height, unknown, *corners, unknown2, isLane, texture = data.unpack(TextureData.struct)
+		return TextureData(width, height, unknown, tuple(corners), unknown2, isLane, texture)
+
 	@staticmethod
-	def read(data: BytesIO):
-		dim = unpack("hhl", data.read(8))
-		corners = unpack("ffffffff", data.read(4*8))
-		unk2 = unpack("l", data.read(4))
-		isLane = unpack("?", data.read(1))
-		texture = unpack("h", data.read(2))
-		return TextureData(*dim, corners, *unk2, *isLane, *texture)
+	def from_array(array: np.ndarray):
+		return [TextureData(w, h, u, tuple(c), u2, l, t) for w, h, u, c, u2, l, t in array.tolist()]
 
 	def uv_pairs(self):
 		return [(self.corners[i*2], self.corners[i*2+1]) for i in range(4)]
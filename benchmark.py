@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+
+'''Benchmarks run against synthetic FRD files'''
+
+import os
+import sys
+import time
+import json
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import multiprocessing
+from dataclasses import asdict
+import numpy as np
+from frd import FRD
+from synthetic_frd import SyntheticTrack, generate, write_frd, write_textures, atlas_size
+
+def best_of(function, repeat=3):
+	"""best wall time in seconds"""
+	best = float("inf")
+	for i in range(repeat):
+		start = time.perf_counter()
+		function()
+		best = min(best, time.perf_counter() - start)
+	return best
+
+def bench_workers(data: bytes, counts=(1, 2, 4, 8), repeat=3):
+	"""full FRD parse time with a process pool of each size, 1 is the serial columnar parse"""
+	return {workers: best_of(lambda: FRD(data, columnar=True, workers=workers), repeat) for workers in counts}
+
+def bench_mesh(frd: FRD):
+	"""to_mesh over every track polygon chunk"""
+	for track, polygons in zip(frd.trk, frd.poly):
+		vertex_buffer = track.vertices_to_buffer()
+		shading_buffer = track.shading_to_buffer()
+		for chunk in polygons.poly:
+			chunk.to_mesh(vertex_buffer, shading_buffer=shading_buffer)
+
+def bench_triangulation(frd: FRD):
+	"""triangle buffers of every track chunk and extra object"""
+	for polygons in frd.poly:
+		for chunk in polygons.poly:
+			chunk.polygons_to_triangle_buffer()
+	for xobj in frd.xobj:
+		for obj in xobj.obj:
+			obj.polygons_to_triangle_buffer()
+
+def bench_normals(frd: FRD):
+	"""smooth vertex normals of every track polygon chunk"""
+	from normals import vertex_normals
+	for track, polygons in zip(frd.trk, frd.poly):
+		vertex_buffer = track.vertices_to_buffer()
+		for chunk in polygons.poly:
+			vertex_normals(vertex_buffer, chunk.quad_indices(), -1)
+
+def bench_suite(track: SyntheticTrack, repeat=3):
+	"""best wall time in seconds of each FRD processing stage"""
+	from quad_packer import make_atlas
+	from atlas_uv_mapper import atlas_mapping
+
+	data = generate(track)
+	frd = FRD(data)
+	results = {
+		"parse": best_of(lambda: FRD(data), repeat),
+		"parse_columnar": best_of(lambda: FRD(data, columnar=True), repeat),
+		"to_mesh": best_of(lambda: bench_mesh(frd), repeat),
+		"triangulation": best_of(lambda: bench_triangulation(frd), repeat),
+		"normals": best_of(lambda: bench_normals(frd), repeat),
+		"get_used_texture_set": best_of(frd.get_used_texture_set, repeat),
+	}
+	with tempfile.TemporaryDirectory() as directory:
+		textures = os.path.join(directory, "textures")
+		write_textures(textures, track)
+		results["make_atlas"] = best_of(lambda: make_atlas(textures, atlas_size(track)), repeat)
+		atlas = make_atlas(textures, atlas_size(track))
+		mapping = os.path.join(directory, "uv_mapping.json")
+		results["atlas_mapping"] = best_of(lambda: atlas_mapping(atlas, frd, filename=mapping), repeat)
+	return results
+
+def peak_rss():
+	"""
+	Peak resident set size in bytes. Linux VmHWM starts over in a new process
+	image, ru_maxrss would carry over the RSS of the parent that spawned it.
+	"""
+	try:
+		with open("/proc/self/status", encoding="ascii") as f:
+			for line in f:
+				if line.startswith("VmHWM:"):
+					return int(line.split()[1]) * 1024
+	except OSError:
+		pass
+	import resource
+	# ru_maxrss is in KiB on Linux and in bytes on macOS
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+def export_peak_rss(filename: str, stream: bool):
+	"""
+	One glTF export, run in a fresh process as peak RSS can't be reset.
+	stream reads with FRDStream and writes with the streaming builder,
+	otherwise the whole track is parsed and held.
+	"""
+	from frd import FRDStream
+	from frd_exporter import export_gltf
+	baseline = peak_rss()
+	output = f"{filename}.glb"
+	start = time.perf_counter()
+	if stream:
+		with open(filename, "rb") as f:
+			export_gltf(FRDStream(f, columnar=True), output, stream=True)
+	else:
+		export_gltf(FRD.open(filename, columnar=True), output)
+	return {
+		"seconds": time.perf_counter() - start,
+		"baseline_rss": baseline,
+		"peak_rss": peak_rss(),
+		"frd_bytes": os.path.getsize(filename),
+		"glb_bytes": os.path.getsize(output),
+	}
+
+def bench_export(track: SyntheticTrack, modes=("memory", "stream")):
+	"""peak RSS of a full and a streaming glTF export of the same track"""
+	context = multiprocessing.get_context("spawn")
+	results = {}
+	with tempfile.TemporaryDirectory() as directory:
+		filename = os.path.join(directory, "track.frd")
+		write_frd(filename, track)
+		for mode in modes:
+			with context.Pool(1) as pool:
+				results[mode] = pool.apply(export_peak_rss, (filename, mode == "stream"))
+	return results
+
+def bench_vertex_cache(frd: FRD, cacheSize=16):
+	"""ACMR of the welded hires pool and of the exported index buffers before and after optimization"""
+	from frd_exporter import EXPORT_CHUNKS, uv_table, mesh_buffers
+	from frd_mesh import VertexPool
+	from vertex_cache import VertexCacheOptimizer
+
+	# the export buffers split a vertex per texture and quad corner, so reordering finds nothing to share
+	exportOptimizer = VertexCacheOptimizer(cacheSize)
+	uvs = {polygon_type: uv_table(frd, polygon_type) for chunk, name, polygon_type in EXPORT_CHUNKS}
+	for track, polygons in zip(frd.trk, frd.poly):
+		vertex_buffer = track.vertices_to_buffer()
+		shading_buffer = track.shading_to_buffer()
+		for chunk, name, polygon_type in EXPORT_CHUNKS:
+			if len(polygons.poly[chunk].polyArray):
+				positions, colors, texcoords, indices, ranges, normals = mesh_buffers(polygons.poly[chunk], vertex_buffer, shading_buffer, uvs[polygon_type], True)
+				exportOptimizer.optimize(indices, len(positions), [(start, end) for texture, start, end in ranges])
+
+	pool = VertexPool.build(frd)
+	triangles = pool.triangles("hires")[0]
+	poolOptimizer = VertexCacheOptimizer(cacheSize)
+	seconds = best_of(lambda: poolOptimizer.optimize(triangles, len(pool.vertices)), 1)
+	return {
+		"export": {
+			"triangles": exportOptimizer.triangles,
+			"acmr_before": exportOptimizer.acmr_before,
+			"acmr_after": exportOptimizer.acmr_after,
+		},
+		"pool": {
+			"triangles": len(triangles),
+			"acmr_before": poolOptimizer.acmr_before,
+			"acmr_after": poolOptimizer.acmr_after,
+			"seconds": seconds,
+		},
+	}
+
+def rendered_normals(filename: str):
+	"""unit NORMAL of every node of a GLB as a viewer shows it, through the inverse transpose of the node scale"""
+	from normals import normalize
+
+	with open(filename, "rb") as f:
+		data = f.read()
+	document_length = int.from_bytes(data[12:16], "little")
+	document = json.loads(data[20:20 + document_length])
+	binary = 28 + document_length
+	normals = {}
+	for node in document["nodes"]:
+		primitive = document["meshes"][node["mesh"]]["primitives"][0]
+		if "NORMAL" not in primitive["attributes"]:
+			continue
+		accessor = document["accessors"][primitive["attributes"]["NORMAL"]]
+		view = document["bufferViews"][accessor["bufferView"]]
+		vectors = np.frombuffer(data, "<f4", 3 * accessor["count"], binary + view["byteOffset"]).reshape(-1, 3)
+		normals[node["name"]] = normalize(vectors / np.asarray(node.get("scale", (1.0, 1.0, 1.0))))
+	return normals
+
+def bench_quantize(frd: FRD):
+	"""
+	GLB and cached vertex sizes with float32 and quantized positions, the
+	largest position error and the largest angle between the normals shown
+	for both exports
+	"""
+	from frd_exporter import export_gltf
+	from frd_quantize import QuantizedTrack
+
+	results = {}
+	normals = {}
+	with tempfile.TemporaryDirectory() as directory:
+		for mode in ("float", "quantized"):
+			filename = os.path.join(directory, f"{mode}.glb")
+			results[f"glb_{mode}_seconds"] = best_of(lambda: export_gltf(frd, filename, quantize=mode == "quantized"), 1)
+			results[f"glb_{mode}_bytes"] = os.path.getsize(filename)
+			with open(filename, "rb") as f:
+				document_length = int.from_bytes(f.read(16)[12:], "little")
+			results[f"binary_{mode}_bytes"] = results[f"glb_{mode}_bytes"] - 28 - document_length
+			export_gltf(frd, filename, quantize=mode == "quantized", normals=True)
+			normals[mode] = rendered_normals(filename)
+
+		cosine = min((np.einsum("ij,ij->i", normals["float"][name], normals["quantized"][name]).min() for name in normals["float"]), default=1.0)
+		results["max_normal_degrees"] = float(np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0))))
+
+		track = QuantizedTrack.build(frd)
+		vertices = os.path.join(directory, "float.npz")
+		np.savez(vertices, positions=track.decode(), shading=track.shading)
+		quantized = os.path.join(directory, "quantized.npz")
+		np.savez(quantized, **track.to_arrays())
+		results["vertices_float_bytes"] = os.path.getsize(vertices)
+		results["vertices_quantized_bytes"] = os.path.getsize(quantized)
+		results["decode_seconds"] = best_of(track.decode, 3)
+		results["max_error"] = track.maxError
+	return results
+
+def bench_raycast(frd: FRD, rays=1 << 16, seed=0):
+	"""BVH build time and rays per second of nearest hit and occlusion queries"""
+	from frd_raycast import RayCaster
+
+	start = time.perf_counter()
+	caster = RayCaster.build(frd)
+	build = time.perf_counter() - start
+	corners = caster.corners.reshape(-1, 3)
+	lo, hi = corners.min(axis=0), corners.max(axis=0)
+	rng = np.random.default_rng(seed)
+	# straight down onto the track from above, and in random directions from inside its box
+	down = np.column_stack((rng.uniform(lo[0], hi[0], rays), rng.uniform(lo[1], hi[1], rays), np.full(rays, hi[2] + 10)))
+	random = rng.uniform(lo, hi, (rays, 3))
+	directions = rng.normal(size=(rays, 3))
+	results = {"triangles": len(caster.corners), "build_seconds": build}
+	for name, origins, direction in (("down", down, (0, 0, -1)), ("random", random, directions)):
+		direction = np.broadcast_to(direction, (rays, 3))
+		results[f"{name}_rays_per_second"] = rays / best_of(lambda: caster.cast(origins, direction), 1)
+		results[f"{name}_occluded_10_rays_per_second"] = rays / best_of(lambda: caster.occluded(origins, direction, 10.0), 1)
+	return results
+
+def commit():
+	"""current git commit of the repository, if there is one"""
+	try:
+		return subprocess.run(
+			["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+			capture_output=True, text=True, check=True,
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def bench_allocations(data: bytes, columnar=True, blocks=64):
+	"""
+	Peak bytes allocated while parsing one track block and its polygon block,
+	and bytes still held by the parsed objects, averaged over the first blocks
+	"""
+	frd = FRD(data, columnar, lazy=True)
+	blocks = min(blocks, frd.nBlocks+1)
+	peak, retained, seconds = 0, 0, 0.0
+	tracemalloc.start()
+	for i in range(blocks):
+		tracemalloc.reset_peak()
+		before = tracemalloc.get_traced_memory()[0]
+		start = time.perf_counter()
+		parsed = frd.trk[i], frd.poly[i]
+		seconds += time.perf_counter() - start
+		current, block_peak = tracemalloc.get_traced_memory()
+		peak += block_peak - before
+		retained += current - before
+	tracemalloc.stop()
+	return {
+		"peak_bytes_per_track": peak / blocks,
+		"retained_bytes_per_track": retained / blocks,
+		"seconds_per_track": seconds / blocks,
+	}
+
+if __name__ == "__main__":
+	import argparse
+	parser = argparse.ArgumentParser(
+		prog="benchmark",
+		description="Benchmarks FRD processing on synthetic tracks",
+	)
+	parser.add_argument("--blocks", type=int, default=1000)
+	parser.add_argument("--columns", type=int, default=16)
+	parser.add_argument("--rows", type=int, default=16)
+	parser.add_argument("--xobjs", type=int, default=1)
+	parser.add_argument("--animated", type=int, default=2)
+	parser.add_argument("--textures", type=int, default=64)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--repeat", type=int, default=3)
+	parser.add_argument("--json", help="write results to this file")
+	subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+	subparsers.add_parser("suite", help="parse, mesh, triangulation, texture set and atlas stages")
+
+	export_parser = subparsers.add_parser("export", help="peak RSS of full and streaming glTF export")
+	export_parser.add_argument("--modes", nargs="+", choices=["memory", "stream"], default=["memory", "stream"])
+
+	workers_parser = subparsers.add_parser("workers", help="parallel block parsing")
+	workers_parser.add_argument("--counts", type=int, nargs="+", default=[1, 2, 4, 8])
+
+	allocations_parser = subparsers.add_parser("allocations", help="memory allocated per parsed track block")
+	allocations_parser.add_argument("--records", action="store_true", help="parse into dataclass lists instead of arrays")
+
+	vertex_cache_parser = subparsers.add_parser("vertexcache", help="ACMR and cost of index buffer reordering")
+	vertex_cache_parser.add_argument("--cache-size", type=int, default=16)
+
+	subparsers.add_parser("quantize", help="size and error of int16 positions and uint16 UVs")
+
+	raycast_parser = subparsers.add_parser("raycast", help="BVH build and ray cast throughput")
+	raycast_parser.add_argument("--rays", type=int, default=1 << 16)
+
+	args = parser.parse_args()
+
+	track = SyntheticTrack(
+		blocks=args.blocks,
+		columns=args.columns,
+		rows=args.rows,
+		xobjs=args.xobjs,
+		animated=args.animated,
+		textures=args.textures,
+		seed=args.seed,
+	)
+	data = generate(track)
+	print(f"synthetic track: {args.blocks} blocks, {len(data) / 2**20:.1f} MiB")
+
+	match args.benchmark:
+		case "export":
+			results = bench_export(track, args.modes)
+			for mode, result in results.items():
+				print(f"{mode:>8} {result['seconds']:8.2f} s  peak RSS {result['peak_rss'] / 2**20:8.1f} MiB  (baseline {result['baseline_rss'] / 2**20:.1f} MiB, output {result['glb_bytes'] / 2**20:.1f} MiB)")
+		case "suite":
+			results = bench_suite(track, args.repeat)
+			for stage, seconds in results.items():
+				print(f"{stage:>25} {seconds * 1000:10.1f} ms")
+		case "workers":
+			results = bench_workers(data, args.counts, args.repeat)
+			for workers, seconds in results.items():
+				print(f"{workers:>3} workers {seconds * 1000:10.1f} ms")
+		case "vertexcache":
+			results = bench_vertex_cache(FRD(data), args.cache_size)
+			export, pool = results["export"], results["pool"]
+			print(f"export buffers {export['triangles']:>8} triangles  ACMR {export['acmr_before']:.3f} -> {export['acmr_after']:.3f}")
+			print(f"welded pool    {pool['triangles']:>8} triangles  ACMR {pool['acmr_before']:.3f} -> {pool['acmr_after']:.3f}  reordered in {pool['seconds']:.2f} s")
+		case "quantize":
+			results = bench_quantize(FRD(data))
+			for name in ("glb", "binary", "vertices"):
+				before, after = results[f"{name}_float_bytes"], results[f"{name}_quantized_bytes"]
+				print(f"{name:>8} {before / 2**20:8.1f} MiB -> {after / 2**20:8.1f} MiB ({before / after:.2f}x)")
+			print(f"max position error {results['max_error']:.6g}, decode {results['decode_seconds'] * 1000:.1f} ms")
+			print(f"largest normal difference {results['max_normal_degrees']:.4f} degrees")
+		case "raycast":
+			results = bench_raycast(FRD(data, columnar=True), args.rays, args.seed)
+			for name, value in results.items():
+				print(f"{name:>32} {value:14.6g}")
+		case "allocations":
+			results = bench_allocations(data, not args.records)
+			for name, value in results.items():
+				print(f"{name:>25} {value:14.6g}")
+
+	if args.json:
+		with open(args.json, "w", encoding="utf8") as f:
+			json.dump({
+				"benchmark": args.benchmark,
+				"commit": commit(),
+				"python": platform.python_version(),
+				"numpy": np.__version__,
+				"track": asdict(track),
+				"results": results,
+			}, f, indent=1)
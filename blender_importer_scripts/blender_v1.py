@@ -13,6 +13,7 @@ if not dir in sys.path:
     sys.path.append(directory)
 
 import frd
+from frd_cache import FRDCache
 
 if __name__ == "__main__":
     
@@ -23,9 +24,7 @@ if __name__ == "__main__":
     print("-------------------------------------------------------------------------------")
     
     with open(os.path.join(directory, f"{track_name}.FRD"), "rb") as f:
-        filedata = f.read()
-        
-        nfs_track = frd.FRD(filedata)
+        nfs_track = frd.FRD.open(f.name, columnar=True, cache=FRDCache(os.path.join(directory, ".frd_cache")))
         
         if f"{track_name}" in bpy.data.collections:
             col = bpy.data.collections.get(f"{track_name}")
@@ -97,37 +96,24 @@ if __name__ == "__main__":
             shading = polymesh.to_shading(shading_buffer)
             
             def create_object(object_name, mesh_object):
-                verts, polys, textures = mesh_object.to_mesh(vertex_buffer)
+                verts, polys = mesh_object.to_mesh(vertex_buffer)[:2]
                 mesh = bpy.data.meshes.new(object_name)
                 obj = bpy.data.objects.new(object_name, mesh)
-                material_index_mapping = {}
-                for material_index, tex_id in enumerate(textures):
+                # one material slot per texture batch
+                batches = mesh_object.batch_by_texture()
+                for tex_id in batches.texture.tolist():
                     obj.data.materials.append(material_mapping.get(tex_id))
-                    material_index_mapping[tex_id] = material_index
                     
                 print(object_name)
-                print(textures)
                 print(list(obj.data.materials))
-                print(list(material_index_mapping.items()))
                 col.objects.link(obj)
                 mesh.from_pydata(verts, [], polys)
                 mesh.uv_layers.new(name="UVMap")
                 
-                bm = bmesh.new()
-                bm.from_mesh(mesh)
-                bm.faces.ensure_lookup_table()
-                uv_layer = bm.loops.layers.uv[0]
-                
-                for polygon_index, polygon in enumerate(mesh_object.poly):
-                    face = bm.faces[polygon_index]
-                    face.material_index = material_index_mapping[polygon.texture]
-                    #for loop in face.loops:
-                    #    print(loop)
-                    #    break
-                    #break
-                    
-                bm.to_mesh(mesh)
-                bm.free()
+                material_index = np.empty(len(polys), dtype=np.int32)
+                material_index[batches.order] = np.repeat(np.arange(len(batches)), batches.end - batches.start)
+                mesh.polygons.foreach_set("material_index", material_index)
+                mesh.update()
                     
             
             #create_object(f"track_{i:04}_hires", polymesh)
@@ -16,11 +16,17 @@ if not dir in sys.path:
     sys.path.append(directory)
 
 import frd
+from frd_cache import FRDCache
 from basic import PolygonType
 
 if __name__ == "__main__":
         
     track_name = "TR02"
+    # only blocks within hops of the focus block are parsed and imported, None imports all
+    focus_block = 0
+    hops = 0
+    # extra objects of every block are imported unless this limits them to the same blocks
+    xobj_working_set = False
     
     print("-------------------------------------------------------------------------------")
     
@@ -28,12 +34,14 @@ if __name__ == "__main__":
         atlasMapping = json.load(f)
         atlasMapping = {int(k): v for k, v in atlasMapping.items()}
             
-    with open(os.path.join(directory, f"{track_name}.FRD"), "rb") as f:
-        filedata = f.read()
-        
-    nfs_track = frd.FRD(filedata)
+    nfs_track = frd.FRD.open(os.path.join(directory, f"{track_name}.FRD"), lazy=True, columnar=True, cache=FRDCache(os.path.join(directory, ".frd_cache")))
     texture_list = nfs_track.textures
     
+    if focus_block is None:
+        blocks = None
+    else:
+        blocks = nfs_track.neighbors.within_hops(focus_block, hops)
+    
     if f"{track_name}" in bpy.data.collections:
         col = bpy.data.collections.get(f"{track_name}")
         for obj in col.objects:
@@ -55,7 +63,7 @@ if __name__ == "__main__":
             case _:
                 flipped_quads = False
         
-        verts, polys, textures = mesh_object.to_mesh(vertex_buffer, flipped_quads)
+        verts, polys, textures = mesh_object.to_mesh(vertex_buffer, flipped_quads)[:3]
                 
         mesh = bpy.data.meshes.new(object_name)
         obj = bpy.data.objects.new(object_name, mesh)
@@ -122,13 +130,9 @@ if __name__ == "__main__":
 
         return obj
     
-    for i in range(nfs_track.nBlocks+1):
+    for i, track, polyblock in nfs_track.iter_track_blocks(blocks):
         #break
-        #if i != 129: continue
-        if i != 0: continue
-        track = nfs_track.trk[i]
         center = np.array([track.ptCentre.x, track.ptCentre.y, track.ptCentre.z])
-        polyblock = nfs_track.poly[i]
         polymesh, transparent, lanes = polyblock.poly[4], polyblock.poly[5], polyblock.poly[6]
         
         vertex_buffer = track.vertices_to_buffer()
@@ -155,7 +159,7 @@ if __name__ == "__main__":
         #break
     
     index = 0
-    for xobjBlock in nfs_track.xobj:
+    for xobj_index, xobjBlock in nfs_track.iter_xobj_blocks(blocks if xobj_working_set else None):
         for xobjData in xobjBlock.obj:
             xobj_name = f"xobj_{index:04}_{xobjData.type}"
             loc = xobjData.get_position()
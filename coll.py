@@ -1,4 +1,4 @@
-from io import BytesIO, SEEK_SET, SEEK_CUR, SEEK_END
+from io import SEEK_SET, SEEK_CUR, SEEK_END
 from basic import *
 from polygonblock import VertexOps
 
@@ -6,19 +6,19 @@ from polygonblock import VertexOps
 
 class ColFile:
 	
-	def __init__(self, data: BytesIO) -> None:
+	def __init__(self, data: Cursor) -> None:
 		data.seek(4, SEEK_SET)
-		self.version = unpack_one(data, 4, "l")
-		self.fileLength = unpack_one(data, 4, "l")
-		self.nBlocks = unpack_one(data, 4, "l")
+		self.version = unpack_one(data, LONG)
+		self.fileLength = unpack_one(data, LONG)
+		self.nBlocks = unpack_one(data, LONG)
 		self.xbTable = list(range(self.nBlocks))
 
 class XBColBlock:
 	
-	def __init__(self, data: BytesIO) -> None:
-		self.size = unpack_one(data, 4, "l")
-		self.xbid = unpack_one(data, 2, "h")
-		self.nrec = unpack_one(data, 2, "h")
+	def __init__(self, data: Cursor) -> None:
+		self.size = unpack_one(data, LONG)
+		self.xbid = unpack_one(data, SHORT)
+		self.nrec = unpack_one(data, SHORT)
 		match (self.xbid):
 			case 2:
 				t = ColTextureInfo
@@ -38,9 +38,11 @@ class ColTextureInfo:
 	unknown2: int
 	unknown3: int
 
+	struct = Struct("<hhhh")
+
 	@staticmethod
-	def read(data: BytesIO):
-		return ColTextureInfo(*unpack("hhhh", data.read(8)))
+	def read(data: Cursor):
+		return ColTextureInfo(*data.unpack(ColTextureInfo.struct))
 
 @dataclass(frozen=True)
 class ColVertex:
@@ -49,45 +51,47 @@ class ColVertex:
 	unknown: int
 
 	@staticmethod
-	def read(data: BytesIO):
-		return ColVertex(FloatPoint.read(data), *unpack("l", data.read(4)))
+	def read(data: Cursor):
+		return ColVertex(FloatPoint.read(data), unpack_one(data, LONG))
 
 @dataclass(frozen=True)
 class ColPolygon:
 	texture: int
 	vertex: tuple[int]
 
+	struct = Struct("<BBBB")
+
 	@staticmethod
-	def read(data: BytesIO):
-		return ColPolygon(*unpack("h", data.read(2)), unpack("BBBB", data.read(4)))
+	def read(data: Cursor):
+		return ColPolygon(unpack_one(data, SHORT), data.unpack(ColPolygon.struct))
 
 class ColStruct3D(VertexOps):
-	def __init__(self, data: BytesIO) -> None:
-		self.size = unpack_one(data, 4, "l")
-		self.nVertices = unpack_one(data, 2, "h")
-		self.nPoly = unpack_one(data, 2, "h")
+	def __init__(self, data: Cursor) -> None:
+		self.size = unpack_one(data, LONG)
+		self.nVertices = unpack_one(data, SHORT)
+		self.nPoly = unpack_one(data, SHORT)
 		self.vertices = [ColVertex.read(data) for i in range(self.nVertices)]
 		self.poly = [ColVertex.read(data) for i in range(self.nVertices)]
 	
 	@staticmethod
-	def read(data: BytesIO):
+	def read(data: Cursor):
 		return ColStruct3D(data)
 
 
 class ColObject:
-	def __init__(self, data: BytesIO) -> None:
-		self.size = unpack_one(data, 2, "h")
+	def __init__(self, data: Cursor) -> None:
+		self.size = unpack_one(data, SHORT)
 		if self.size == 16:
-			self.type = unpack_one(data, 1, "B")
-			self.struct3D = unpack_one(data, 1, "B")
+			self.type = unpack_one(data, BYTE)
+			self.struct3D = unpack_one(data, BYTE)
 			self.point = IntPoint.read(data)
 		else:
-			self.type = unpack_one(data, 1, "B")
+			self.type = unpack_one(data, BYTE)
 			if self.type != 3:
 				raise Exception(f"Unknown animate ColObject type \"{self.type}\"")
-			self.struct3D = unpack_one(data, 1, "B")
-			self.animLength = unpack_one(data, 2, "h")
-			self.unknown = unpack_one(data, 2, "h")
+			self.struct3D = unpack_one(data, BYTE)
+			self.animLength = unpack_one(data, SHORT)
+			self.unknown = unpack_one(data, SHORT)
 			self.animData = [AnimData.read(data) for i in range(self.animLength)]
 
 	@staticmethod
@@ -102,20 +106,22 @@ class ColVector:
 	y: int
 	unused: int
 
+	struct = Struct("<BBBB")
+
 	@staticmethod
-	def read(data: BytesIO):
-		return ColVector(*unpack("BBBB", data.read(4)))
+	def read(data: Cursor):
+		return ColVector(*data.unpack(ColVector.struct))
 
 class ColVroad:
-	def __init__(self, data: BytesIO) -> None:
+	def __init__(self, data: Cursor) -> None:
 		self.point = IntPoint.read(data)
-		self.unknown = unpack_one(data, 4, "l")
+		self.unknown = unpack_one(data, LONG)
 		self.normal = ColVector.read(data)
 		self.forward = ColVector.read(data)
 		self.right = ColVector.read(data)
-		self.leftWall = unpack_one(data, 4, "l")
-		self.rightWall = unpack_one(data, 4, "l")
+		self.leftWall = unpack_one(data, LONG)
+		self.rightWall = unpack_one(data, LONG)
 	
 	@staticmethod
-	def read(data: BytesIO):
+	def read(data: Cursor):
 		return ColVroad(data)
\ No newline at end of file
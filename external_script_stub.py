@@ -15,6 +15,7 @@ if not dir in sys.path:
     sys.path.append(directory)
 
 import frd
+from frd_cache import FRDCache
 from basic import PolygonType
 
 if __name__ == "__main__":
@@ -24,9 +25,7 @@ if __name__ == "__main__":
     print("-------------------------------------------------------------------------------")
     
     with open(os.path.join(directory, f"{track_name}.FRD"), "rb") as f:
-        filedata = f.read()
-        
-        nfs_track = frd.FRD(filedata)
+        nfs_track = frd.FRD.open(f.name, columnar=True, cache=FRDCache(os.path.join(directory, ".frd_cache")))
         atlas = nfs_track.textures
         
         if f"{track_name}" in bpy.data.collections:
@@ -105,7 +104,7 @@ if __name__ == "__main__":
                 
                 flipped_quads = object_type == PolygonType.TRACK
                 
-                verts, polys, textures = mesh_object.to_mesh(vertex_buffer, flipped_quads)
+                verts, polys, textures = mesh_object.to_mesh(vertex_buffer, flipped_quads)[:3]
                 mesh = bpy.data.meshes.new(object_name)
                 obj = bpy.data.objects.new(object_name, mesh)
                 material_index_mapping = {}
@@ -1,38 +1,493 @@
-from io import BytesIO, SEEK_SET, SEEK_CUR, SEEK_END
+from io import SEEK_SET, SEEK_CUR, SEEK_END
 from itertools import chain
+from functools import cached_property, partial
+from collections.abc import Sequence
+from dataclasses import dataclass
+import mmap
 import numpy as np
 
 from basic import *
 from polygonblock import *
 from struct import unpack
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from frd_cache import FRDCache
+from profiling import profiled, stage
+
+# bump whenever parsed or cached arrays change meaning
+PARSER_VERSION = 2
+
+@dataclass
+class BlockOffsets:
+	"""
+	Byte offsets of every block in an FRD file.
+	Each array has one extra entry holding the end of its section.
+	"""
+	nBlocks: int
+	trk: np.ndarray
+	poly: np.ndarray
+	xobj: np.ndarray
+	textures: int
+
+	@staticmethod
+	def scan(buffer):
+		"""walks the file reading only the count fields"""
+		nBlocks = unpack_at("<l", buffer, 28)[0]
+
+		def section(skip, offset, count):
+			offsets = np.zeros(count + 1, dtype=np.int64)
+			offsets[0] = offset
+			for i in range(count):
+				offset = offsets[i+1] = skip(buffer, offset)
+			return offsets
+
+		trk = section(TrackBlock.skip, 32, nBlocks+1)
+		poly = section(PolygonBlock.skip, trk[-1], nBlocks+1)
+		xobj = section(XobjBlock.skip, poly[-1], 4*(nBlocks+1)+1)
+		return BlockOffsets(nBlocks, trk, poly, xobj, int(xobj[-1]))
+
+	def to_arrays(self):
+		return {
+			"nBlocks": np.array(self.nBlocks),
+			"trkOffsets": self.trk,
+			"polyOffsets": self.poly,
+			"xobjOffsets": self.xobj,
+			"textureOffset": np.array(self.textures),
+		}
+
+	@staticmethod
+	def from_arrays(arrays: dict[str, np.ndarray]):
+		return BlockOffsets(
+			int(arrays["nBlocks"]),
+			arrays["trkOffsets"],
+			arrays["polyOffsets"],
+			arrays["xobjOffsets"],
+			int(arrays["textureOffset"]),
+		)
+
+class TrackGeometry:
+	"""
+	Converted track block vertex and shading buffers of a whole track as
+	stored in the FRD cache, concatenated with vertexOffsets indexing into
+	them. Polygon arrays are not stored, they are views of the file buffer.
+	The arrays are read-only, attach() hands slices of them to TrackBlocks.
+	"""
+
+	def __init__(self, arrays: dict[str, np.ndarray]):
+		self.vertexArray = arrays["vertices"]
+		self.shadingArray = arrays["shading"]
+		self.vertexOffsets = arrays["vertexOffsets"]
+		self.usedTextures = arrays["usedTextures"]
+		for array in (self.vertexArray, self.shadingArray):
+			array.flags.writeable = False
+
+	@staticmethod
+	def build(frd: 'FRD'):
+		vertices = [track.vertices_to_buffer() for track in frd.trk]
+		shading = [track.shading_to_buffer() for track in frd.trk]
+		return TrackGeometry({
+			"vertices": np.concatenate(vertices),
+			"shading": np.concatenate(shading),
+			"vertexOffsets": np.concatenate(([0], np.cumsum([len(a) for a in vertices]))).astype(np.int64),
+			"usedTextures": np.array(sorted(frd.get_used_texture_set()), dtype=np.int64),
+		})
+
+	def to_arrays(self):
+		return {
+			"vertices": self.vertexArray,
+			"shading": self.shadingArray,
+			"vertexOffsets": self.vertexOffsets,
+			"usedTextures": self.usedTextures,
+		}
+
+	def vertices(self, block: int):
+		return self.vertexArray[self.vertexOffsets[block]:self.vertexOffsets[block+1]]
+
+	def shading(self, block: int):
+		return self.shadingArray[self.vertexOffsets[block]:self.vertexOffsets[block+1]]
+
+	def attach(self, block: int, track: 'TrackBlock'):
+		"""vertices_to_buffer and shading_to_buffer of track return the cached buffers"""
+		track.vertexBuffer = self.vertices(block)
+		track.shadingBuffer = self.shading(block)
+
+@dataclass
+class NeighborGraph:
+	"""
+	CSR adjacency of the track blocks built from the TrackBlock neighbor tables,
+	the neighbors of block k are indices[indptr[k]:indptr[k+1]], closest first
+	"""
+	indptr: np.ndarray
+	indices: np.ndarray
+
+	TABLE = "<" + "hxx" * 0x12C
+
+	@staticmethod
+	def from_tables(tables: np.ndarray):
+		"""(nBlocks+1, 0x12C) block numbers, unused entries are -1"""
+		valid = (tables >= 0) & (tables < len(tables))
+		indptr = np.concatenate(([0], np.cumsum(valid.sum(axis=1)))).astype(np.int64)
+		return NeighborGraph(indptr, tables[valid].astype(np.int32))
+
+	@staticmethod
+	def scan(buffer, trk_offsets):
+		"""reads only the neighbor tables, buffer may be a seekable file"""
+		tables = []
+		for offset in trk_offsets:
+			tables.append(unpack_at(NeighborGraph.TABLE, buffer, TrackBlock.neighbor_offset(buffer, offset)))
+		return NeighborGraph.from_tables(np.array(tables, dtype=np.int16).reshape(-1, 0x12C))
+
+	@staticmethod
+	def build(frd: 'FRD'):
+		return NeighborGraph.from_tables(np.array([
+			track.neighborArray["block"] if track.columnar else [n.block for n in track.neighborData]
+			for track in frd.trk
+		], dtype=np.int16).reshape(-1, 0x12C))
+
+	@property
+	def nBlocks(self):
+		return len(self.indptr) - 1
+
+	def neighbors(self, block: int):
+		return self.indices[self.indptr[block]:self.indptr[block+1]]
+
+	def gather(self, blocks: np.ndarray):
+		"""concatenated neighbor lists of blocks, with repeats"""
+		blocks = np.asarray(blocks, dtype=np.int64)
+		start, end = self.indptr[blocks], self.indptr[blocks+1]
+		counts = end - start
+		index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+		return self.indices[index]
+
+	def within_hops(self, block: int, hops: int):
+		"""sorted blocks reachable from block in at most hops steps"""
+		visited = np.zeros(self.nBlocks, dtype=bool)
+		visited[block] = True
+		frontier = np.array([block])
+		for i in range(hops):
+			reached = self.gather(frontier)
+			frontier = np.unique(reached[~visited[reached]])
+			if len(frontier) == 0:
+				break
+			visited[frontier] = True
+		return np.flatnonzero(visited)
+
+	def visible_union(self, first: int, last: int):
+		"""sorted union of the neighbor lists of blocks first..last inclusive"""
+		return np.unique(self.gather(np.arange(first, last + 1)))
+
+class LazyBlockList(Sequence):
+	"""Parses blocks from their recorded offsets on first access"""
+
+	def __init__(self, buffer, offsets: np.ndarray, parse, attach=None):
+		"""attach(i, block) is called on every newly parsed block"""
+		self.buffer = buffer
+		self.offsets = offsets
+		self.parse = parse
+		self.attach = attach
+		self.blocks = [None] * (len(offsets) - 1)
+
+	def __len__(self):
+		return len(self.blocks)
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return [self[j] for j in range(*i.indices(len(self)))]
+		block = self.blocks[i]
+		if block is None:
+			i %= len(self)
+			start, end = self.offsets[i], self.offsets[i+1]
+			block = self.blocks[i] = self.parse(Cursor(self.buffer, start))
+			if self.attach is not None:
+				self.attach(i, block)
+		return block
+
+	def loaded(self):
+		return sum(block is not None for block in self.blocks)
+
+# shared file buffer of a parallel parsing worker process
+worker_memory: shared_memory.SharedMemory = None
+
+def init_worker(name: str):
+	global worker_memory
+	worker_memory = shared_memory.SharedMemory(name)
+
+def parse_worker_blocks(kind: str, offsets: np.ndarray):
+	"""parses the blocks between consecutive offsets of the shared file buffer"""
+	parse = {
+		"trk": partial(TrackBlock, columnar=True),
+		"poly": PolygonBlock,
+		"xobj": partial(XobjBlock, columnar=True),
+	}[kind]
+	return [parse(Cursor(worker_memory.buf, start)) for start in offsets[:-1]]
+
+def parse_parallel(data, offsets: BlockOffsets, workers: int):
+	"""
+	Spreads block parsing over a process pool reading a shared memory copy of
+	the file. Blocks are parsed in columnar mode so only arrays are sent back.
+	"""
+	memory = shared_memory.SharedMemory(create=True, size=len(data))
+	try:
+		memory.buf[:len(data)] = data
+		with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(memory.name,)) as pool:
+			sections = {}
+			for kind in ("trk", "poly", "xobj"):
+				section = getattr(offsets, kind)
+				step = max(1, (len(section) - 1) // (workers * 4))
+				sections[kind] = [
+					pool.submit(parse_worker_blocks, kind, section[i:i+step+1])
+					for i in range(0, len(section) - 1, step)
+				]
+			return [[block for task in sections[kind] for block in task.result()] for kind in ("trk", "poly", "xobj")]
+	finally:
+		memory.close()
+		memory.unlink()
 
 class FRD:
 
 	nBlocks: int
+	geometry: TrackGeometry = None
+	offsets: BlockOffsets = None
 	
-	def __init__(self, data: bytes):
-		bytes = BytesIO(data)
+	@profiled("FRD")
+	def __init__(self, data: bytes, columnar=False, lazy=False, offsets: BlockOffsets = None, textures: np.ndarray = None, workers=1, geometry: TrackGeometry = None):
+		"""
+		With lazy=True only the block offsets are scanned, trk, poly and xobj
+		blocks are parsed on first access.
+		workers > 1 parses all blocks in that many processes, always in columnar mode.
+		offsets and the texture table can be passed in when already known,
+		lazily parsed track blocks take their vertex buffers from geometry.
+		"""
+		if lazy or workers > 1:
+			self.buffer = data
+			with stage("FRD.offsets"):
+				self.offsets = offsets or BlockOffsets.scan(data)
+			self.nBlocks = self.offsets.nBlocks
+			if workers > 1:
+				with stage("FRD.parse_parallel"):
+					self.trk, self.poly, self.xobj = parse_parallel(data, self.offsets, workers)
+			else:
+				self.trk = LazyBlockList(data, self.offsets.trk, partial(TrackBlock, columnar=columnar), geometry and geometry.attach)
+				self.poly = LazyBlockList(data, self.offsets.poly, PolygonBlock)
+				self.xobj = LazyBlockList(data, self.offsets.xobj, partial(XobjBlock, columnar=columnar))
+			if textures is None:
+				self.nTextures = unpack_at("<l", data, self.offsets.textures)[0]
+				textures = np.frombuffer(data, TextureData.dtype, self.nTextures, self.offsets.textures + 4)
+			self.nTextures = len(textures)
+			self.textureArray = textures
+			self.textures = TextureData.from_array(textures)
+			self.geometry = geometry
+			return
+
+		cursor = Cursor(data)
 
 		# skip header
-		bytes.seek(28, SEEK_SET)
-		self.nBlocks = unpack("i", bytes.read(4))[0]
+		cursor.seek(28, SEEK_SET)
+		self.nBlocks = unpack_one(cursor, LONG)
 		#self.nBlocks = 0
-		self.trk = [TrackBlock(bytes) for i in range(self.nBlocks+1)]
-		self.poly = [PolygonBlock(bytes) for i in range(self.nBlocks+1)]
-		self.xobj = [XobjBlock(bytes) for i in range(4*(self.nBlocks+1)+1)]
-		self.nTextures = unpack("i", bytes.read(4))[0]
-		self.textures = [TextureData.read(bytes) for i in range(self.nTextures)]
+		with stage("FRD.trk"):
+			self.trk = [TrackBlock(cursor, columnar) for i in range(self.nBlocks+1)]
+		with stage("FRD.poly"):
+			self.poly = [PolygonBlock(cursor) for i in range(self.nBlocks+1)]
+		with stage("FRD.xobj"):
+			self.xobj = [XobjBlock(cursor, columnar) for i in range(4*(self.nBlocks+1)+1)]
+		with stage("FRD.textures"):
+			self.nTextures = unpack_one(cursor, LONG)
+			self.textures = [TextureData.read(cursor) for i in range(self.nTextures)]
 		pass
 
+	@classmethod
+	def open(cls, filename: str, lazy=False, columnar=False, cache: FRDCache = None, workers=1):
+		"""
+		lazy mode memory-maps the file instead of reading it.
+		With a cache the returned FRD is always lazy: the block offsets, texture
+		table and track vertex buffers come from the cache, and no block is
+		parsed until accessed. A file not in the cache yet is parsed once, with
+		workers when > 1, to fill it; those blocks are dropped afterwards.
+		With columnar=False parsed track blocks still read their record lists,
+		columnar=True leaves only the cached buffers to be used.
+		"""
+		with open(filename, "rb") as f:
+			if not lazy and cache is None:
+				return cls(f.read(), columnar, workers=workers)
+			buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		if cache is None:
+			return cls(buffer, columnar, lazy=True)
+
+		key = cache.key(buffer, PARSER_VERSION)
+		arrays = cache.load(key)
+		if arrays is None:
+			parsed = cls(buffer, True, lazy=True, workers=workers)
+			arrays = {
+				**parsed.offsets.to_arrays(),
+				"textureTable": parsed.textureArray,
+				**TrackGeometry.build(parsed).to_arrays(),
+			}
+			cache.store(key, arrays)
+			del parsed
+		return cls(
+			buffer, columnar, lazy=True,
+			offsets=BlockOffsets.from_arrays(arrays),
+			textures=arrays["textureTable"],
+			geometry=TrackGeometry(arrays),
+		)
+
+	def detached(self):
+		"""
+		Lazy columnar FRD over the same buffer for one-off passes over every
+		block, which then do not stay parsed here. Eager FRDs are returned as is.
+		"""
+		if self.offsets is None:
+			return self
+		return FRD(self.buffer, True, lazy=True, offsets=self.offsets, textures=self.textureArray, geometry=self.geometry)
+
+	@cached_property
+	def neighbors(self):
+		"""NeighborGraph, read straight from the file in lazy mode without parsing blocks"""
+		if self.offsets is not None:
+			return NeighborGraph.scan(self.buffer, self.offsets.trk[:-1].tolist())
+		return NeighborGraph.build(self)
+
+	def iter_track_blocks(self, blocks=None):
+		"""
+		yields (index, TrackBlock, PolygonBlock) in block order, only for blocks when given,
+		in lazy mode the other blocks are never parsed
+		"""
+		for i in range(self.nBlocks+1) if blocks is None else sorted(set(int(b) for b in blocks)):
+			yield i, self.trk[i], self.poly[i]
+
+	def iter_xobj_blocks(self, blocks=None):
+		"""yields (index, XobjBlock), when blocks is given only those of these track blocks and the global one"""
+		for i in range(4*(self.nBlocks+1)+1) if blocks is None else xobj_block_indices(blocks, self.nBlocks):
+			yield i, self.xobj[i]
+
 	def get_used_texture_set(self):
+		if self.geometry is not None:
+			return set(self.geometry.usedTextures.tolist())
 		#xobjs = set(obj.iter_polys() for xobj in self.xobj for obj in xobj.obj)
-		polygon_iterator = chain(
-			(t for poly in self.poly for t in poly.iter_polys()),
-			(t for xobj in self.xobj for obj in xobj.obj for t in obj.iter_polys()),
+		polygon_arrays = chain(
+			(a for poly in self.poly for a in poly.iter_polygon_arrays()),
+			(obj.polyArray for xobj in self.xobj for obj in xobj.obj),
 		)
-		return {t.texture for t in polygon_iterator}
+		return set(np.unique(np.concatenate([a["texture"] for a in polygon_arrays])).tolist())
+
+class FRDStream:
+	"""
+	Sequential reader over a seekable binary file object for bounded memory use.
+	Blocks are parsed straight from the file and not kept, section starts are
+	found from the count fields when first needed.
+	"""
+
+	def __init__(self, fileobj, columnar=False):
+		self.file = fileobj
+		self.columnar = columnar
+		self.nBlocks = unpack_at("<l", fileobj, 28)[0]
+		self.polyOffset = None
+		self.xobjOffset = None
+		self.textureOffset = None
+
+	def skip_blocks(self, skip, offset: int, count: int):
+		for i in range(count):
+			offset = skip(self.file, offset)
+		return offset
+
+	def poly_section(self):
+		if self.polyOffset is None:
+			self.polyOffset = self.skip_blocks(TrackBlock.skip, 32, self.nBlocks+1)
+		return self.polyOffset
+
+	def xobj_section(self):
+		if self.xobjOffset is None:
+			self.xobjOffset = self.skip_blocks(PolygonBlock.skip, self.poly_section(), self.nBlocks+1)
+		return self.xobjOffset
+
+	def texture_section(self):
+		if self.textureOffset is None:
+			self.textureOffset = self.skip_blocks(XobjBlock.skip, self.xobj_section(), 4*(self.nBlocks+1)+1)
+		return self.textureOffset
+
+	def read_block(self, skip, offset: int):
+		"""cursor over a single block read from the file, and the offset past it"""
+		end = skip(self.file, offset)
+		self.file.seek(offset, SEEK_SET)
+		return Cursor(self.file.read(end - offset)), end
+
+	@cached_property
+	def neighbors(self):
+		offsets = [32]
+		for i in range(self.nBlocks):
+			offsets.append(TrackBlock.skip(self.file, offsets[-1]))
+		return NeighborGraph.scan(self.file, offsets)
+
+	def iter_track_blocks(self, blocks=None):
+		"""
+		yields (index, TrackBlock, PolygonBlock) in block order,
+		only for blocks when given, the others are skipped without parsing
+		"""
+		selected = None if blocks is None else set(int(b) for b in blocks)
+		trk_offset, poly_offset = 32, self.poly_section()
+		for i in range(self.nBlocks+1):
+			if selected is not None and i not in selected:
+				trk_offset = TrackBlock.skip(self.file, trk_offset)
+				poly_offset = PolygonBlock.skip(self.file, poly_offset)
+				continue
+			data, trk_offset = self.read_block(TrackBlock.skip, trk_offset)
+			track = TrackBlock(data, self.columnar)
+			data, poly_offset = self.read_block(PolygonBlock.skip, poly_offset)
+			yield i, track, PolygonBlock(data)
+		self.xobjOffset = poly_offset
+
+	def iter_xobj_blocks(self, blocks=None):
+		"""
+		yields (index, XobjBlock), 4 per track block followed by the global one,
+		when blocks is given only those of these track blocks and the global one
+		"""
+		selected = None if blocks is None else set(xobj_block_indices(blocks, self.nBlocks))
+		offset = self.xobj_section()
+		for i in range(4*(self.nBlocks+1)+1):
+			if selected is not None and i not in selected:
+				offset = XobjBlock.skip(self.file, offset)
+				continue
+			data, offset = self.read_block(XobjBlock.skip, offset)
+			yield i, XobjBlock(data, self.columnar)
+		self.textureOffset = offset
+
+	@cached_property
+	def textures(self):
+		self.file.seek(self.texture_section(), SEEK_SET)
+		nTextures = unpack("<i", self.file.read(4))[0]
+		data = Cursor(self.file.read(nTextures * TextureData.struct.size))
+		return [TextureData.read(data) for i in range(nTextures)]
+
+def xobj_block_indices(blocks, nBlocks: int):
+	"""xobj block indices of track blocks, followed by the global animated block"""
+	return [4 * b + c for b in sorted(set(int(b) for b in blocks)) for c in range(4)] + [4 * (nBlocks+1)]
+
+def iter_track_blocks(fileobj, columnar=False):
+	"""yields (index, TrackBlock, PolygonBlock) pairs reading fileobj sequentially"""
+	return FRDStream(fileobj, columnar).iter_track_blocks()
+
+@dataclass(frozen=True)
+class TrackBlockCounts:
+	"""record counts of a track block, read by TrackBlock.counts without parsing it"""
+	nVertices: int
+	nStartPosition: int
+	nPositions: int
+	nPolygons: int
+	nVroad: int
+	nXobj: int
+	nPolyObj: int
+	nSoundsrc: int
+	nLightsrc: int
 
 class TrackBlock:
+	"""
+	With columnar=True the fixed-size record tables are read with np.frombuffer
+	into structured arrays (vertexArray, shadingArray, neighborArray, positionArray,
+	polyDataArray, vroadArray, xobjArray, soundsrcArray, lightsrcArray), fields
+	of which are column views, e.g. vertexArray["x"]. The dataclass lists are
+	only built when accessed.
+	"""
 	ptCentre: FloatPoint
 	ptBounding: list[FloatPoint]
 	nVertices: int
@@ -40,30 +495,50 @@ class TrackBlock:
 	nLoResVert: int
 	nMedResVert: int
 	nObjectVert: int
+	# converted buffers from the FRD cache, see TrackGeometry.attach
+	vertexBuffer: np.ndarray = None
+	shadingBuffer: np.ndarray = None
 
-	def __init__(self, data: BytesIO):
+	def __init__(self, data: Cursor, columnar=False):
+		self.columnar = columnar
 		self.ptCentre = FloatPoint.read(data)
 		self.ptBounding = [FloatPoint.read(data) for i in range(4)]
 
-		self.nVertices = unpack_one(data, 4, "l")
-		self.nHiResVert = unpack_one(data, 4, "l")
-		self.nLoResVert = unpack_one(data, 4, "l")
-		self.nMedResVert = unpack_one(data, 4, "l")
-		self.nVerticesDup = unpack_one(data, 4, "l")
-		self.nObjectVert = unpack_one(data, 4, "l")
-		self.vertices = [FloatPoint.read(data) for i in range(self.nVertices)]
-		self.shadingVertices = [VertexColor.read(data) for i in range(self.nVertices)]
-		self.neighborData = [NeighborData.read(data) for i in range(0x12C)]
-
-		self.nStartPosition = unpack_one(data, 4, "l")
-		self.nPositions = unpack_one(data, 4, "l")
-		self.nPolygons = unpack_one(data, 4, "l")
-		self.nVroad = unpack_one(data, 4, "l")
-		self.nXobj = unpack_one(data, 4, "l")
-		self.nPolyObj = unpack_one(data, 4, "l")
-		self.nSoundsrc = unpack_one(data, 4, "l")
-		self.nLightsrc = unpack_one(data, 4, "l")
+		self.nVertices = unpack_one(data, LONG)
+		self.nHiResVert = unpack_one(data, LONG)
+		self.nLoResVert = unpack_one(data, LONG)
+		self.nMedResVert = unpack_one(data, LONG)
+		self.nVerticesDup = unpack_one(data, LONG)
+		self.nObjectVert = unpack_one(data, LONG)
+		if columnar:
+			self.vertexArray = data.array(FloatPoint.dtype, self.nVertices)
+			self.shadingArray = data.array(VertexColor.dtype, self.nVertices)
+			self.neighborArray = data.array(NeighborData.dtype, 0x12C)
+		else:
+			self.vertices = [FloatPoint.read(data) for i in range(self.nVertices)]
+			self.shadingVertices = [VertexColor.read(data) for i in range(self.nVertices)]
+			self.neighborData = [NeighborData.read(data) for i in range(0x12C)]
+
+		self.nStartPosition = unpack_one(data, LONG)
+		self.nPositions = unpack_one(data, LONG)
+		self.nPolygons = unpack_one(data, LONG)
+		self.nVroad = unpack_one(data, LONG)
+		self.nXobj = unpack_one(data, LONG)
+		self.nPolyObj = unpack_one(data, LONG)
+		self.nSoundsrc = unpack_one(data, LONG)
+		self.nLightsrc = unpack_one(data, LONG)
 		
+		if columnar:
+			self.positionArray = data.array(PositionData.dtype, self.nPositions)
+			self.polyDataArray = data.array(PolyVroadData.dtype, self.nPolygons)
+			self.vroadArray = data.array(VroadData.dtype, self.nVroad)
+			self.xobjArray = data.array(RefXobj.dtype, self.nXobj)
+			# entries are 16 or 20 bytes long, padded to 20 bytes each in total
+			self.polyobjBuffer = bytes(data.read(self.nPolyObj * 20))
+			self.soundsrcArray = data.array(Soundsrc.dtype, self.nSoundsrc)
+			self.lightsrcArray = data.array(Lightsrc.dtype, self.nLightsrc)
+			return
+
 		self.positionData = [PositionData.read(data) for i in range(self.nPositions)]
 		self.polyData = [PolyVroadData.read(data) for i in range(self.nPolygons)]
 		self.vroadData = [VroadData.read(data) for i in range(self.nVroad)]
@@ -75,13 +550,82 @@ class TrackBlock:
 		self.lightsrc = [Lightsrc.read(data) for i in range(self.nLightsrc)]
 		pass
 
+	@staticmethod
+	def neighbor_offset(buffer, offset: int):
+		"""offset of the neighbor table, past the vertex and shading records"""
+		return offset + 84 + 16 * unpack_at("<l", buffer, offset + 60)[0]
+
+	@staticmethod
+	def counts(buffer, offset: int):
+		"""(TrackBlockCounts, offset just past the block) read from the count fields only"""
+		nVertices = unpack_at("<l", buffer, offset + 60)[0]
+		offset += 84 + 16 * nVertices + 4 * 0x12C
+		counts = TrackBlockCounts(nVertices, *unpack_at("<8l", buffer, offset))
+		offset += 32
+		return counts, offset + 8 * (counts.nPositions + counts.nPolygons) + 12 * counts.nVroad + 20 * (counts.nXobj + counts.nPolyObj) + 16 * (counts.nSoundsrc + counts.nLightsrc)
+
+	@staticmethod
+	def skip(buffer, offset: int):
+		return TrackBlock.counts(buffer, offset)[1]
+
+	# built from the record arrays on first access in columnar mode
+
+	@cached_property
+	def vertices(self):
+		return FloatPoint.from_array(self.vertexArray)
+
+	@cached_property
+	def shadingVertices(self):
+		return VertexColor.from_array(self.shadingArray)
+
+	@cached_property
+	def neighborData(self):
+		return NeighborData.from_array(self.neighborArray)
+
+	@cached_property
+	def positionData(self):
+		return PositionData.from_array(self.positionArray)
+
+	@cached_property
+	def polyData(self):
+		return PolyVroadData.from_array(self.polyDataArray)
+
+	@cached_property
+	def vroadData(self):
+		return VroadData.from_array(self.vroadArray)
+
+	@cached_property
+	def xobj(self):
+		return RefXobj.from_array(self.xobjArray)
+
+	@cached_property
+	def polyobj(self):
+		data = Cursor(self.polyobjBuffer)
+		return [RefPolyObject.read(data) for i in range(self.nPolyObj)]
+
+	@cached_property
+	def soundsrc(self):
+		return Soundsrc.from_array(self.soundsrcArray)
+
+	@cached_property
+	def lightsrc(self):
+		return Lightsrc.from_array(self.lightsrcArray)
+
 	def vertices_to_buffer(self):
+		if self.vertexBuffer is not None:
+			return self.vertexBuffer
+		if self.columnar:
+			return np.stack([self.vertexArray[c] for c in "xyz"], axis=1)
 		buffer = np.zeros((self.nVertices, 3), dtype=np.float32)
 		for i, vertex in enumerate(self.vertices):
 			buffer[i] = [vertex.x, vertex.y, vertex.z]
 		return buffer
 
 	def shading_to_buffer(self):
+		if self.shadingBuffer is not None:
+			return self.shadingBuffer
+		if self.columnar:
+			return np.stack([self.shadingArray[c] for c in "rgba"], axis=1)
 		buffer = np.zeros((self.nVertices, 4), dtype=np.uint8)
 		for i, shading in enumerate(self.shadingVertices):
 			buffer[i] = (shading.r, shading.g, shading.b, shading.a)
@@ -89,49 +633,112 @@ class TrackBlock:
 
 
 class XobjBlock:
-	def __init__(self, data: BytesIO) -> None:
-		self.nobj = unpack_one(data, 4, "l")
-		self.obj = [XobjData(data) for i in range(self.nobj)]
+	def __init__(self, data: Cursor, columnar=False) -> None:
+		self.nobj = unpack_one(data, LONG)
+		self.obj = [XobjData(data, columnar) for i in range(self.nobj)]
+
+	@staticmethod
+	def skip(buffer, offset: int):
+		nobj = unpack_at("<l", buffer, offset)[0]
+		offset += 4
+		for i in range(nobj):
+			offset = XobjData.skip(buffer, offset)
+		return offset
+
+@dataclass(frozen=True)
+class XobjCounts:
+	"""type and record counts of an extra object, read by XobjData.counts without parsing it"""
+	type: int
+	nVertices: int
+	nPolygons: int
 
 class XobjData(VertexOps):
-	def __init__(self, data: BytesIO) -> None:
-		self.type = unpack_one(data, 4, "l")
+	"""columnar=True reads vertexArray, shadingArray and animArray like TrackBlock"""
+
+	def __init__(self, data: Cursor, columnar=False) -> None:
+		self.columnar = columnar
+		self.type = unpack_one(data, LONG)
 		if self.type == 4:
 			# static extra-object
-			self.crossno = unpack_one(data, 4, "l")
+			self.crossno = unpack_one(data, LONG)
 			data.seek(4, SEEK_CUR) # unknown
 			self.pointReference = FloatPoint.read(data)
 			data.seek(4, SEEK_CUR) # unknown
-			self.nVertices = unpack_one(data, 4, "l")
-			self.vertices = [FloatPoint.read(data) for i in range(self.nVertices)]
-			self.shadingVertices = [VertexColor.read(data) for i in range(self.nVertices)]
-			self.nPolygons = unpack_one(data, 4, "l")
-			self.poly = [PolygonData.read(data) for i in range(self.nPolygons)]
 		elif self.type == 3:
 			# animated extra object
-			self.crossno = unpack_one(data, 4, "l")
+			self.crossno = unpack_one(data, LONG)
 			data.seek(4, SEEK_CUR) # long unknown
 			data.seek(2*9, SEEK_CUR) # short unknown[9]
-			self.type3 = unpack_one(data, 1, "B")
+			self.type3 = unpack_one(data, BYTE)
 			if self.type3 != 3:
 				raise Exception("Wrong type3 for animated extra object")
-			self.objno = unpack_one(data, 1, "B")
-			self.nAnimLength = unpack_one(data, 2, "h")
+			self.objno = unpack_one(data, BYTE)
+			self.nAnimLength = unpack_one(data, SHORT)
 			data.seek(2, SEEK_CUR) # short unknown
-			self.animData = [AnimData.read(data) for i in range(self.nAnimLength)]
-			self.nVertices = unpack_one(data, 4, "l")
+			if columnar:
+				self.animArray = data.array(AnimData.dtype, self.nAnimLength)
+			else:
+				self.animData = [AnimData.read(data) for i in range(self.nAnimLength)]
+		else:
+			raise "Unknown extra object type"
+
+		self.nVertices = unpack_one(data, LONG)
+		if columnar:
+			self.vertexArray = data.array(FloatPoint.dtype, self.nVertices)
+			self.shadingArray = data.array(VertexColor.dtype, self.nVertices)
+		else:
 			self.vertices = [FloatPoint.read(data) for i in range(self.nVertices)]
 			self.shadingVertices = [VertexColor.read(data) for i in range(self.nVertices)]
-			self.nPolygons = unpack_one(data, 4, "l")
-			self.poly = [PolygonData.read(data) for i in range(self.nPolygons)]
+		self.nPolygons = unpack_one(data, LONG)
+		self.read_polygons(data, self.nPolygons)
+
+	@cached_property
+	def vertices(self):
+		return FloatPoint.from_array(self.vertexArray)
+
+	@cached_property
+	def shadingVertices(self):
+		return VertexColor.from_array(self.shadingArray)
+
+	@cached_property
+	def animData(self):
+		return AnimData.from_array(self.animArray)
+
+	@staticmethod
+	def counts(buffer, offset: int):
+		"""(XobjCounts, offset just past the object) read from the count fields only"""
+		type = unpack_at("<l", buffer, offset)[0]
+		if type == 4:
+			offset += 28
+		elif type == 3:
+			nAnimLength = unpack_at("<h", buffer, offset + 32)[0]
+			offset += 36 + 20 * nAnimLength
 		else:
-			raise "Unknown extra object type"
+			raise Exception("Unknown extra object type")
+		nVertices = unpack_at("<l", buffer, offset)[0]
+		offset += 4 + 16 * nVertices
+		nPolygons = unpack_at("<l", buffer, offset)[0]
+		return XobjCounts(type, nVertices, nPolygons), offset + 4 + 14 * nPolygons
+
+	@staticmethod
+	def skip(buffer, offset: int):
+		return XobjData.counts(buffer, offset)[1]
 
 	def vertices_to_buffer(self):
+		if self.columnar:
+			return np.stack([self.vertexArray[c] for c in "xyz"], axis=1)
 		buffer = np.zeros((self.nVertices, 3), dtype=np.float32)
 		for i, vertex in enumerate(self.vertices):
 			buffer[i] = [vertex.x, vertex.y, vertex.z]
 		return buffer
+
+	def shading_to_buffer(self):
+		if self.columnar:
+			return np.stack([self.shadingArray[c] for c in "rgba"], axis=1)
+		buffer = np.zeros((self.nVertices, 4), dtype=np.uint8)
+		for i, shading in enumerate(self.shadingVertices):
+			buffer[i] = (shading.r, shading.g, shading.b, shading.a)
+		return buffer
 	
 	def get_position(self):
 		if self.type == 4:
@@ -139,3 +746,29 @@ class XobjData(VertexOps):
 		elif self.type == 3:
 			return self.animData[0].point
 		raise Exception("Type has no reference position data")
+
+if __name__ == "__main__":
+	import sys, json, argparse
+	from frd_stats import FRDStats, find_frd_files, format_table
+	parser = argparse.ArgumentParser(
+		prog="frd",
+		description="FRD file tools",
+	)
+	subparsers = parser.add_subparsers(dest="command", required=True)
+
+	stats_parser = subparsers.add_parser("stats", help="record counts read from the count fields only")
+	stats_parser.add_argument("files", nargs="+", help="FRD files or directories searched for them")
+	stats_parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+
+	args = parser.parse_args()
+
+	match args.command:
+		case "stats":
+			stats = [FRDStats.open(filename) for filename in find_frd_files(args.files)]
+			if not stats:
+				print("No FRD files found")
+				sys.exit(1)
+			if args.json:
+				print(json.dumps([s.to_dict() for s in stats], indent=1))
+			else:
+				print(format_table(stats))
@@ -0,0 +1,60 @@
+import os
+import hashlib
+import numpy as np
+
+class FRDCache:
+	"""
+	Content-addressed on-disk cache of parsed FRD arrays.
+	Entries are .npz files named after the file hash and parser version,
+	the least recently used ones are removed once max_size bytes is exceeded.
+	"""
+
+	def __init__(self, directory=".frd_cache", max_size=256 * 2**20):
+		self.directory = directory
+		self.max_size = max_size
+
+	def key(self, buffer, version: int):
+		return f"{hashlib.blake2b(buffer, digest_size=20).hexdigest()}-v{version}"
+
+	def path(self, key: str):
+		return os.path.join(self.directory, f"{key}.npz")
+
+	def load(self, key: str):
+		path = self.path(key)
+		if not os.path.isfile(path):
+			return None
+		with np.load(path) as npz:
+			arrays = {name: npz[name] for name in npz.files}
+		# entry use time drives eviction
+		os.utime(path)
+		return arrays
+
+	def store(self, key: str, arrays: dict[str, np.ndarray]):
+		os.makedirs(self.directory, exist_ok=True)
+		path = self.path(key)
+		temp = f"{path}.{os.getpid()}.tmp"
+		with open(temp, "wb") as f:
+			np.savez(f, **arrays)
+		os.replace(temp, path)
+		self.evict(keep=path)
+
+	def entries(self):
+		if not os.path.isdir(self.directory):
+			return []
+		paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".npz")]
+		return sorted(paths, key=os.path.getmtime)
+
+	def evict(self, keep=None):
+		entries = self.entries()
+		total = sum(os.path.getsize(path) for path in entries)
+		for path in entries:
+			if total <= self.max_size:
+				break
+			if path == keep:
+				continue
+			total -= os.path.getsize(path)
+			os.remove(path)
+
+	def clear(self):
+		for path in self.entries():
+			os.remove(path)
@@ -1,45 +1,381 @@
-from frd import FRD
-import pygltflib as gltf
+import os
+import json
+import shutil
+import tempfile
+from struct import pack
+import numpy as np
+from frd import FRD, FRDStream
+from basic import PolygonType
+from polygonblock import VertexOps, texture_batches
+from frd_lod import lod_polygons
+from frd_quantize import quantize_positions, quantize_uvs
+from normals import vertex_normals, normalize, winding
 
-def export_gltf(frd: FRD, filename: str):
+# glTF enums
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+COMPONENT_TYPES = {
+	np.dtype("int8"): 5120,
+	np.dtype("uint8"): 5121,
+	np.dtype("int16"): 5122,
+	np.dtype("uint16"): 5123,
+	np.dtype("uint32"): 5125,
+	np.dtype("float32"): 5126,
+}
+ACCESSOR_TYPES = {1: "SCALAR", 2: "VEC2", 3: "VEC3", 4: "VEC4"}
 
-	g = gltf.GLTF2()
+# track chunks exported for every block
+EXPORT_CHUNKS = [(4, "hires", PolygonType.TRACK), (5, "transparent", PolygonType.TRANSPARENT), (6, "lanes", PolygonType.LANES)]
 
-	scene = gltf.Scene()
-	gltf.scenes.append(scene)
+def to_gltf_axes(points: np.ndarray):
+	"""Z-up (x, y, z) to glTF's Y-up (x, z, -y)"""
+	points = np.asarray(points, dtype=np.float32)
+	return np.stack((points[..., 0], points[..., 2], -points[..., 1]), axis=-1)
 
-	for i in range(frd.nBlocks):
-		node = gltf.Node()
-		scene.nodes.append(node)
+def uv_table(frd: FRD | FRDStream, polygon_type: PolygonType):
+	"""(nTextures, 4, 2) corner UVs of every texture, as the importers map them"""
+	uvs = np.array([texture.uv_pairs() for texture in frd.textures], dtype=np.float32).reshape(-1, 4, 2)
+	if polygon_type in (PolygonType.OBJECT, PolygonType.EXTRAOBJECT):
+		uvs[..., 1] = 1.0 - uvs[..., 1]
+	return uvs
 
-		track = frd.trk[i]
-		polyblock = frd.poly[i]
-		mesh = polyblock.poly[4]
-		transparent = polyblock.poly[5]
-		lanes = polyblock.poly[6]
+def mesh_buffers(mesh: VertexOps, vertex_buffer: np.ndarray, shading_buffer: np.ndarray, uvs: np.ndarray, flipped: bool, normals=False):
+	"""
+	Triangulated mesh with per-corner UVs. Triangle corners sharing a vertex,
+	texture and quad corner share an output vertex, so UV seams are split.
+	Returns positions, RGBA colors, UVs, uint32 indices sorted by texture and
+	(texture, start, end) index ranges, then smooth normals facing the output
+	winding if normals is set, else None. With normals the back faces of
+	two-sided polygons get their own vertices with the normals reversed.
+	"""
+	triangles, source, corners = mesh.triangulate()
+	if flipped:
+		triangles, corners = triangles[:, ::-1], corners[:, ::-1]
+	# triangulate appends the back faces after the two front triangles of every quad
+	facing = np.arange(len(triangles)) >= 2 * len(mesh.polyArray)
+	batches = texture_batches(mesh.polyArray["texture"][source])
+	triangles, corners, facing = triangles[batches.order], corners[batches.order], facing[batches.order]
+	textures = np.repeat(batches.texture, batches.end - batches.start)
 
-		vertex_buffer = track.vertices_to_buffer()
-		triangle_buffer = mesh.quads_to_buffer()
+	# (vertex, texture, corner) packed into one integer key, plus the facing bit when normals tell the sides apart
+	nTextures = len(uvs)
+	sides = 2 if normals else 1
+	keys = ((triangles.ravel().astype(np.int64) * nTextures + np.repeat(textures, 3)) * 4 + corners.ravel()) * sides
+	if normals:
+		keys += np.repeat(facing, 3)
+	unique, indices = np.unique(keys, return_inverse=True)
+	indices = indices.ravel().astype(np.uint32)
+	ranges = [(texture, start * 3, end * 3) for texture, start, end in batches.ranges()]
+	back, unique = unique % sides, unique // sides
+	vertex, texture, corner = unique // (4 * nTextures), unique // 4 % nTextures, unique % 4
+
+	positions = vertex_buffer[vertex]
+	colors = shading_buffer[vertex]
+	texcoords = uvs[texture, corner]
+	if normals:
+		normals = vertex_normals(vertex_buffer, mesh.quad_indices(), -1 if flipped else 1)[vertex]
+		normals[back == 1] *= -1
+	else:
+		normals = None
+	return positions, colors, texcoords, indices, ranges, normals
+
+class GLBBuilder:
+	"""
+	glTF document whose binary chunk is a list of NumPy arrays, written
+	to the file from their own memory without joining them first.
+	The JSON part is kept as plain dicts, serializing thousands of accessors
+	through glTF object models costs more than the geometry itself.
+	quantize stores positions as int16 with the scale in the node transform
+	and UVs as normalized uint16 (KHR_mesh_quantization).
+	"""
+
+	def __init__(self, quantize=False):
+		self.document = {
+			"asset": {"version": "2.0", "generator": "frd_exporter"},
+			"scene": 0,
+			"scenes": [{}],
+			"nodes": [],
+			"meshes": [],
+			"materials": [],
+			"accessors": [],
+			"bufferViews": [],
+			"buffers": [{"byteLength": 0}],
+		}
+		self.arrays: list[np.ndarray] = []
+		self.length = 0
+		self.materials: dict[int, int] = {}
+		# nodes only reachable through another node's MSFT_lod extension
+		self.hidden: set[int] = set()
+		self.quantize = quantize
+
+	def append(self, key: str, item: dict):
+		self.document[key].append(item)
+		return len(self.document[key]) - 1
+
+	def store(self, array: np.ndarray):
+		self.arrays.append(array)
+
+	def use_extension(self, name: str, required=False):
+		for key in ("extensionsUsed", "extensionsRequired") if required else ("extensionsUsed",):
+			if name not in self.document.setdefault(key, []):
+				self.document[key].append(name)
+
+	def add_view(self, array: np.ndarray, target: int, stride: int = None):
+		array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+		padding = -self.length % 4
+		if padding:
+			self.store(np.zeros(padding, dtype=np.uint8))
+			self.length += padding
+		view = {"buffer": 0, "byteOffset": self.length, "byteLength": array.nbytes, "target": target}
+		if stride is not None:
+			view["byteStride"] = stride
+		view = self.append("bufferViews", view)
+		self.store(array)
+		self.length += array.nbytes
+		return view
+
+	def add_accessor(self, array: np.ndarray, target: int, normalized=False, bounds=False):
+		width = 1 if array.ndim == 1 else array.shape[1]
+		stride = None
+		if target == ARRAY_BUFFER and array.itemsize * width % 4:
+			# vertex attribute elements have to start on 4 byte boundaries
+			padded = np.zeros((len(array), -(-array.itemsize * width // 4) * 4 // array.itemsize), dtype=array.dtype)
+			padded[:, :width] = array
+			stride = padded.itemsize * padded.shape[1]
+		accessor = {
+			"bufferView": self.add_view(array if stride is None else padded, target, stride),
+			"componentType": COMPONENT_TYPES[array.dtype],
+			"count": len(array),
+			"type": ACCESSOR_TYPES[width],
+		}
+		if normalized:
+			accessor["normalized"] = True
+		if bounds and len(array):
+			accessor["min"] = np.atleast_1d(array.min(axis=0)).tolist()
+			accessor["max"] = np.atleast_1d(array.max(axis=0)).tolist()
+		return self.append("accessors", accessor)
+
+	def material(self, texture: int):
+		if texture not in self.materials:
+			self.materials[texture] = self.append("materials", {"name": f"texture_{texture}"})
+		return self.materials[texture]
+
+	def add_mesh(self, name: str, positions, colors, texcoords, indices, ranges, translation=None, lods=None, root=True, normals=None):
+		"""
+		node with one primitive per texture range, all sharing the vertex attributes.
+		lods are lower detail node ids in decreasing detail, attached with MSFT_lod,
+		root=False leaves the node out of the scene for use as such a level
+		"""
+		if len(indices) == 0:
+			return None
+		scale = None
+		quantized_uvs = None
+		if self.quantize:
+			self.use_extension("KHR_mesh_quantization", required=True)
+			positions, scale = quantize_positions(positions)
+			quantized_uvs = quantize_uvs(texcoords)
+			# 0xFFFF is the primitive restart value and may not appear in uint16 indices
+			if len(positions) < 0xFFFF:
+				indices = indices.astype(np.uint16)
+		attributes = {
+			"POSITION": self.add_accessor(positions, ARRAY_BUFFER, bounds=True),
+			"COLOR_0": self.add_accessor(colors, ARRAY_BUFFER, normalized=True),
+			"TEXCOORD_0": self.add_accessor(texcoords, ARRAY_BUFFER) if quantized_uvs is None else self.add_accessor(quantized_uvs, ARRAY_BUFFER, normalized=True),
+		}
+		if normals is not None:
+			normals = np.asarray(normals, dtype=np.float32)
+			if scale is not None:
+				# viewers transform normals by the inverse transpose of the node scale, undo it
+				normals = normalize(normals * scale)
+			attributes["NORMAL"] = self.add_accessor(normals, ARRAY_BUFFER)
+		index_view = self.add_view(indices, ELEMENT_ARRAY_BUFFER)
+		primitives = []
+		for texture, start, end in ranges:
+			accessor = self.append("accessors", {
+				"bufferView": index_view,
+				"byteOffset": start * indices.itemsize,
+				"componentType": COMPONENT_TYPES[indices.dtype],
+				"count": end - start,
+				"type": "SCALAR",
+			})
+			primitives.append({"attributes": attributes, "indices": accessor, "material": self.material(texture)})
+		node = {"name": name, "mesh": self.append("meshes", {"name": name, "primitives": primitives})}
+		if translation is not None:
+			node["translation"] = [float(v) for v in translation]
+		if scale is not None:
+			node["scale"] = scale.tolist()
+		if lods:
+			node["extensions"] = {"MSFT_lod": {"ids": lods}}
+			self.use_extension("MSFT_lod")
+		index = self.append("nodes", node)
+		if not root:
+			self.hidden.add(index)
+		return index
+
+	def finish(self, nodes: int = None):
+		"""pads the binary chunk, every node is a root of the scene"""
+		self.length += -self.length % 4
+		self.document["buffers"][0]["byteLength"] = self.length
+		roots = [i for i in range(len(self.document["nodes"]) if nodes is None else nodes) if i not in self.hidden]
+		if roots:
+			self.document["scenes"][0]["nodes"] = roots
+
+	def json_document(self, exclude=()):
+		"""document entries to write, glTF allows neither empty top-level arrays nor empty buffers"""
+		document = {key: value for key, value in self.document.items() if key not in exclude and value != []}
+		if self.length == 0:
+			del document["buffers"]
+		return document
 
-		pass
+	def header(self, document_length: int):
+		"""GLB header and JSON chunk header for a JSON chunk padded to 4 bytes, the BIN chunk is left out when empty"""
+		total = 12 + 8 + document_length + (8 + self.length if self.length else 0)
+		return pack("<4sII", b"glTF", 2, total) + pack("<I4s", document_length, b"JSON")
 
-def export(frd: FRD, filename: str):
+	def bin_header(self):
+		return pack("<I4s", self.length, b"BIN\0") if self.length else b""
 
-	for i in range(frd.nBlocks):
+	def write(self, filename: str):
+		self.finish()
+		document = json.dumps(self.json_document(), separators=(",", ":")).encode("utf8")
+		document += b" " * (-len(document) % 4)
+		with open(filename, "wb") as f:
+			f.write(self.header(len(document)) + document + self.bin_header())
+			written = 0
+			for array in self.arrays:
+				f.write(memoryview(array).cast("B"))
+				written += array.nbytes
+			f.write(bytes(self.length - written))
 
-		track = frd.trk[i]
-		polyblock = frd.poly[i]
-		mesh = polyblock.poly[4]
-		transparent = polyblock.poly[5]
-		lanes = polyblock.poly[6]
+class StreamingGLBBuilder(GLBBuilder):
+	"""
+	Appends buffer data and JSON array entries to temporary files as they
+	are added, so memory use does not grow with the track. write() assembles
+	the GLB from them, the JSON chunk has to come first.
+	"""
 
+	STREAMED = ["nodes", "meshes", "accessors", "bufferViews"]
+
+	def __init__(self, directory=None, quantize=False):
+		super().__init__(quantize)
+		self.binary = tempfile.TemporaryFile(dir=directory)
+		self.entries = {key: tempfile.TemporaryFile(dir=directory) for key in self.STREAMED}
+		self.counts = {key: 0 for key in self.STREAMED}
+
+	def store(self, array: np.ndarray):
+		self.binary.write(memoryview(array).cast("B"))
+
+	def append(self, key: str, item: dict):
+		if key not in self.entries:
+			return super().append(key, item)
+		f = self.entries[key]
+		if self.counts[key]:
+			f.write(b",")
+		f.write(json.dumps(item, separators=(",", ":")).encode("utf8"))
+		self.counts[key] += 1
+		return self.counts[key] - 1
+
+	def finish(self):
+		self.binary.write(bytes(-self.length % 4))
+		super().finish(self.counts["nodes"])
+
+	def write(self, filename: str):
+		self.finish()
+		head = json.dumps(self.json_document(exclude=self.entries), separators=(",", ":")).encode("utf8")[:-1]
+		parts = []
+		for key, f in self.entries.items():
+			if not self.counts[key]:
+				continue
+			parts.append(f',"{key}":['.encode("utf8"))
+			parts.append(f)
+			parts.append(b"]")
+		parts.append(b"}")
+		length = len(head) + sum(p.tell() if not isinstance(p, bytes) else len(p) for p in parts)
+		padding = b" " * (-length % 4)
+
+		with open(filename, "wb") as out:
+			out.write(self.header(length + len(padding)) + head)
+			for part in parts:
+				if isinstance(part, bytes):
+					out.write(part)
+				else:
+					part.seek(0)
+					shutil.copyfileobj(part, out)
+			out.write(padding + self.bin_header())
+			self.binary.seek(0)
+			shutil.copyfileobj(self.binary, out)
+
+		self.binary.close()
+		for f in self.entries.values():
+			f.close()
+
+def add_vertex_ops(builder: GLBBuilder, name: str, mesh: VertexOps, polygon_type: PolygonType, uvs, vertex_buffer, shading_buffer, origin, normals=False, **node):
+	"""vertices are exported relative to origin, which becomes the node translation"""
+	if len(mesh.polyArray) == 0:
+		return
+	positions, colors, texcoords, indices, ranges, normals = mesh_buffers(
+		mesh, vertex_buffer, shading_buffer, uvs,
+		# the importers show every polygon type except extra objects with reversed winding
+		flipped=winding(polygon_type) < 0,
+		normals=normals,
+	)
+	return builder.add_mesh(name, to_gltf_axes(positions - origin), colors, texcoords, indices, ranges, to_gltf_axes(origin), normals=None if normals is None else to_gltf_axes(normals), **node)
+
+def export_gltf(frd: FRD | FRDStream, filename: str, blocks=None, stream=False, lods=False, quantize=False, normals=False):
+	"""
+	Binary glTF with a node per track chunk, polygon object and extra object,
+	positioned at the block centre or object reference point.
+	blocks limits the export to a working set of track blocks.
+	stream writes every block's data out as it is converted, with an
+	FRDStream memory use then stays flat however long the track is.
+	lods adds the med and lo resolution chunks as MSFT_lod levels of each
+	block's hires node.
+	quantize writes int16 positions and uint16 UVs, see GLBBuilder.
+	normals adds smooth vertex normals.
+	"""
+	if stream:
+		builder = StreamingGLBBuilder(os.path.dirname(os.path.abspath(filename)), quantize)
+	else:
+		builder = GLBBuilder(quantize)
+	uvs = {polygon_type: uv_table(frd, polygon_type) for polygon_type in PolygonType}
+
+	for i, track, polyblock in frd.iter_track_blocks(blocks):
 		vertex_buffer = track.vertices_to_buffer()
 		shading_buffer = track.shading_to_buffer()
-		triangle_buffer = mesh.polygons_to_quad_buffer()
+		centre = np.array([track.ptCentre.x, track.ptCentre.y, track.ptCentre.z], dtype=np.float32)
+
+		levels = []
+		if lods and len(polyblock.poly[4].polyArray):
+			for level in ("med", "lo"):
+				node = add_vertex_ops(builder, f"track_{i:04}_{level}", lod_polygons(polyblock, level)[0], PolygonType.TRACK, uvs[PolygonType.TRACK], vertex_buffer, shading_buffer, centre, normals, root=False)
+				if node is not None:
+					levels.append(node)
+
+		for chunk, name, polygon_type in EXPORT_CHUNKS:
+			add_vertex_ops(builder, f"track_{i:04}_{name}", polyblock.poly[chunk], polygon_type, uvs[polygon_type], vertex_buffer, shading_buffer, centre, normals, lods=levels if chunk == 4 else None)
+
+		index = 0
+		for objPolyBlock in polyblock.obj:
+			for polyObjData in objPolyBlock.obj:
+				if polyObjData.type == 1:
+					add_vertex_ops(builder, f"track_{i:04}_poly_{index:02}", polyObjData, PolygonType.OBJECT, uvs[PolygonType.OBJECT], vertex_buffer, shading_buffer, centre, normals)
+					index += 1
 
-		verts, polys, texture = mesh.to_mesh(vertex_buffer)
-		shading = mesh.to_shading(shading_buffer)
+	for i, xobjBlock in frd.iter_xobj_blocks(blocks):
+		for j, xobjData in enumerate(xobjBlock.obj):
+			loc = xobjData.get_position()
+			# extra object vertices are already relative to their reference point
+			mesh = mesh_buffers(xobjData, xobjData.vertices_to_buffer(), xobjData.shading_to_buffer(), uvs[PolygonType.EXTRAOBJECT], flipped=winding(PolygonType.EXTRAOBJECT) < 0, normals=normals)
+			builder.add_mesh(
+				f"xobj_{i:04}_{j:02}_{xobjData.type}", to_gltf_axes(mesh[0]), *mesh[1:5], to_gltf_axes([loc.x, loc.y, loc.z]),
+				normals=None if mesh[5] is None else to_gltf_axes(mesh[5]),
+			)
 
-		pass
+	builder.write(filename)
 
-		
+def export(frd: FRD | FRDStream, filename: str, blocks=None, lods=False, quantize=False, normals=False):
+	"""
+	streaming export_gltf, takes an FRDStream to convert one block at a time with flat memory use,
+	blocks limits the export to a working set, e.g. frd.neighbors.within_hops(focus, hops)
+	"""
+	export_gltf(frd, filename, blocks, stream=True, lods=lods, quantize=quantize, normals=normals)
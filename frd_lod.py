@@ -0,0 +1,42 @@
+'''Levels of detail from the lo and med resolution polygon chunks'''
+
+from dataclasses import dataclass
+import numpy as np
+from frd import FRD, FRDStream, TrackBlock
+from polygonblock import PolygonBlock, VertexOps
+
+# opaque and transparent polygon chunk of every level
+LOD_CHUNKS = {"lo": (0, 1), "med": (2, 3), "hi": (4, 5)}
+
+def lod_polygons(polyblock: PolygonBlock, level: str):
+	"""the level's opaque polygons followed by its transparent ones"""
+	opaque, transparent = (polyblock.poly[chunk].polyArray for chunk in LOD_CHUNKS[level])
+	return VertexOps.from_array(np.concatenate((opaque, transparent))), len(opaque)
+
+@dataclass
+class LevelOfDetail:
+	"""
+	One level of a track block with its own compacted vertex buffer.
+	polygons index vertices and shading, transparent marks the polygons
+	that came from the level's transparent chunk.
+	"""
+	level: str
+	block: int
+	vertices: np.ndarray
+	shading: np.ndarray
+	polygons: np.ndarray
+	textures: np.ndarray
+	flags: np.ndarray
+	transparent: np.ndarray
+
+	@staticmethod
+	def build(track: TrackBlock, polyblock: PolygonBlock, level: str, block=-1):
+		mesh, nOpaque = lod_polygons(polyblock, level)
+		vertices, polygons, textures, shading = mesh.to_mesh(track.vertices_to_buffer(), shading_buffer=track.shading_to_buffer())
+		transparent = np.arange(len(polygons)) >= nOpaque
+		return LevelOfDetail(level, block, vertices, shading, polygons, mesh.texture_ids(), mesh.polyArray["flags"], transparent)
+
+def extract_lods(frd: FRD | FRDStream, levels=("med", "lo"), blocks=None):
+	"""(block, {level: LevelOfDetail}) of every track block, blocks limits them to a working set"""
+	for i, track, polyblock in frd.iter_track_blocks(blocks):
+		yield i, {level: LevelOfDetail.build(track, polyblock, level, i) for level in levels}
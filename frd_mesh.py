@@ -0,0 +1,137 @@
+'''Track-wide meshes built across block boundaries'''
+
+from dataclasses import dataclass
+import numpy as np
+from basic import PolygonData
+from frd import FRD
+from polygonblock import TRIANGLE_CORNERS
+
+# polygon chunks merged into track-wide index arrays
+POOL_CHUNKS = {"hires": 4, "transparent": 5, "lanes": 6}
+
+# neighbor cell offsets covering every pair of adjacent cells once, the zero offset included
+HALF_NEIGHBORHOOD = [
+	(dx, dy, dz)
+	for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+	if (dx, dy, dz) >= (0, 0, 0)
+]
+
+def expand_ranges(start: np.ndarray, counts: np.ndarray):
+	"""concatenation of arange(start[i], start[i] + counts[i])"""
+	return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+
+def weld(vertices: np.ndarray, tolerance: float):
+	"""
+	Groups vertices closer than tolerance to another vertex of the group.
+	Candidate pairs come from a hash grid of tolerance sized cells, groups
+	from label propagation over the pairs.
+	Returns (kept, remap): the lowest original index of every group, and the
+	group of every vertex.
+	"""
+	n = len(vertices)
+	if n == 0 or tolerance <= 0:
+		kept, remap = np.unique(vertices, axis=0, return_index=True, return_inverse=True)[1:]
+		order = np.argsort(kept)
+		return kept[order], np.argsort(order)[remap.ravel()]
+
+	cells = np.floor(vertices / tolerance).astype(np.int64)
+	# one empty cell of padding on every side keeps neighbor keys in range
+	cells -= cells.min(axis=0) - 1
+	dims = cells.max(axis=0) + 2
+	keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+	order = np.argsort(keys, kind="stable")
+	sortedKeys = keys[order]
+
+	first, second = [], []
+	for dx, dy, dz in HALF_NEIGHBORHOOD:
+		neighbor = keys + (dx * dims[1] + dy) * dims[2] + dz
+		start = np.searchsorted(sortedKeys, neighbor, "left")
+		counts = np.searchsorted(sortedKeys, neighbor, "right") - start
+		i = np.repeat(np.arange(n), counts)
+		j = order[expand_ranges(start, counts)]
+		if (dx, dy, dz) == (0, 0, 0):
+			i, j = i[i < j], j[i < j]
+		offset = vertices[i] - vertices[j]
+		close = np.einsum("ij,ij->i", offset, offset) <= tolerance * tolerance
+		first.append(i[close])
+		second.append(j[close])
+	first, second = np.concatenate(first), np.concatenate(second)
+
+	label = np.arange(n)
+	while True:
+		pair = np.minimum(label[first], label[second])
+		updated = label.copy()
+		np.minimum.at(updated, first, pair)
+		np.minimum.at(updated, second, pair)
+		updated = updated[updated]
+		if np.array_equal(updated, label):
+			break
+		label = updated
+
+	kept, remap = np.unique(label, return_inverse=True)
+	return kept, remap
+
+@dataclass
+class VertexPool:
+	"""
+	All track block vertices in one welded buffer.
+	blockOffsets index the unwelded concatenation of block vertex tables,
+	remap takes those global indices to pool indices. quads, textures and
+	flags hold the merged polygons of each POOL_CHUNKS entry, polygonBlocks
+	the track block each polygon came from.
+	"""
+	vertices: np.ndarray
+	shading: np.ndarray
+	blockOffsets: np.ndarray
+	remap: np.ndarray
+	quads: dict[str, np.ndarray]
+	textures: dict[str, np.ndarray]
+	flags: dict[str, np.ndarray]
+	polygonBlocks: dict[str, np.ndarray]
+
+	@staticmethod
+	def build(frd: FRD, tolerance=1e-3, blocks=None, chunks: dict[str, int] = POOL_CHUNKS):
+		"""blocks limits the pool to a working set of track blocks"""
+		vertices, shading = [], []
+		polygons = {name: [] for name in chunks}
+		offset = 0
+		for i, track, polyblock in frd.iter_track_blocks(blocks):
+			block_vertices = track.vertices_to_buffer()
+			vertices.append(block_vertices)
+			shading.append(track.shading_to_buffer())
+			for name, chunk in chunks.items():
+				polygons[name].append((i, offset, polyblock.poly[chunk].polyArray))
+			offset += len(block_vertices)
+
+		blockOffsets = np.concatenate(([0], np.cumsum([len(v) for v in vertices]))).astype(np.int64)
+		vertices = np.concatenate(vertices) if vertices else np.zeros((0, 3), dtype=np.float32)
+		shading = np.concatenate(shading) if shading else np.zeros((0, 4), dtype=np.uint8)
+		kept, remap = weld(vertices, tolerance)
+
+		quads, textures, flags, polygonBlocks = {}, {}, {}, {}
+		for name, parts in polygons.items():
+			arrays = [array for i, start, array in parts]
+			merged = np.concatenate(arrays) if arrays else np.zeros(0, dtype=PolygonData.dtype)
+			starts = np.repeat([start for i, start, array in parts], [len(a) for a in arrays]).astype(np.int64)
+			quads[name] = remap[merged["vertex"].astype(np.int64) + starts[:, None]].astype(np.uint32)
+			textures[name] = merged["texture"].astype(np.int32)
+			flags[name] = merged["flags"]
+			polygonBlocks[name] = np.repeat([i for i, start, array in parts], [len(a) for a in arrays]).astype(np.int32)
+
+		return VertexPool(vertices[kept], shading[kept], blockOffsets, remap.astype(np.uint32), quads, textures, flags, polygonBlocks)
+
+	def triangles(self, name: str, doublesided=True):
+		"""
+		(n, 3) pool indices of the chunk's triangles, split like VertexOps.triangulate.
+		Triangles collapsed by welding are dropped. Also returns the source polygon of each triangle.
+		"""
+		quads = self.quads[name]
+		triangles = quads[:, TRIANGLE_CORNERS.ravel()].reshape(-1, 3)
+		source = np.repeat(np.arange(len(quads)), 2)
+		if doublesided:
+			back = np.flatnonzero(self.flags[name] & 0x10)
+			reverse = quads[back][:, TRIANGLE_CORNERS[:, ::-1].ravel()].reshape(-1, 3)
+			triangles = np.concatenate((triangles, reverse))
+			source = np.concatenate((source, np.repeat(back, 2)))
+		valid = (triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) & (triangles[:, 2] != triangles[:, 0])
+		return triangles[valid], source[valid]
@@ -0,0 +1,107 @@
+'''
+Quantized vertex encoding for compact exports and caches.
+
+Positions are stored as int16 offsets from an origin, usually the block's
+ptCentre, with a per-axis scale fitted to the block's extent, so the error
+is at most half a step of 1/32767 of the extent. UVs inside [0, 1] become
+normalized uint16, shading colors already are uint8.
+'''
+
+from dataclasses import dataclass
+import numpy as np
+from frd import FRD, FRDStream
+
+POSITION_RANGE = 32767
+UV_RANGE = 65535
+
+def quantize_positions(positions: np.ndarray, origin=0.0):
+	"""(int16 offsets, per-axis float32 scale) with positions ~ offsets * scale + origin"""
+	offsets = np.asarray(positions, dtype=np.float64) - np.asarray(origin, dtype=np.float64)
+	extent = np.abs(offsets).max(axis=0) if len(offsets) else np.zeros(3)
+	scale = np.where(extent > 0, extent / POSITION_RANGE, 1.0).astype(np.float32)
+	quantized = np.clip(np.rint(offsets / scale), -POSITION_RANGE, POSITION_RANGE).astype(np.int16)
+	return quantized, scale
+
+def dequantize_positions(quantized: np.ndarray, scale: np.ndarray, origin=0.0):
+	return (quantized * np.asarray(scale, dtype=np.float32) + np.asarray(origin, dtype=np.float32)).astype(np.float32)
+
+def quantize_uvs(uvs: np.ndarray):
+	"""normalized uint16 UVs, None when some lie outside [0, 1] and need floats"""
+	uvs = np.asarray(uvs)
+	if len(uvs) and (uvs.min() < 0 or uvs.max() > 1):
+		return None
+	return np.rint(uvs * UV_RANGE).astype(np.uint16)
+
+def dequantize_uvs(quantized: np.ndarray):
+	return quantized.astype(np.float32) / UV_RANGE
+
+@dataclass
+class QuantizedTrack:
+	"""
+	Track block vertices as int16 offsets from each block's ptCentre.
+	Block i of blocks owns rows blockOffsets[i]:blockOffsets[i+1] of positions
+	and shading. maxError is the largest coordinate error of the encoding.
+	"""
+	blocks: np.ndarray
+	centres: np.ndarray
+	scales: np.ndarray
+	blockOffsets: np.ndarray
+	positions: np.ndarray
+	shading: np.ndarray
+	maxError: float = 0.0
+
+	@staticmethod
+	def build(frd: FRD | FRDStream, blocks=None):
+		ids, centres, scales, positions, shading = [], [], [], [], []
+		maxError = 0.0
+		for i, track, polyblock in frd.iter_track_blocks(blocks):
+			vertices = track.vertices_to_buffer()
+			centre = np.array([track.ptCentre.x, track.ptCentre.y, track.ptCentre.z], dtype=np.float32)
+			quantized, scale = quantize_positions(vertices, centre)
+			if len(vertices):
+				maxError = max(maxError, float(np.abs(dequantize_positions(quantized, scale, centre) - vertices).max()))
+			ids.append(i)
+			centres.append(centre)
+			scales.append(scale)
+			positions.append(quantized)
+			shading.append(track.shading_to_buffer())
+
+		blockOffsets = np.concatenate(([0], np.cumsum([len(p) for p in positions]))).astype(np.int64)
+		return QuantizedTrack(
+			np.array(ids, dtype=np.int32),
+			np.array(centres, dtype=np.float32).reshape(-1, 3),
+			np.array(scales, dtype=np.float32).reshape(-1, 3),
+			blockOffsets,
+			np.concatenate(positions) if positions else np.zeros((0, 3), dtype=np.int16),
+			np.concatenate(shading) if shading else np.zeros((0, 4), dtype=np.uint8),
+			maxError,
+		)
+
+	def decode(self):
+		"""float32 positions of every block at once"""
+		counts = np.diff(self.blockOffsets)
+		return dequantize_positions(self.positions, np.repeat(self.scales, counts, axis=0), np.repeat(self.centres, counts, axis=0))
+
+	def block(self, i: int):
+		"""decoded positions of the i-th stored block (not the track block id)"""
+		start, end = self.blockOffsets[i], self.blockOffsets[i + 1]
+		return dequantize_positions(self.positions[start:end], self.scales[i], self.centres[i])
+
+	def to_arrays(self):
+		"""arrays for FRDCache.store"""
+		return {
+			"blocks": self.blocks,
+			"centres": self.centres,
+			"scales": self.scales,
+			"blockOffsets": self.blockOffsets,
+			"positions": self.positions,
+			"shading": self.shading,
+			"maxError": np.float64(self.maxError),
+		}
+
+	@staticmethod
+	def from_arrays(arrays: dict[str, np.ndarray]):
+		return QuantizedTrack(
+			arrays["blocks"], arrays["centres"], arrays["scales"], arrays["blockOffsets"],
+			arrays["positions"], arrays["shading"], float(arrays["maxError"]),
+		)
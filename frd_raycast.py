@@ -0,0 +1,306 @@
+'''
+Batched ray casting against track, polygon object and extra object triangles.
+
+Triangles are sorted along a Morton curve of their centroids and grouped into
+leaves of LEAF_SIZE. The BVH over them is an implicit complete binary tree
+(children of node k are 2k+1 and 2k+2), so it is built level by level with
+array reductions and can be stored in the FRD cache as a handful of arrays.
+All rays of a batch traverse it together, one node per ray and step, nearest
+child first, and test leaf triangles with Möller–Trumbore.
+'''
+
+import mmap
+from dataclasses import dataclass
+import numpy as np
+from frd import FRD, FRDStream, PARSER_VERSION
+from frd_cache import FRDCache
+from polygonblock import VertexOps
+
+HIT_TRACK = 0
+HIT_POLYOBJ = 1
+HIT_XOBJ = 2
+
+# block is the track block, -1 for the global extra objects. group is the
+# polygon chunk of track triangles, the object block of polygon objects and the
+# xobj block of extra objects, object is the index inside that group (-1 for track)
+TRIANGLE_DTYPE = np.dtype([
+	("kind", "u1"),
+	("block", "<i4"),
+	("group", "<i4"),
+	("object", "<i4"),
+	("polygon", "<i4"),
+	("texture", "<i4"),
+])
+
+# high resolution road and its transparent polygons
+RAY_CHUNKS = (4, 5)
+LEAF_SIZE = 4
+# bump whenever the cached BVH arrays change meaning
+BVH_VERSION = 1
+
+@dataclass
+class RayHits:
+	"""One row per ray, distance is inf and the ids -1 where nothing was hit"""
+	distance: np.ndarray
+	triangle: np.ndarray # row of RayCaster.sources
+	kind: np.ndarray
+	block: np.ndarray
+	group: np.ndarray
+	object: np.ndarray
+	polygon: np.ndarray
+	texture: np.ndarray
+
+def spread_bits(values: np.ndarray):
+	"""21 bit integers with two zero bits inserted after every bit"""
+	v = values.astype(np.uint64) & np.uint64(0x1FFFFF)
+	for shift, mask in ((32, 0x1F00000000FFFF), (16, 0x1F0000FF0000FF), (8, 0x100F00F00F00F00F), (4, 0x10C30C30C30C30C3), (2, 0x1249249249249249)):
+		v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+	return v
+
+def morton_codes(points: np.ndarray):
+	"""63 bit Morton codes on a cubic grid over the points' bounding box"""
+	lo = points.min(axis=0)
+	extent = float((points.max(axis=0) - lo).max()) or 1.0
+	cells = (points - lo) / extent * (2**21 - 1)
+	return (spread_bits(cells[:, 0]) << np.uint64(2)) | (spread_bits(cells[:, 1]) << np.uint64(1)) | spread_bits(cells[:, 2])
+
+def add_mesh_triangles(parts: list, mesh: VertexOps, vertex_buffer: np.ndarray, kind: int, block: int, group: int, object: int):
+	if len(mesh.polyArray) == 0:
+		return
+	triangles, source, corners = mesh.triangulate(doublesided=False)
+	sources = np.zeros(len(triangles), dtype=TRIANGLE_DTYPE)
+	sources["kind"] = kind
+	sources["block"] = block
+	sources["group"] = group
+	sources["object"] = object
+	sources["polygon"] = source
+	sources["texture"] = mesh.polyArray["texture"][source]
+	parts.append((vertex_buffer[triangles], sources))
+
+def collect_triangles(frd: FRD | FRDStream, chunks=RAY_CHUNKS, blocks=None):
+	"""(n, 3, 3) corners and TRIANGLE_DTYPE sources of every ray cast triangle"""
+	parts = []
+	for i, track, polyblock in frd.iter_track_blocks(blocks):
+		vertex_buffer = track.vertices_to_buffer()
+		for chunk in chunks:
+			add_mesh_triangles(parts, polyblock.poly[chunk], vertex_buffer, HIT_TRACK, i, chunk, -1)
+		for k, objPolyBlock in enumerate(polyblock.obj):
+			for j, polyObjData in enumerate(objPolyBlock.obj):
+				if polyObjData.type == 1:
+					add_mesh_triangles(parts, polyObjData, vertex_buffer, HIT_POLYOBJ, i, k, j)
+
+	nBlocks = frd.nBlocks + 1
+	for i, xobjBlock in frd.iter_xobj_blocks(blocks):
+		for j, xobjData in enumerate(xobjBlock.obj):
+			loc = xobjData.get_position()
+			# extra object vertices are relative to their reference point
+			vertex_buffer = xobjData.vertices_to_buffer() + np.array([loc.x, loc.y, loc.z], dtype=np.float32)
+			add_mesh_triangles(parts, xobjData, vertex_buffer, HIT_XOBJ, i // 4 if i < 4 * nBlocks else -1, i, j)
+
+	if not parts:
+		return np.zeros((0, 3, 3), dtype=np.float32), np.zeros(0, dtype=TRIANGLE_DTYPE)
+	return np.concatenate([c for c, s in parts]).astype(np.float32), np.concatenate([s for c, s in parts])
+
+class RayCaster:
+	"""
+	BVH over triangles stored in leaf order: leaf j holds triangles
+	j * leafSize up to (j + 1) * leafSize. Node boxes are nodeMin/nodeMax in
+	heap order, the leaves are the last 2**depth nodes, padding leaves have
+	empty (inverted) boxes.
+	"""
+
+	def __init__(self, corners: np.ndarray, sources: np.ndarray, nodeMin: np.ndarray, nodeMax: np.ndarray, leafSize=LEAF_SIZE):
+		self.sources = sources
+		self.nodeMin = nodeMin
+		self.nodeMax = nodeMax
+		self.leafSize = leafSize
+		self.depth = int(np.log2(len(nodeMin) + 1)) - 1
+		self.corners = corners
+		# traversal works in float64 like the rays, converted once here instead of per gather
+		self.boxMin = nodeMin.astype(np.float64)
+		self.boxMax = nodeMax.astype(np.float64)
+		self.empty = nodeMin[:, 0] > nodeMax[:, 0]
+		self.v0 = corners[:, 0].astype(np.float64)
+		self.e1 = corners[:, 1] - self.v0
+		self.e2 = corners[:, 2] - self.v0
+
+	@staticmethod
+	def from_triangles(corners: np.ndarray, sources: np.ndarray, leafSize=LEAF_SIZE):
+		order = np.argsort(morton_codes(corners.mean(axis=1)), kind="stable") if len(corners) else np.zeros(0, dtype=np.int64)
+		corners, sources = corners[order], sources[order]
+
+		nLeaves = max(1, -(-len(corners) // leafSize))
+		depth = int(np.ceil(np.log2(nLeaves)))
+		leafMin = np.full((2**depth, 3), np.inf, dtype=np.float32)
+		leafMax = np.full((2**depth, 3), -np.inf, dtype=np.float32)
+		if len(corners):
+			starts = np.arange(0, len(corners), leafSize)
+			leafMin[:len(starts)] = np.minimum.reduceat(corners.min(axis=1), starts)
+			leafMax[:len(starts)] = np.maximum.reduceat(corners.max(axis=1), starts)
+
+		levelsMin, levelsMax = [leafMin], [leafMax]
+		for level in range(depth):
+			below, above = levelsMin[0], levelsMax[0]
+			levelsMin.insert(0, np.minimum(below[0::2], below[1::2]))
+			levelsMax.insert(0, np.maximum(above[0::2], above[1::2]))
+		return RayCaster(corners, sources, np.concatenate(levelsMin), np.concatenate(levelsMax), leafSize)
+
+	@staticmethod
+	def build(frd: FRD | FRDStream, chunks=RAY_CHUNKS, blocks=None, leafSize=LEAF_SIZE):
+		return RayCaster.from_triangles(*collect_triangles(frd, chunks, blocks), leafSize)
+
+	@staticmethod
+	def open(filename: str, cache: FRDCache = None):
+		"""BVH of the whole track, loaded from the cache when the file was seen before"""
+		with open(filename, "rb") as f:
+			buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		if cache is None:
+			return RayCaster.build(FRD(buffer, lazy=True, columnar=True))
+		key = f"{cache.key(buffer, PARSER_VERSION)}-bvh{BVH_VERSION}"
+		arrays = cache.load(key)
+		if arrays is not None:
+			return RayCaster.from_arrays(arrays)
+		caster = RayCaster.build(FRD(buffer, lazy=True, columnar=True))
+		cache.store(key, caster.to_arrays())
+		return caster
+
+	def to_arrays(self):
+		return {
+			"corners": self.corners,
+			"sources": self.sources,
+			"nodeMin": self.nodeMin,
+			"nodeMax": self.nodeMax,
+			"leafSize": np.int64(self.leafSize),
+		}
+
+	@staticmethod
+	def from_arrays(arrays: dict[str, np.ndarray]):
+		return RayCaster(arrays["corners"], arrays["sources"], arrays["nodeMin"], arrays["nodeMax"], int(arrays["leafSize"]))
+
+	def box_entry(self, origins, inverse, tmax, ray, node):
+		"""entry distance of each (ray, node) pair, NaN where the ray misses the box within tmax"""
+		lo = (self.boxMin[node] - origins[ray]) * inverse[ray]
+		hi = (self.boxMax[node] - origins[ray]) * inverse[ray]
+		near = np.minimum(lo, hi)
+		far = np.maximum(lo, hi)
+		near = np.maximum(np.maximum(near[:, 0], near[:, 1]), np.maximum(near[:, 2], 0))
+		far = np.minimum(np.minimum(far[:, 0], far[:, 1]), np.minimum(far[:, 2], tmax[ray]))
+		return np.where((near <= far) & ~self.empty[node], near, np.nan)
+
+	def intersect(self, origins, directions, ray, triangle, tmin):
+		"""Möller–Trumbore distance of every (ray, triangle) pair, NaN on a miss"""
+		d = directions[ray]
+		e1, e2 = self.e1[triangle], self.e2[triangle]
+		p = np.cross(d, e2)
+		det = np.einsum("ij,ij->i", e1, p)
+		parallel = np.abs(det) < 1e-12
+		inverse = 1.0 / np.where(parallel, 1.0, det)
+		s = origins[ray] - self.v0[triangle]
+		u = np.einsum("ij,ij->i", s, p) * inverse
+		q = np.cross(s, e1)
+		v = np.einsum("ij,ij->i", d, q) * inverse
+		t = np.einsum("ij,ij->i", e2, q) * inverse
+		hit = ~parallel & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > tmin)
+		return np.where(hit, t, np.nan)
+
+	def trace(self, origins, directions, tmax, tmin, anyHit):
+		"""
+		nearest (or with anyHit, some) hit distance and triangle of every ray.
+		Every ray keeps a stack of nodes with their entry distances, each step
+		pops one node per ray, pushes hit children nearest on top and tests leaves.
+		"""
+		n = len(origins)
+		best = tmax.copy()
+		triangle = np.full(n, -1, dtype=np.int64)
+		if len(self.corners) == 0 or n == 0:
+			return best, triangle
+		firstLeaf = 2**self.depth - 1
+		offsets = np.arange(self.leafSize)
+		stack = np.empty((n, self.depth + 2), dtype=np.int64)
+		stackEntry = np.empty((n, self.depth + 2), dtype=np.float64)
+		with np.errstate(invalid="ignore"):
+			# axis parallel rays get a huge finite slope, keeping inf * 0 NaNs out of the slab test
+			inverse = 1.0 / np.where(directions == 0, 1e-30, directions)
+			ray = np.arange(n)
+			entry = self.box_entry(origins, inverse, best, ray, np.zeros(n, dtype=np.int64))
+			stack[:, 0] = 0
+			stackEntry[:, 0] = entry
+			top = np.where(np.isnan(entry), 0, 1)
+
+			while True:
+				ray = np.flatnonzero(top)
+				if len(ray) == 0:
+					break
+				top[ray] -= 1
+				node = stack[ray, top[ray]]
+				# nodes entered beyond the nearest hit so far cannot hold a nearer one
+				keep = stackEntry[ray, top[ray]] <= best[ray]
+				ray, node = ray[keep], node[keep]
+
+				leaf = node >= firstLeaf
+				leafRay = np.repeat(ray[leaf], self.leafSize)
+				leafTriangle = ((node[leaf] - firstLeaf)[:, None] * self.leafSize + offsets).ravel()
+				inside = leafTriangle < len(self.corners)
+				leafRay, leafTriangle = leafRay[inside], leafTriangle[inside]
+				t = self.intersect(origins, directions, leafRay, leafTriangle, tmin)
+				hit = t < best[leafRay]
+				leafRay, leafTriangle, t = leafRay[hit], leafTriangle[hit], t[hit]
+				np.minimum.at(best, leafRay, t)
+				nearest = t == best[leafRay]
+				triangle[leafRay[nearest]] = leafTriangle[nearest]
+				if anyHit:
+					top[leafRay] = 0
+
+				inner, node = ray[~leaf], node[~leaf]
+				if anyHit:
+					running = triangle[inner] < 0
+					inner, node = inner[running], node[running]
+				left = self.box_entry(origins, inverse, best, inner, 2 * node + 1)
+				right = self.box_entry(origins, inverse, best, inner, 2 * node + 2)
+				# push the farther child first so the nearer one is popped next
+				rightFirst = ~(right <= left) | np.isnan(left)
+				first = np.where(rightFirst, 2 * node + 2, 2 * node + 1)
+				firstEntry = np.where(rightFirst, right, left)
+				second = np.where(rightFirst, 2 * node + 1, 2 * node + 2)
+				secondEntry = np.where(rightFirst, left, right)
+				for child, childEntry in ((first, firstEntry), (second, secondEntry)):
+					hit = ~np.isnan(childEntry)
+					pushRay = inner[hit]
+					stack[pushRay, top[pushRay]] = child[hit]
+					stackEntry[pushRay, top[pushRay]] = childEntry[hit]
+					top[pushRay] += 1
+		return best, triangle
+
+	def cast(self, origins, directions, tmax=np.inf, tmin=1e-4, batch=1 << 15):
+		"""
+		Nearest hit of every ray, directions need not be normalized and the
+		distance is in world units. tmax limits each ray's length, tmin skips
+		hits right at the origin, e.g. of rays leaving a surface.
+		"""
+		origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+		directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+		directions = directions / np.linalg.norm(directions, axis=1)[:, None]
+		tmax = np.broadcast_to(np.asarray(tmax, dtype=np.float64), len(origins))
+		distance = np.empty(len(origins), dtype=np.float64)
+		triangle = np.empty(len(origins), dtype=np.int64)
+		for start in range(0, len(origins), batch):
+			end = min(start + batch, len(origins))
+			distance[start:end], triangle[start:end] = self.trace(origins[start:end], directions[start:end], tmax[start:end].copy(), tmin, False)
+
+		missed = triangle < 0
+		sources = self.sources[np.where(missed, 0, triangle)] if len(self.sources) else np.zeros(len(triangle), dtype=TRIANGLE_DTYPE)
+		fields = {name: np.where(missed, -1, sources[name].astype(np.int32)) for name in TRIANGLE_DTYPE.names}
+		distance[missed] = np.inf
+		return RayHits(distance.astype(np.float32), triangle.astype(np.int32), **fields)
+
+	def occluded(self, origins, directions, tmax=np.inf, tmin=1e-4, batch=1 << 15):
+		"""True for rays hitting anything within tmax, stopping at the first hit found"""
+		origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+		directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+		directions = directions / np.linalg.norm(directions, axis=1)[:, None]
+		tmax = np.broadcast_to(np.asarray(tmax, dtype=np.float64), len(origins))
+		hit = np.empty(len(origins), dtype=bool)
+		for start in range(0, len(origins), batch):
+			end = min(start + batch, len(origins))
+			hit[start:end] = self.trace(origins[start:end], directions[start:end], tmax[start:end].copy(), tmin, True)[1] >= 0
+		return hit
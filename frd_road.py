@@ -0,0 +1,200 @@
+'''Road orientation tables and height queries over the high resolution track polygons'''
+
+from dataclasses import dataclass, astuple
+import numpy as np
+from basic import PositionData, PolyVroadData, VroadData
+from frd import FRD, FRDStream, TrackBlock
+from frd_mesh import expand_ranges
+from frd_spatial import UniformGrid
+from normals import normalize
+from polygonblock import TRIANGLE_CORNERS
+
+# VroadData vectors are int16 fractions of this
+VROAD_SCALE = 2**15
+
+# polygon chunks forming the drivable surface: high resolution road and lanes
+SURFACE_CHUNKS = (4, 6)
+
+def record_array(track: TrackBlock, name: str, records: str, dtype: np.dtype):
+	"""the columnar array, or the parsed records packed into one"""
+	if track.columnar:
+		return getattr(track, name)
+	return np.array([astuple(record) for record in getattr(track, records)], dtype=dtype)
+
+def decode_vroad(vroad: np.ndarray):
+	"""unit (n, 3) normal and forward vectors in vertices_to_buffer axis order, zero where unset"""
+	vectors = np.stack([vroad[field] for field in ("xNorm", "yNorm", "zNorm", "xForw", "yForw", "zForw")], axis=1)
+	vectors = vectors.astype(np.float32).reshape(-1, 3) / VROAD_SCALE
+	vectors = normalize(vectors, fallback=(0.0, 0.0, 0.0)).reshape(-1, 2, 3)
+	return vectors[:, 0], vectors[:, 1]
+
+@dataclass
+class RoadAttributes:
+	"""
+	Per-polygon road attributes of one track block, row i belongs to the
+	i-th high resolution polygon (poly[4]). vroadEntry rows past the block's
+	VroadData table have zero normal and forward vectors and valid False.
+	Positions are the block's PositionData ranges as CSR: the polygons of
+	position p are positionPolygons[positionStart[p]:positionStart[p + 1]],
+	startPosition is the track-wide number of the first one.
+	"""
+	block: int
+	normals: np.ndarray
+	forward: np.ndarray
+	vroadEntry: np.ndarray
+	flags: np.ndarray
+	valid: np.ndarray
+	startPosition: int
+	positionStart: np.ndarray
+	positionPolygons: np.ndarray
+
+	@staticmethod
+	def build(track: TrackBlock, block=-1):
+		polyData = record_array(track, "polyDataArray", "polyData", PolyVroadData.dtype)
+		vroad = record_array(track, "vroadArray", "vroadData", VroadData.dtype)
+		positions = record_array(track, "positionArray", "positionData", PositionData.dtype)
+
+		entry = polyData["vroadEntry"].astype(np.int32)
+		valid = entry < len(vroad)
+		normals = np.zeros((len(entry), 3), dtype=np.float32)
+		forward = np.zeros((len(entry), 3), dtype=np.float32)
+		if len(vroad):
+			tableNormals, tableForward = decode_vroad(vroad)
+			normals[valid] = tableNormals[entry[valid]]
+			forward[valid] = tableForward[entry[valid]]
+
+		counts = positions["nPolygons"].astype(np.int64)
+		positionStart = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+		positionPolygons = expand_ranges(positions["polygon"].astype(np.int64), counts)
+		return RoadAttributes(
+			block, normals, forward, entry, polyData["flags"], valid,
+			track.nStartPosition, positionStart, positionPolygons,
+		)
+
+	def polygon_positions(self):
+		"""block-local position of every polygon, -1 for polygons outside every range"""
+		position = np.full(len(self.vroadEntry), -1, dtype=np.int32)
+		owner = np.repeat(np.arange(len(self.positionStart) - 1, dtype=np.int32), np.diff(self.positionStart))
+		inside = (self.positionPolygons >= 0) & (self.positionPolygons < len(position))
+		position[self.positionPolygons[inside]] = owner[inside]
+		return position
+
+def road_attributes(frd: FRD | FRDStream, blocks=None):
+	"""(block, RoadAttributes) of every track block, blocks limits them to a working set"""
+	for i, track, polyblock in frd.iter_track_blocks(blocks):
+		yield i, RoadAttributes.build(track, i)
+
+@dataclass
+class SurfaceSamples:
+	"""
+	One row per sample point. Points off the surface have NaN height,
+	zero normal and -1 block, chunk and polygon.
+	"""
+	height: np.ndarray
+	normal: np.ndarray
+	block: np.ndarray
+	chunk: np.ndarray
+	polygon: np.ndarray # index into the block's polygon chunk
+
+class RoadSurface:
+	"""
+	Height field over the road polygons, answering batches of (x, y) queries.
+	Quads are split into triangles like VertexOps.triangulate and bucketed
+	by their horizontal bounding boxes in a UniformGrid. A query tests the
+	triangles of its cell with barycentric coordinates, all points at once.
+	"""
+
+	def __init__(self, corners: np.ndarray, blocks: np.ndarray, chunks: np.ndarray, polygons: np.ndarray, cellSize: float = None):
+		self.corners = corners # (n, 3, 3) triangle corner positions
+		self.blocks = blocks
+		self.chunks = chunks
+		self.polygons = polygons
+		boxMin, boxMax = corners.min(axis=1), corners.max(axis=1)
+		if cellSize is None:
+			extent = (boxMax - boxMin)[:, :2].max(axis=1)
+			# road triangles are long and thin, half their typical length keeps few candidates per cell
+			cellSize = 0.5 * float(np.median(extent)) if len(extent) and np.median(extent) > 0 else 1.0
+		self.grid = UniformGrid(boxMin, boxMax, cellSize)
+
+		# barycentric coordinates of p are (p - a) @ inverse, with the 2D edge matrix of each triangle
+		a = corners[:, 0].astype(np.float64)
+		edges = corners[:, 1:].astype(np.float64) - a[:, None]
+		det = edges[:, 0, 0] * edges[:, 1, 1] - edges[:, 0, 1] * edges[:, 1, 0]
+		# triangles standing on their edge cannot be hit from above
+		self.flat = det != 0
+		det[~self.flat] = 1.0
+		self.origin = a
+		self.inverse = np.stack((
+			np.stack((edges[:, 1, 1], -edges[:, 0, 1]), axis=1),
+			np.stack((-edges[:, 1, 0], edges[:, 0, 0]), axis=1),
+		), axis=1) / det[:, None, None]
+		self.rise = edges[..., 2]
+		normal = np.cross(edges[:, 0], edges[:, 1])
+		normal[normal[:, 2] < 0] *= -1
+		self.normals = normalize(normal).astype(np.float32)
+
+	@staticmethod
+	def build(frd: FRD | FRDStream, chunks=SURFACE_CHUNKS, blocks=None, cellSize: float = None):
+		corners, blockIds, chunkIds, polygons = [], [], [], []
+		for i, track, polyblock in frd.iter_track_blocks(blocks):
+			vertex_buffer = track.vertices_to_buffer()
+			for chunk in chunks:
+				quads = polyblock.poly[chunk].quad_indices()
+				corners.append(vertex_buffer[quads[:, TRIANGLE_CORNERS.ravel()]].reshape(-1, 3, 3))
+				polygons.append(np.repeat(np.arange(len(quads), dtype=np.int32), 2))
+				blockIds.append(np.full(2 * len(quads), i, dtype=np.int32))
+				chunkIds.append(np.full(2 * len(quads), chunk, dtype=np.int8))
+		if not corners:
+			return RoadSurface(np.zeros((0, 3, 3), dtype=np.float32), *(np.zeros(0, dtype=np.int32) for i in range(3)), cellSize)
+		return RoadSurface(np.concatenate(corners), np.concatenate(blockIds), np.concatenate(chunkIds), np.concatenate(polygons), cellSize)
+
+	def sample(self, points: np.ndarray, below: np.ndarray = None, batch=1 << 16):
+		"""
+		Surface at every (x, y) of points. Where surfaces overlap the highest
+		one is taken, or with below (one z per point) the highest one not above it.
+		batch bounds the number of points whose candidate pairs are held at once.
+		"""
+		points = np.asarray(points, dtype=np.float64)[:, :2]
+		n = len(points)
+		result = SurfaceSamples(
+			np.full(n, np.nan, dtype=np.float32),
+			np.zeros((n, 3), dtype=np.float32),
+			np.full(n, -1, dtype=np.int32),
+			np.full(n, -1, dtype=np.int8),
+			np.full(n, -1, dtype=np.int32),
+		)
+		for start in range(0, n, batch):
+			end = min(start + batch, n)
+			limit = None if below is None else np.asarray(below, dtype=np.float64)[start:end]
+			point, triangle, height = self.hits(points[start:end], limit)
+			# highest hit per point: sort by (point, height), keep each point's last entry
+			order = np.lexsort((height, point))
+			point, triangle, height = point[order], triangle[order], height[order]
+			last = np.flatnonzero(np.append(point[1:] != point[:-1], True)) if len(point) else point
+			point, triangle = point[last] + start, triangle[last]
+			result.height[point] = height[last]
+			result.normal[point] = self.normals[triangle]
+			result.block[point] = self.blocks[triangle]
+			result.chunk[point] = self.chunks[triangle]
+			result.polygon[point] = self.polygons[triangle]
+		return result
+
+	def hits(self, points: np.ndarray, below: np.ndarray = None):
+		"""(point, triangle, height) of every triangle under one of the points"""
+		cells = self.grid.point_cells(points)
+		inside = np.flatnonzero(cells >= 0)
+		start = self.grid.cellStart[cells[inside]]
+		counts = self.grid.cellStart[cells[inside] + 1] - start
+		point = np.repeat(inside, counts)
+		triangle = self.grid.items[expand_ranges(start, counts)]
+
+		offset = points[point] - self.origin[triangle, :2]
+		uv = np.einsum("ni,nij->nj", offset, self.inverse[triangle])
+		# a small tolerance keeps points on shared edges from falling through the seam
+		hit = self.flat[triangle] & (uv[:, 0] >= -1e-6) & (uv[:, 1] >= -1e-6) & (uv.sum(axis=1) <= 1 + 1e-6)
+		point, triangle, uv = point[hit], triangle[hit], uv[hit]
+		height = self.origin[triangle, 2] + np.einsum("nj,nj->n", uv, self.rise[triangle])
+		if below is not None:
+			keep = height <= below[point]
+			point, triangle, height = point[keep], triangle[keep], height[keep]
+		return point, triangle, height
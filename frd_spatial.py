@@ -0,0 +1,195 @@
+'''Spatial index over track blocks and object reference points'''
+
+import mmap
+from dataclasses import dataclass
+import numpy as np
+from frd import FRD, PARSER_VERSION
+from frd_cache import FRDCache
+
+# bump whenever the stored index arrays change meaning
+INDEX_VERSION = 1
+
+OBJECT_XOBJ = 0
+OBJECT_POLYOBJ = 1
+
+# block is -1 for the global animated extra objects, chunk is the xobj block
+# index for extra objects and the object chunk (always 0) for polygon objects,
+# index is the position in that block's object list
+OBJECT_DTYPE = np.dtype([
+	("kind", "u1"),
+	("block", "<i4"),
+	("chunk", "<i4"),
+	("index", "<i4"),
+	("point", "<f4", 3),
+])
+
+@dataclass
+class SpatialResult:
+	blocks: np.ndarray # track block ids
+	objects: np.ndarray # rows of SpatialIndex.objects
+
+def point_tuple(point):
+	return point.x, point.y, point.z
+
+def frustum_planes(matrix: np.ndarray):
+	"""
+	(6, 4) planes of a 4x4 view-projection matrix (column vector convention),
+	a point p is inside when planes[:, :3] @ p + planes[:, 3] >= 0
+	"""
+	m = np.asarray(matrix, dtype=np.float64)
+	planes = np.stack([m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2]])
+	return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+class UniformGrid:
+	"""
+	Horizontal (x, y) grid over axis-aligned boxes.
+	cellStart is a CSR row pointer into items, the box ids overlapping each cell.
+	"""
+
+	def __init__(self, boxMin: np.ndarray, boxMax: np.ndarray, cellSize: float):
+		self.boxMin = boxMin
+		self.boxMax = boxMax
+		self.cellSize = cellSize
+		self.origin = boxMin[:, :2].min(axis=0) if len(boxMin) else np.zeros(2)
+		extent = boxMax[:, :2].max(axis=0) - self.origin if len(boxMax) else np.zeros(2)
+		self.shape = np.maximum(np.ceil(extent / cellSize).astype(np.int64), 1)
+
+		lo, hi = self.cell_range(boxMin, boxMax)
+		span = hi - lo + 1
+		counts = span[:, 0] * span[:, 1]
+		box = np.repeat(np.arange(len(boxMin)), counts)
+		# position of each (box, cell) pair within its box's cell rectangle
+		local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+		cx = lo[box, 0] + local % span[box, 0]
+		cy = lo[box, 1] + local // span[box, 0]
+		cells = cy * self.shape[0] + cx
+
+		order = np.argsort(cells, kind="stable")
+		self.items = box[order]
+		self.cellStart = np.searchsorted(cells[order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+	def cell_range(self, boxMin: np.ndarray, boxMax: np.ndarray):
+		lo = np.floor((boxMin[..., :2] - self.origin) / self.cellSize).astype(np.int64)
+		hi = np.floor((boxMax[..., :2] - self.origin) / self.cellSize).astype(np.int64)
+		return np.clip(lo, 0, self.shape - 1), np.clip(hi, 0, self.shape - 1)
+
+	def point_cells(self, points: np.ndarray):
+		"""cell id of every (x, y) point, -1 outside the grid"""
+		position = (points[..., :2] - self.origin) / self.cellSize
+		inside = np.all((position >= 0) & (position <= self.shape), axis=-1)
+		cell = np.clip(np.floor(position).astype(np.int64), 0, self.shape - 1)
+		return np.where(inside, cell[..., 1] * self.shape[0] + cell[..., 0], -1)
+
+	def candidates(self, queryMin: np.ndarray, queryMax: np.ndarray):
+		"""ids of boxes sharing a cell with the query box"""
+		if np.any(queryMax[:2] < self.origin) or np.any(queryMin[:2] > self.origin + self.shape * self.cellSize):
+			return np.zeros(0, dtype=np.int64)
+		lo, hi = self.cell_range(queryMin, queryMax)
+		x, y = np.meshgrid(np.arange(lo[0], hi[0] + 1), np.arange(lo[1], hi[1] + 1))
+		cells = (y * self.shape[0] + x).ravel()
+		start, end = self.cellStart[cells], self.cellStart[cells + 1]
+		counts = end - start
+		index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+		return np.unique(self.items[index])
+
+class SpatialIndex:
+	"""
+	Block bounding boxes are the union of ptCentre, the ptBounding corners and
+	the block's vertices. Objects are extra objects at XobjData.get_position
+	and polygon objects at their RefPolyObject point.
+	Boxes and points are bucketed in a UniformGrid, queries test the candidates
+	exactly with vectorized comparisons.
+	"""
+
+	def __init__(self, blockMin: np.ndarray, blockMax: np.ndarray, objects: np.ndarray, cellSize: float = None):
+		self.blockMin = blockMin
+		self.blockMax = blockMax
+		self.objects = objects
+		if cellSize is None:
+			extent = (blockMax - blockMin)[:, :2].max(axis=1)
+			cellSize = float(np.median(extent)) if len(extent) and np.median(extent) > 0 else 1.0
+		self.blockGrid = UniformGrid(blockMin, blockMax, cellSize)
+		points = objects["point"]
+		self.objectGrid = UniformGrid(points, points, cellSize)
+
+	@staticmethod
+	def build(frd: FRD, cellSize: float = None):
+		"""lazy FRDs are read through FRD.detached, leaving their blocks unparsed"""
+		frd = frd.detached()
+		nBlocks = frd.nBlocks + 1
+		blockMin = np.empty((nBlocks, 3), dtype=np.float32)
+		blockMax = np.empty((nBlocks, 3), dtype=np.float32)
+		objects = []
+		for i, track in enumerate(frd.trk):
+			points = np.array([point_tuple(p) for p in [track.ptCentre, *track.ptBounding]], dtype=np.float32)
+			vertices = track.vertices_to_buffer()
+			if len(vertices):
+				points = np.concatenate((points, vertices))
+			blockMin[i] = points.min(axis=0)
+			blockMax[i] = points.max(axis=0)
+			for j, ref in enumerate(track.polyobj):
+				if ref.type == 1:
+					objects.append((OBJECT_POLYOBJ, i, 0, j, point_tuple(ref.point)))
+
+		for i, xobj in enumerate(frd.xobj):
+			block = i // 4 if i < 4 * nBlocks else -1
+			for j, obj in enumerate(xobj.obj):
+				objects.append((OBJECT_XOBJ, block, i, j, point_tuple(obj.get_position())))
+
+		return SpatialIndex(blockMin, blockMax, np.array(objects, dtype=OBJECT_DTYPE), cellSize)
+
+	@staticmethod
+	def open(filename: str, cache: FRDCache = None, cellSize: float = None):
+		"""index of the whole track, loaded from the cache when the file was seen before"""
+		with open(filename, "rb") as f:
+			buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		if cache is None:
+			return SpatialIndex.build(FRD(buffer, lazy=True, columnar=True), cellSize)
+		key = f"{cache.key(buffer, PARSER_VERSION)}-spatial{INDEX_VERSION}"
+		arrays = cache.load(key)
+		if arrays is not None:
+			return SpatialIndex.from_arrays(arrays, cellSize)
+		index = SpatialIndex.build(FRD(buffer, lazy=True, columnar=True), cellSize)
+		cache.store(key, index.to_arrays())
+		return index
+
+	def to_arrays(self):
+		return {"blockMin": self.blockMin, "blockMax": self.blockMax, "objects": self.objects}
+
+	@staticmethod
+	def from_arrays(arrays: dict[str, np.ndarray], cellSize: float = None):
+		return SpatialIndex(arrays["blockMin"], arrays["blockMax"], arrays["objects"], cellSize)
+
+	def query_aabb(self, lo, hi):
+		"""blocks whose box overlaps [lo, hi] and objects inside it"""
+		lo, hi = np.asarray(lo, dtype=np.float32), np.asarray(hi, dtype=np.float32)
+		blocks = self.blockGrid.candidates(lo, hi)
+		inside = np.all((self.blockMin[blocks] <= hi) & (self.blockMax[blocks] >= lo), axis=1)
+		objects = self.objectGrid.candidates(lo, hi)
+		points = self.objects["point"][objects]
+		return SpatialResult(blocks[inside], objects[np.all((points >= lo) & (points <= hi), axis=1)])
+
+	def query_radius(self, center, radius: float):
+		"""blocks whose box is within radius of center and objects within radius"""
+		center = np.asarray(center, dtype=np.float32)
+		blocks = self.blockGrid.candidates(center - radius, center + radius)
+		nearest = np.clip(center, self.blockMin[blocks], self.blockMax[blocks])
+		blockDistance = np.einsum("ij,ij->i", nearest - center, nearest - center)
+		objects = self.objectGrid.candidates(center - radius, center + radius)
+		offset = self.objects["point"][objects] - center
+		objectDistance = np.einsum("ij,ij->i", offset, offset)
+		return SpatialResult(blocks[blockDistance <= radius * radius], objects[objectDistance <= radius * radius])
+
+	def query_frustum(self, planes: np.ndarray):
+		"""
+		blocks whose box is not fully outside any plane and objects inside all of them,
+		planes as returned by frustum_planes
+		"""
+		planes = np.asarray(planes, dtype=np.float64)
+		normals, distances = planes[:, :3], planes[:, 3]
+		# box corner furthest along each plane normal
+		positive = np.where(normals[None] >= 0, self.blockMax[:, None], self.blockMin[:, None])
+		blocks = np.all(np.einsum("bpk,pk->bp", positive, normals) + distances >= 0, axis=1)
+		points = self.objects["point"]
+		objects = np.all(points @ normals.T + distances >= 0, axis=1)
+		return SpatialResult(np.flatnonzero(blocks), np.flatnonzero(objects))
@@ -0,0 +1,114 @@
+'''Record counts of FRD files read from the count fields only'''
+
+import os
+import mmap
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from basic import unpack_at
+from polygonblock import PolygonChunk, ObjPolyBlock
+from frd import TrackBlock, XobjData
+
+CHUNK_NAMES = ["lo", "lo_transparent", "med", "med_transparent", "hi", "hi_transparent", "lanes"]
+
+@dataclass
+class FRDStats:
+	filename: str = ""
+	blocks: int = 0
+	vertices: int = 0
+	positions: int = 0
+	vroad: int = 0
+	chunkPolygons: list[int] = field(default_factory=lambda: [0] * 7)
+	objectPolygons: int = 0
+	polyObjects: int = 0
+	xobjRefs: int = 0
+	xobjs: dict[int, int] = field(default_factory=lambda: {3: 0, 4: 0}) # by type
+	xobjVertices: int = 0
+	xobjPolygons: int = 0
+	textures: int = 0
+	soundsrc: int = 0
+	lightsrc: int = 0
+
+	@staticmethod
+	def scan(buffer, filename=""):
+		"""walks the file like BlockOffsets.scan, summing counts on the way"""
+		stats = FRDStats(filename)
+		nBlocks = unpack_at("<l", buffer, 28)[0]
+		stats.blocks = nBlocks + 1
+		offset = 32
+		for i in range(nBlocks+1):
+			offset = stats.track_block(buffer, offset)
+		for i in range(nBlocks+1):
+			offset = stats.polygon_block(buffer, offset)
+		for i in range(4*(nBlocks+1)+1):
+			offset = stats.xobj_block(buffer, offset)
+		stats.textures = unpack_at("<l", buffer, offset)[0]
+		return stats
+
+	@staticmethod
+	def open(filename: str):
+		with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+			return FRDStats.scan(buffer, filename)
+
+	def track_block(self, buffer, offset: int):
+		counts, offset = TrackBlock.counts(buffer, offset)
+		self.vertices += counts.nVertices
+		self.positions += counts.nPositions
+		self.vroad += counts.nVroad
+		self.xobjRefs += counts.nXobj
+		self.soundsrc += counts.nSoundsrc
+		self.lightsrc += counts.nLightsrc
+		return offset
+
+	def polygon_block(self, buffer, offset: int):
+		for chunk in range(7):
+			nPolygons, offset = PolygonChunk.counts(buffer, offset)
+			self.chunkPolygons[chunk] += nPolygons
+		for i in range(4):
+			counts, offset = ObjPolyBlock.counts(buffer, offset)
+			self.objectPolygons += counts.nPolygons
+			self.polyObjects += counts.nPolyObjects
+		return offset
+
+	def xobj_block(self, buffer, offset: int):
+		nobj = unpack_at("<l", buffer, offset)[0]
+		offset += 4
+		for i in range(nobj):
+			counts, offset = XobjData.counts(buffer, offset)
+			self.xobjs[counts.type] += 1
+			self.xobjVertices += counts.nVertices
+			self.xobjPolygons += counts.nPolygons
+		return offset
+
+	def to_dict(self):
+		stats = asdict(self)
+		stats["chunkPolygons"] = dict(zip(CHUNK_NAMES, self.chunkPolygons))
+		stats["xobjs"] = {f"type{type}": count for type, count in self.xobjs.items()}
+		return stats
+
+def find_frd_files(paths: list[str]):
+	"""files as given, directories searched recursively for .frd files"""
+	for path in paths:
+		if os.path.isdir(path):
+			yield from sorted(str(p) for p in Path(path).rglob("*") if p.suffix.lower() == ".frd" and p.is_file())
+		else:
+			yield path
+
+TABLE_COLUMNS = [
+	("blocks", lambda s: s.blocks),
+	("vertices", lambda s: s.vertices),
+	*((name, lambda s, i=i: s.chunkPolygons[i]) for i, name in enumerate(CHUNK_NAMES)),
+	("objects", lambda s: s.objectPolygons),
+	("xobj3", lambda s: s.xobjs[3]),
+	("xobj4", lambda s: s.xobjs[4]),
+	("textures", lambda s: s.textures),
+	("sounds", lambda s: s.soundsrc),
+	("lights", lambda s: s.lightsrc),
+]
+
+def format_table(stats: list[FRDStats]):
+	name_width = max([len("file")] + [len(s.filename) for s in stats])
+	widths = [max(len(name), 8) for name, value in TABLE_COLUMNS]
+	lines = [" ".join([f"{'file':<{name_width}}"] + [f"{name:>{w}}" for (name, value), w in zip(TABLE_COLUMNS, widths)])]
+	for s in stats:
+		lines.append(" ".join([f"{s.filename:<{name_width}}"] + [f"{value(s):>{w}}" for (name, value), w in zip(TABLE_COLUMNS, widths)]))
+	return "\n".join(lines)
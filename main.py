@@ -1,12 +1,13 @@
 from frd import FRD
+from frd_cache import FRDCache
 
 '''Utility script to view at runtime data in debugger'''
 
-with open("TR02.FRD", "rb") as f:
-	atlantica = FRD(f.read())
+cache = FRDCache()
 
-with open("TR06.FRD", "rb") as f:
-	aquatica = FRD(f.read())
+atlantica = FRD.open("TR02.FRD", cache=cache)
+
+aquatica = FRD.open("TR06.FRD", cache=cache)
 
 if __name__ == "__main__":
 	#export(aquatica, "aquatica.glb")
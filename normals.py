@@ -0,0 +1,57 @@
+'''
+Face and smooth vertex normals of quad and triangle index arrays.
+
+Polygons are the (n, 4) output of VertexOps.to_mesh or polygons_to_quad_buffer,
+or the (n, 3) output of polygons_to_triangle_buffer. Normals follow the
+right hand rule over the given winding; winding=-1 reverses it, which is how
+the importers show every polygon type except extra objects (see winding()).
+'''
+
+import numpy as np
+from basic import PolygonType
+
+def winding(polygon_type: PolygonType):
+	"""-1 for polygon types stored with reversed winding"""
+	return 1 if polygon_type == PolygonType.EXTRAOBJECT else -1
+
+def polygon_vectors(vertices: np.ndarray, polygons: np.ndarray, winding=1):
+	"""
+	Unnormalized face normals whose length is twice the polygon area.
+	Quads use the cross product of their diagonals, which is exact for planar
+	quads and for triangles stored as quads with a repeated corner.
+	"""
+	vertices = np.asarray(vertices, dtype=np.float32)
+	polygons = np.asarray(polygons).astype(np.intp, copy=False)
+	if polygons.shape[1] == 4:
+		vectors = np.cross(vertices[polygons[:, 2]] - vertices[polygons[:, 0]], vertices[polygons[:, 3]] - vertices[polygons[:, 1]])
+	else:
+		vectors = np.cross(vertices[polygons[:, 1]] - vertices[polygons[:, 0]], vertices[polygons[:, 2]] - vertices[polygons[:, 0]])
+	return vectors if winding > 0 else -vectors
+
+def normalize(vectors: np.ndarray, fallback=(0.0, 0.0, 1.0)):
+	"""unit vectors, zero length ones replaced by fallback"""
+	length = np.sqrt(np.einsum("ij,ij->i", vectors, vectors))
+	unit = np.empty_like(vectors)
+	valid = length > 0
+	unit[valid] = vectors[valid] / length[valid, None]
+	unit[~valid] = fallback
+	return unit
+
+def face_normals(vertices: np.ndarray, polygons: np.ndarray, winding=1):
+	"""unit normals and areas of every polygon"""
+	vectors = polygon_vectors(vertices, polygons, winding)
+	return normalize(vectors), 0.5 * np.sqrt(np.einsum("ij,ij->i", vectors, vectors))
+
+def vertex_normals(vertices: np.ndarray, polygons: np.ndarray, winding=1):
+	"""
+	Smooth unit normals of every vertex, the area weighted average of the
+	normals of the polygons using it. Unused vertices get the fallback up axis.
+	"""
+	vectors = polygon_vectors(vertices, polygons, winding)
+	corners = np.asarray(polygons).ravel()
+	count = len(vertices)
+	accumulated = np.stack([
+		np.bincount(corners, weights=np.repeat(vectors[:, axis], polygons.shape[1]), minlength=count)
+		for axis in range(3)
+	], axis=1)
+	return normalize(accumulated).astype(np.float32)
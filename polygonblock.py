@@ -1,138 +1,235 @@
-from io import BytesIO
 import numpy as np
+from dataclasses import dataclass
 from struct import unpack
 from basic import *
+from profiling import profiled
+
+# quad corners of the two triangles a polygon is split into
+TRIANGLE_CORNERS = np.array([[0, 1, 2], [2, 3, 0]])
+
+@dataclass
+class TextureBatches:
+	"""
+	Faces sorted by (atlas page, texture). Faces of batch i are
+	order[start[i]:end[i]], per-face attributes line up with attribute[order].
+	"""
+	order: np.ndarray
+	texture: np.ndarray
+	page: np.ndarray
+	start: np.ndarray
+	end: np.ndarray
+
+	def __len__(self):
+		return len(self.texture)
+
+	def ranges(self):
+		"""(texture, start, end) of every batch"""
+		return zip(self.texture.tolist(), self.start.tolist(), self.end.tolist())
+
+def texture_batches(textures: np.ndarray, pages: np.ndarray = None):
+	"""
+	Groups faces by texture id, pages maps texture ids to atlas pages
+	so faces of one page stay contiguous too
+	"""
+	textures = np.asarray(textures, dtype=np.int64)
+	page = np.zeros(len(textures), dtype=np.int64) if pages is None else np.asarray(pages)[textures]
+	order = np.lexsort((textures, page))
+	sorted_textures, sorted_pages = textures[order], page[order]
+	start = np.flatnonzero(np.concatenate(([True], (sorted_textures[1:] != sorted_textures[:-1]) | (sorted_pages[1:] != sorted_pages[:-1])))) if len(order) else np.zeros(0, dtype=np.int64)
+	end = np.append(start[1:], len(order))
+	return TextureBatches(order, sorted_textures[start], sorted_pages[start], start, end)
 
 class VertexOps:
+	"""
+	Polygons are held in polyArray, a structured array of PolygonData.dtype
+	records. poly is a PolygonList view over it for callers using PolygonData.
+	"""
 
-	poly: list[PolygonData]
+	polyArray: np.ndarray = np.zeros(0, dtype=PolygonData.dtype)
+	poly: PolygonList = PolygonList(polyArray)
+
+	@staticmethod
+	def from_array(polyArray: np.ndarray):
+		"""VertexOps over existing PolygonData.dtype records, e.g. several chunks concatenated"""
+		ops = VertexOps()
+		ops.polyArray = polyArray
+		ops.poly = PolygonList(polyArray)
+		return ops
+
+	def read_polygons(self, data: Cursor, count: int):
+		self.polyArray = data.array(PolygonData.dtype, count)
+		self.poly = PolygonList(self.polyArray)
 	
+	def quad_indices(self):
+		"""(n, 4) array of polygon vertex indices"""
+		return self.polyArray["vertex"].astype(np.int32)
+
+	def texture_ids(self):
+		return self.polyArray["texture"].astype(np.int32)
+
+	def batch_by_texture(self, pages: np.ndarray = None):
+		"""TextureBatches of the polygons, one material slot or primitive per batch"""
+		return texture_batches(self.polyArray["texture"], pages)
+
 	def get_vertex_set(self):
-		vertex_set = set()
-		for polygon in self.poly:
-			vertex_set.update(polygon.vertex)
-		return vertex_set
+		return set(np.unique(self.quad_indices()).tolist())
 	
+	@profiled("VertexOps.to_mesh")
 	def to_mesh(self, vertex_buffer: np.ndarray, flipped=False, shading_buffer=None):
-		vertex_set = list(self.get_vertex_set())
+		"""
+		Compacts the referenced vertices, polygons are remapped to the compacted
+		vertex order (ascending original index)
+		"""
+		quads = self.quad_indices()
+		vertex_set, inverse = np.unique(quads, return_inverse=True)
+		polygons = inverse.reshape(quads.shape).astype(np.uint32)
+		if flipped:
+			polygons = np.ascontiguousarray(polygons[:, ::-1])
+
 		vertices = vertex_buffer[vertex_set]
 		if shading_buffer is not None:
 			shading = shading_buffer[vertex_set]
 		else:
 			shading = None
-		map = {v: i for i, v in enumerate(vertex_set)}
-
-		polygons = np.zeros((len(self.poly), 4), dtype=np.uint32)
-		textures = set()
-		
-		for i, p in enumerate(self.poly):
-			if flipped:
-				polygons[i] = (
-					map[p.vertex[3]], 
-					map[p.vertex[2]],
-					map[p.vertex[1]],
-					map[p.vertex[0]],
-				)
-			else:
-				polygons[i] = [map[p.vertex[j]] for j in range(4)]
-			textures.add(p.texture)
-
-		pass
+		textures = set(np.unique(self.texture_ids()).tolist())
 
 		return vertices, polygons, textures, shading
 	
 	def to_shading(self, shading_buffer: np.ndarray):
-		vertex_set = list(self.get_vertex_set())
 		#shading = np.array(shading_buffer[vertex_set], dtype=np.float32)
 		#shading /= 255
 		#return shading
-		return shading_buffer[vertex_set]
+		return shading_buffer[np.unique(self.quad_indices())]
 	
 	def iter_polys(self):
 		yield from self.poly
 
+	def polygons_to_quad_buffer(self, doublesided=False):
+		"""doublesided appends reversed copies of two-sided (flags & 0x10) polygons"""
+		quads = self.polyArray["vertex"].astype(np.uint32)
+		if doublesided:
+			back = quads[self.polyArray["flags"] & 0x10 != 0]
+			quads = np.concatenate((quads, back[:, ::-1]))
+		return quads
+
+	def triangulate(self, doublesided=True):
+		"""
+		Splits every quad into triangles (0, 1, 2) and (2, 3, 0).
+		Two-sided polygons (flags & 0x10) get reversed winding copies appended.
+		Returns (2n+2k, 3) vertex indices, the source polygon of every triangle and
+		the quad corner each triangle vertex came from, so per-corner attributes
+		can be gathered with attribute[source[:, None], corners].
+		"""
+		vertex = self.polyArray["vertex"].astype(np.uint32)
+		front = TRIANGLE_CORNERS.ravel()
+		triangles = vertex[:, front]
+		corners = np.broadcast_to(front, triangles.shape)
+		source = np.arange(len(vertex))
+		if doublesided:
+			back = np.flatnonzero(self.polyArray["flags"] & 0x10)
+			reverse = TRIANGLE_CORNERS[:, ::-1].ravel()
+			triangles = np.concatenate((triangles, vertex[back][:, reverse]))
+			corners = np.concatenate((corners, np.broadcast_to(reverse, (len(back), 6))))
+			source = np.concatenate((source, back))
+		return triangles.reshape(-1, 3), np.repeat(source, 2), corners.reshape(-1, 3)
+
+	def polygons_to_triangle_buffer(self, doublesided=True):
+		return self.triangulate(doublesided)[0]
+
 class PolygonChunk(VertexOps):
 	size: int
-	poly: list[PolygonData] = []
 
-	def __init__(self, data: BytesIO):
-		self.size = unpack_one(data, 4, "l")
+	def __init__(self, data: Cursor):
+		self.size = unpack_one(data, LONG)
 		if self.size > 0:
-			sizedup = unpack_one(data, 4, "l")
+			sizedup = unpack_one(data, LONG)
 			if self.size != sizedup:
 				raise "Size mismatch"
-			self.poly = [PolygonData.read(data) for i in range(self.size)]
+			self.read_polygons(data, self.size)
 
-	def polygons_to_triangle_buffer(self):
-		#buffer = np.zeros((self.nVertices, 3), dtype=np.uint32)
-		buffer = np.zeros((self.size * 2, 3), dtype=np.uint32)
-		for i, polygon in enumerate(self.poly):
-			buffer[i*2] = [polygon.vertex[0], polygon.vertex[1], polygon.vertex[2]]
-			buffer[i*2+1] = [polygon.vertex[2], polygon.vertex[3], polygon.vertex[0]]
+	@staticmethod
+	def counts(buffer, offset: int):
+		"""(number of polygons, offset just past the chunk) read from the size field only"""
+		size = unpack_at("<l", buffer, offset)[0]
+		if size > 0:
+			return size, offset + 8 + 14 * size
+		return 0, offset + 4
 
-			if polygon.flags & 0x10:
-				# double sided polygon
-				pass
-
-		return buffer
-	
-	def polygons_to_quad_buffer(self):
-		#buffer = np.zeros((self.nVertices, 3), dtype=np.uint32)
-		buffer = np.zeros((self.size, 4), dtype=np.uint32)
-		for i, polygon in enumerate(self.poly):
-			buffer[i] = [polygon.vertex[0], polygon.vertex[1], polygon.vertex[2], polygon.vertex[3]]
+	@staticmethod
+	def skip(buffer, offset: int):
+		return PolygonChunk.counts(buffer, offset)[1]
 
-			if polygon.flags & 0x10:
-				# double sided polygon
-				pass
-
-		return buffer
 
 class PolyObjData(VertexOps):
 	type: int
 	numpoly: int
-	poly: list[PolygonData] = []
 
-	def __init__(self, data: BytesIO):
-		self.type = unpack_one(data, 4, "l")
+	def __init__(self, data: Cursor):
+		self.type = unpack_one(data, LONG)
 		if self.type == 1:
-			self.numpoly = unpack_one(data, 4, "l")
-			self.poly = [PolygonData.read(data) for i in range(self.numpoly)]
+			self.numpoly = unpack_one(data, LONG)
+			self.read_polygons(data, self.numpoly)
 			pass
 
-	def polygons_to_quad_buffer(self):
-		buffer = np.zeros((self.numpoly, 4), dtype=np.uint32)
-		for i, polygon in enumerate(self.poly):
-			buffer[i] = [polygon.vertex[0], polygon.vertex[1], polygon.vertex[2], polygon.vertex[3]]
-
-			if polygon.flags & 0x10:
-				# double sided polygon
-				pass
+	@staticmethod
+	def skip(buffer, offset: int):
+		type = unpack_at("<l", buffer, offset)[0]
+		if type == 1:
+			return offset + 8 + 14 * unpack_at("<l", buffer, offset + 4)[0]
+		return offset + 4
 
-		return buffer
 
+@dataclass(frozen=True)
+class ObjPolyCounts:
+	"""counts of an object chunk, read by ObjPolyBlock.counts without parsing it"""
+	nPolygons: int
+	nObjects: int
+	nPolyObjects: int # objects of type 1, the ones holding polygons
 
 class ObjPolyBlock:
 	nPolygons: int
 	nObjects: int
 	obj: list[PolyObjData] = []
 	
-	def __init__(self, data: BytesIO):
-		self.nPolygons = unpack_one(data, 4, "l")
+	def __init__(self, data: Cursor):
+		self.nPolygons = unpack_one(data, LONG)
 		if self.nPolygons > 0:
-			self.nObjects = unpack_one(data, 4, "l")
+			self.nObjects = unpack_one(data, LONG)
 			self.obj = [PolyObjData(data) for i in range(self.nObjects)]
 		pass
 
+	@staticmethod
+	def counts(buffer, offset: int):
+		"""(ObjPolyCounts, offset just past the chunk) read from the count fields only"""
+		nPolygons = unpack_at("<l", buffer, offset)[0]
+		if nPolygons <= 0:
+			return ObjPolyCounts(0, 0, 0), offset + 4
+		nObjects = unpack_at("<l", buffer, offset + 4)[0]
+		offset += 8
+		nPolyObjects = 0
+		for i in range(nObjects):
+			if unpack_at("<l", buffer, offset)[0] == 1:
+				nPolyObjects += 1
+			offset = PolyObjData.skip(buffer, offset)
+		return ObjPolyCounts(nPolygons, nObjects, nPolyObjects), offset
+
+	@staticmethod
+	def skip(buffer, offset: int):
+		return ObjPolyBlock.counts(buffer, offset)[1]
+
 	def iter_polys(self):
 		for polyObj in self.obj:
 			yield from polyObj.iter_polys()
 
+	def iter_polygon_arrays(self):
+		for polyObj in self.obj:
+			yield polyObj.polyArray
+
 class PolygonBlock:
 	poly: list[PolygonChunk] # main road polygons
 	obj: list[ObjPolyBlock] # scenery
 
-	def __init__(self, data: BytesIO):
+	def __init__(self, data: Cursor):
 		"""
 		poly[4] high resolution poly data
 		poly[5] high resolution transparent stuff
@@ -142,8 +239,23 @@ class PolygonBlock:
 		self.obj = [ObjPolyBlock(data) for i in range(4)]
 		pass
 
+	@staticmethod
+	def skip(buffer, offset: int):
+		for i in range(7):
+			offset = PolygonChunk.skip(buffer, offset)
+		for i in range(4):
+			offset = ObjPolyBlock.skip(buffer, offset)
+		return offset
+
 	def iter_polys(self):
 		for i in range(4, 7):
 			yield from self.poly[i].iter_polys()
 		for obj in self.obj:
 			yield from obj.iter_polys()
+
+	def iter_polygon_arrays(self):
+		"""polygon arrays in the same order as iter_polys"""
+		for i in range(4, 7):
+			yield self.poly[i].polyArray
+		for obj in self.obj:
+			yield from obj.iter_polygon_arrays()
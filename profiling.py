@@ -0,0 +1,134 @@
+'''
+Opt-in per-stage timing and memory instrumentation.
+
+Stages only record while a Profiler is active, either as a context manager
+
+	with Profiler() as profiler:
+		frd = FRD.open(filename)
+	profiler.write("profile.json")
+
+or for a whole run by setting FRD_PROFILE to a report filename ("-" prints
+it to stderr). When no profiler is active a stage is a shared no-op.
+'''
+
+import os
+import sys
+import json
+import time
+import atexit
+import tracemalloc
+from contextlib import nullcontext
+from dataclasses import dataclass, asdict
+from functools import wraps
+
+active: 'Profiler' = None
+NO_STAGE = nullcontext()
+
+@dataclass
+class StageStats:
+	calls: int = 0
+	seconds: float = 0.0
+	peak_bytes: int = 0 # highest traced memory above the stage's starting point
+
+class Stage:
+
+	def __init__(self, profiler: 'Profiler', name: str):
+		self.profiler = profiler
+		self.name = name
+
+	def __enter__(self):
+		self.profiler.enter()
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		seconds = time.perf_counter() - self.start
+		self.profiler.exit(self.name, seconds)
+
+class Profiler:
+	"""
+	Wall time, call count and tracemalloc peak per named stage.
+	Nested stages are included in the time and memory of their parents.
+	"""
+
+	def __init__(self, memory=True):
+		self.memory = memory
+		self.stages: dict[str, StageStats] = {}
+		# [traced memory at stage entry, highest traced memory seen] per open stage
+		self.frames = []
+		self.previous = None
+		self.started_tracing = False
+
+	def __enter__(self):
+		global active
+		self.previous, active = active, self
+		if self.memory and not tracemalloc.is_tracing():
+			tracemalloc.start()
+			self.started_tracing = True
+		return self
+
+	def __exit__(self, *exc):
+		global active
+		active = self.previous
+		if self.started_tracing:
+			tracemalloc.stop()
+			self.started_tracing = False
+
+	def stage(self, name: str):
+		return Stage(self, name)
+
+	def enter(self):
+		if not self.memory:
+			return
+		current, peak = tracemalloc.get_traced_memory()
+		if self.frames:
+			self.frames[-1][1] = max(self.frames[-1][1], peak)
+		tracemalloc.reset_peak()
+		self.frames.append([current, current])
+
+	def exit(self, name: str, seconds: float):
+		stats = self.stages.setdefault(name, StageStats())
+		stats.calls += 1
+		stats.seconds += seconds
+		if not self.memory:
+			return
+		start, peak = self.frames.pop()
+		peak = max(peak, tracemalloc.get_traced_memory()[1])
+		stats.peak_bytes = max(stats.peak_bytes, peak - start)
+		if self.frames:
+			self.frames[-1][1] = max(self.frames[-1][1], peak)
+
+	def report(self):
+		return {
+			"memory": self.memory,
+			"stages": {name: asdict(stats) for name, stats in self.stages.items()},
+		}
+
+	def write(self, filename: str):
+		if filename == "-":
+			json.dump(self.report(), sys.stderr, indent=1)
+			return
+		with open(filename, "w", encoding="utf8") as f:
+			json.dump(self.report(), f, indent=1)
+
+def stage(name: str):
+	"""context manager recording name on the active profiler"""
+	if active is None:
+		return NO_STAGE
+	return active.stage(name)
+
+def profiled(name: str):
+	"""decorator recording every call as a stage"""
+	def decorator(function):
+		@wraps(function)
+		def wrapper(*args, **kwargs):
+			if active is None:
+				return function(*args, **kwargs)
+			with active.stage(name):
+				return function(*args, **kwargs)
+		return wrapper
+	return decorator
+
+if report_filename := os.environ.get("FRD_PROFILE"):
+	profiler = Profiler().__enter__()
+	atexit.register(profiler.write, report_filename)
@@ -6,6 +6,7 @@ from typing import Self
 from PIL import Image
 import numpy as np
 from pathlib import Path
+from profiling import profiled
 
 class TexturePair:
 
@@ -120,6 +121,7 @@ class AtlasPacker:
 			self.packed[pair] = quad
 		return quad
 
+@profiled("make_atlas")
 def make_atlas(track_id, atlas_size):
 	atlas = AtlasPacker(track_id, atlas_size)
 	#cutout_atlas = AtlasPacker(track_id, 512)
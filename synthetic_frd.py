@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+
+'''Writes synthetic FRD files following the frd.hexpat layout'''
+
+import os
+from dataclasses import dataclass
+from struct import pack
+import numpy as np
+
+STRIP_LENGTH = 30000.0
+
+@dataclass
+class SyntheticTrack:
+	blocks: int = 16
+	columns: int = 8 # hires road quads across a block
+	rows: int = 8 # hires road quads along a block
+	polyobjs: int = 2 # polygon objects in object chunk 0
+	polyobj_polygons: int = 6
+	xobjs: int = 1 # static extra objects (type 4) per block
+	animated: int = 2 # global animated extra objects (type 3)
+	xobj_polygons: int = 6
+	frames: int = 8 # animation frames per animated extra object
+	textures: int = 64
+	texture_size: int = 64
+	lanes: int = 2
+	seed: int = 0
+
+	@property
+	def block_length(self):
+		return self.rows * 4.0
+
+	@property
+	def block_width(self):
+		return self.columns * 2.5
+
+	def block_origin(self, index: int):
+		"""
+		Blocks run along y in strips laid side by side, 16.16 fixed point
+		reference points can't go past 32767
+		"""
+		per_strip = max(1, int(STRIP_LENGTH // self.block_length))
+		strip, position = divmod(index, per_strip)
+		return np.array([strip * self.block_width * 3, position * self.block_length, 0.0])
+
+	@property
+	def texture_images(self):
+		"""distinct texture ids, each is shared by two texture table entries"""
+		return max(1, self.textures // 2)
+
+	def block_vertices(self):
+		"""vertex count of every track block"""
+		def grid(columns, rows):
+			return (columns + 1) * (rows + 1)
+		lo = grid(max(1, self.columns // 4), max(1, self.rows // 4))
+		med = grid(max(1, self.columns // 2), max(1, self.rows // 2))
+		return self.polyobjs * self.polyobj_polygons * 4 + lo + med + grid(self.columns, self.rows) + self.lanes * 8
+
+def floatpt_bytes(points: np.ndarray):
+	"""(n, 3) x, y, z world points to FloatPT records (x, z, y)"""
+	return np.ascontiguousarray(points[:, [0, 2, 1]], dtype="<f4").tobytes()
+
+def intpt_bytes(point):
+	x, y, z = point
+	return pack("<iii", int(x * 2**16), int(z * 2**16), int(y * 2**16))
+
+def shading_bytes(rng: np.random.Generator, n: int):
+	shading = rng.integers(0, 256, (n, 4), dtype=np.uint8)
+	shading[:, 3] = 255
+	return shading.tobytes()
+
+def grid_vertices(rng, origin, columns, rows, width, length):
+	gx = np.linspace(-width / 2, width / 2, columns + 1)
+	gy = np.linspace(0, length, rows + 1)
+	x, y = np.meshgrid(gx, gy)
+	z = rng.normal(0, 0.05, x.shape)
+	return np.stack((x.ravel() + origin[0], y.ravel() + origin[1], z.ravel() + origin[2]), axis=1)
+
+def grid_quads(start, columns, rows):
+	index = np.arange((columns + 1) * (rows + 1)).reshape(rows + 1, columns + 1) + start
+	return np.stack((
+		index[:-1, :-1].ravel(),
+		index[:-1, 1:].ravel(),
+		index[1:, 1:].ravel(),
+		index[1:, :-1].ravel(),
+	), axis=1)
+
+def polygon_bytes(quads: np.ndarray, textures: np.ndarray, flags: np.ndarray):
+	dtype = np.dtype([("vertex", "<i2", 4), ("texture", "<i2"), ("unknown", "<i2"), ("flags", "u1"), ("unknown2", "u1")])
+	records = np.zeros(len(quads), dtype=dtype)
+	records["vertex"] = quads
+	records["texture"] = textures
+	records["flags"] = flags
+	return records.tobytes()
+
+def chunk_bytes(polygons: bytes, count: int):
+	if count == 0:
+		return pack("<i", 0)
+	return pack("<ii", count, count) + polygons
+
+def box_quads(rng, center, start, count):
+	"""Loose quads scattered around a center point"""
+	offsets = rng.uniform(-1.5, 1.5, (count, 1, 3))
+	corners = np.array([[0, 0, 0], [1, 0, 0], [1, 0, 1], [0, 0, 1]], dtype=np.float64)
+	vertices = (np.asarray(center) + offsets + corners).reshape(-1, 3)
+	quads = np.arange(count * 4).reshape(count, 4) + start
+	return vertices, quads
+
+class TrackWriter:
+
+	def __init__(self, track: SyntheticTrack):
+		self.track = track
+		self.rng = np.random.default_rng(track.seed)
+		self.nBlocks = track.blocks - 1
+		self.polygon_blocks = []
+		self.xobj_blocks = []
+		self.globalno = 0
+
+	def texture_ids(self, n):
+		return self.rng.integers(0, self.track.textures, n)
+
+	def track_block(self, index: int):
+		t = self.track
+		rng = self.rng
+		origin = t.block_origin(index)
+		centre = origin + (0.0, t.block_length / 2, 0.0)
+
+		# object vertices come first, followed by lo, med and hi resolution grids and road lanes
+		vertices = []
+		obj_quads = []
+		nObjectVert = 0
+		for i in range(t.polyobjs):
+			side = -1 if i % 2 else 1
+			v, q = box_quads(rng, centre + (side * t.block_width, 0, 0), nObjectVert, t.polyobj_polygons)
+			vertices.append(v)
+			obj_quads.append(q)
+			nObjectVert += len(v)
+
+		lo_cols, lo_rows = max(1, t.columns // 4), max(1, t.rows // 4)
+		med_cols, med_rows = max(1, t.columns // 2), max(1, t.rows // 2)
+		lo = grid_vertices(rng, origin, lo_cols, lo_rows, t.block_width, t.block_length)
+		med = grid_vertices(rng, origin, med_cols, med_rows, t.block_width, t.block_length)
+		hi = grid_vertices(rng, origin, t.columns, t.rows, t.block_width, t.block_length)
+		lo_quads = grid_quads(nObjectVert, lo_cols, lo_rows)
+		nLoResVert = nObjectVert + len(lo)
+		med_quads = grid_quads(nLoResVert, med_cols, med_rows)
+		nMedResVert = nLoResVert + len(med)
+		hi_quads = grid_quads(nMedResVert, t.columns, t.rows)
+		nHiResVert = nMedResVert + len(hi)
+		vertices += [lo, med, hi]
+
+		lane_quads = []
+		nVertices = nHiResVert
+		for i in range(t.lanes):
+			x = (i + 1) * t.block_width / (t.lanes + 1) - t.block_width / 2
+			lane = np.array([
+				[x - 0.1, 0, 0.02], [x + 0.1, 0, 0.02],
+				[x + 0.1, t.block_length, 0.02], [x - 0.1, t.block_length, 0.02],
+			]) + origin
+			# each road lane is followed by a hole of four unreferenced vertices
+			vertices += [lane, lane]
+			lane_quads.append(np.arange(4) + nVertices)
+			nVertices += 8
+		vertices = np.concatenate(vertices)
+
+		nPolygons = len(hi_quads)
+		transparent = hi_quads[rng.random(nPolygons) < 0.1]
+		chunks = [
+			(lo_quads, 0), (lo_quads[:0], 0),
+			(med_quads, 0), (med_quads[:0], 0),
+			(hi_quads, 0), (transparent, 0x10),
+			(np.array(lane_quads, dtype=np.int64).reshape(-1, 4), 0),
+		]
+		polygon_block = b"".join(
+			chunk_bytes(polygon_bytes(q, self.texture_ids(len(q)), np.full(len(q), flags)), len(q))
+			for q, flags in chunks
+		)
+
+		# object chunk 0 holds polygon objects followed by extra object entries
+		xobj_points = [centre + rng.uniform(-t.block_width, t.block_width, 3) * (1, 0.2, 0) for i in range(t.xobjs)]
+		objects = b"".join(
+			pack("<ii", 1, len(q)) + polygon_bytes(q, self.texture_ids(len(q)), np.zeros(len(q)))
+			for q in obj_quads
+		) + pack("<i", 4) * t.xobjs
+		polygon_count = t.polyobjs * t.polyobj_polygons
+		if polygon_count:
+			polygon_block += pack("<ii", polygon_count, t.polyobjs + t.xobjs) + objects
+		else:
+			polygon_block += pack("<i", 0)
+		polygon_block += pack("<i", 0) * 3
+		self.polygon_blocks.append(polygon_block)
+
+		xobj_refs = b""
+		xobjs = b""
+		for i, point in enumerate(xobj_points):
+			xobj_refs += intpt_bytes(point) + pack("<xxhxxBx", self.globalno, t.polyobjs + i)
+			xobjs += self.static_xobj(self.globalno, point)
+			self.globalno += 1
+		self.xobj_blocks += [pack("<i", t.xobjs) + xobjs, pack("<i", 0), pack("<i", 0), pack("<i", 0)]
+
+		polyobj_refs = b""
+		for i in range(t.polyobjs):
+			polyobj_refs += pack("<hBB", 16, 1, i) + intpt_bytes(centre)
+		for i, point in enumerate(xobj_points):
+			polyobj_refs += pack("<hBB", 20, 4, t.polyobjs + i) + intpt_bytes(point) + pack("<i", i)
+		nPolyObj = t.polyobjs + t.xobjs
+		polyobj_refs = polyobj_refs.ljust(20 * nPolyObj, b"\0")
+
+		neighbors = np.full(0x12C, -1, dtype="<i4")
+		near = [b for b in range(index - 2, index + 3) if 0 <= b <= self.nBlocks]
+		near.sort(key=lambda b: abs(b - index))
+		neighbors[:len(near)] = near
+		neighbors = neighbors.astype("<i2").view("<u2").astype("<u4").tobytes()
+
+		positions = np.zeros(t.rows, dtype=[("polygon", "<i2"), ("nPolygons", "u1"), ("pad", "u1"), ("extra", "<i2", 2)])
+		positions["polygon"] = np.arange(t.rows) * t.columns
+		positions["nPolygons"] = t.columns
+		positions["extra"] = -1
+
+		poly_data = np.zeros(nPolygons, dtype=[("vroadEntry", "u1"), ("flags", "u1"), ("pad", "u1", 6)])
+		poly_data["vroadEntry"] = np.repeat(np.arange(t.rows), t.columns) % 256
+		poly_data["flags"] = rng.choice([0x1, 0x2, 0x80 | 0x1, 0xE], nPolygons)
+
+		tilt = rng.normal(0, 0.05, (t.rows, 2))
+		normal = np.stack((tilt[:, 0], np.ones(t.rows), tilt[:, 1]), axis=1)
+		normal /= np.linalg.norm(normal, axis=1)[:, None]
+		forward = np.tile([0.0, 0.0, 1.0], (t.rows, 1))
+		vroad = (np.concatenate((normal, forward), axis=1) * 32767).astype("<i2").tobytes()
+
+		bounds = [origin + (x * t.block_width / 2, y, 0) for x, y in ((-1, 0), (1, 0), (1, t.block_length), (-1, t.block_length))]
+
+		header = floatpt_bytes(np.array([centre] + bounds))
+		header += pack("<6i", len(vertices), nHiResVert, nLoResVert, nMedResVert, len(vertices), nObjectVert)
+		body = floatpt_bytes(vertices) + shading_bytes(rng, len(vertices)) + neighbors
+		body += pack("<8i", index * 8, t.rows, nPolygons, t.rows, t.xobjs, nPolyObj, 1, 1)
+		body += positions.tobytes() + poly_data.tobytes() + vroad + xobj_refs + polyobj_refs
+		body += intpt_bytes(centre) + pack("<i", 1)
+		body += intpt_bytes(centre + (0, 0, 5)) + pack("<i", 2)
+		return header + body
+
+	def xobj_geometry(self):
+		n = self.track.xobj_polygons
+		vertices, quads = box_quads(self.rng, (0, 0, 0), 0, n)
+		data = pack("<i", len(vertices)) + floatpt_bytes(vertices) + shading_bytes(self.rng, len(vertices))
+		flags = np.where(self.rng.random(n) < 0.25, 0x10, 0)
+		return data + pack("<i", n) + polygon_bytes(quads, self.texture_ids(n), flags)
+
+	def static_xobj(self, crossno: int, point):
+		return pack("<iii", 4, crossno, 0) + floatpt_bytes(np.array([point])) + pack("<i", 0) + self.xobj_geometry()
+
+	def animated_xobj(self, objno: int):
+		t = self.track
+		frames = t.frames
+		data = pack("<iii", 3, objno, 0) + bytes(18) + pack("<BBhh", 3, objno, frames, 0)
+		y = self.rng.uniform(0, min(t.blocks * t.block_length, STRIP_LENGTH))
+		for i in range(frames):
+			theta = 2 * np.pi * i / frames
+			data += intpt_bytes((np.cos(theta) * 5, y + np.sin(theta) * 5, 3)) + pack("<ff", np.cos(theta), np.sin(theta))
+		return data + self.xobj_geometry()
+
+	def texture_table(self):
+		t = self.track
+		data = pack("<i", t.textures)
+		corners = (0.0, 0.0, 1.0, 0.0, 1.0, 1.0, 0.0, 1.0)
+		for i in range(t.textures):
+			repeat = 1 + i % 3
+			size = t.texture_size
+			data += pack("<hhi8fi?h", size, size, 0, *(c * repeat for c in corners), 0, False, i % t.texture_images)
+		return data
+
+	def write(self, f):
+		t = self.track
+		f.write(bytes(28))
+		f.write(pack("<i", self.nBlocks))
+		for i in range(t.blocks):
+			f.write(self.track_block(i))
+		for polygon_block in self.polygon_blocks:
+			f.write(polygon_block)
+		for xobj_block in self.xobj_blocks:
+			f.write(xobj_block)
+		f.write(pack("<i", t.animated) + b"".join(self.animated_xobj(i) for i in range(t.animated)))
+		f.write(self.texture_table())
+
+def write_frd(filename: str, track: SyntheticTrack = None):
+	with open(filename, "wb") as f:
+		TrackWriter(track or SyntheticTrack()).write(f)
+
+def write_textures(directory: str, track: SyntheticTrack = None):
+	"""
+	Albedo and mask bitmaps for every texture id in the texture table,
+	named the way make_atlas expects them
+	"""
+	from PIL import Image
+	track = track or SyntheticTrack()
+	rng = np.random.default_rng(track.seed)
+	size = track.texture_size
+	os.makedirs(directory, exist_ok=True)
+	for texture_id in range(track.texture_images):
+		albedo = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+		mask = np.full((size, size), 255, dtype=np.uint8)
+		if texture_id % 4 == 3:
+			mask[::2, ::2] = 0
+		Image.fromarray(albedo).save(os.path.join(directory, f"{texture_id}.bmp"))
+		Image.fromarray(mask).save(os.path.join(directory, f"{texture_id}-a.bmp"))
+
+def atlas_size(track: SyntheticTrack):
+	"""smallest power of two atlas that holds all texture images"""
+	per_row = 1
+	while per_row * per_row < track.texture_images:
+		per_row *= 2
+	return per_row * track.texture_size
+
+def generate(track: SyntheticTrack = None):
+	from io import BytesIO
+	data = BytesIO()
+	TrackWriter(track or SyntheticTrack()).write(data)
+	return data.getvalue()
+
+if __name__ == "__main__":
+	import argparse
+	parser = argparse.ArgumentParser(
+		prog="synthetic_frd",
+		description="Writes a synthetic FRD file",
+	)
+	parser.add_argument("filename")
+	parser.add_argument("--blocks", type=int, default=16)
+	parser.add_argument("--columns", type=int, default=8)
+	parser.add_argument("--rows", type=int, default=8)
+	parser.add_argument("--polyobjs", type=int, default=2, help="polygon objects per block")
+	parser.add_argument("--polyobj-polygons", type=int, default=6)
+	parser.add_argument("--xobjs", type=int, default=1, help="static (type 4) extra objects per block")
+	parser.add_argument("--animated", type=int, default=2, help="global animated (type 3) extra objects")
+	parser.add_argument("--xobj-polygons", type=int, default=6)
+	parser.add_argument("--frames", type=int, default=8)
+	parser.add_argument("--lanes", type=int, default=2)
+	parser.add_argument("--textures", type=int, default=64)
+	parser.add_argument("--texture-size", type=int, default=64)
+	parser.add_argument("--texture-dir", help="also write texture bitmaps to this directory")
+	parser.add_argument("--seed", type=int, default=0)
+
+	args = parser.parse_args()
+
+	track = SyntheticTrack(
+		blocks=args.blocks,
+		columns=args.columns,
+		rows=args.rows,
+		polyobjs=args.polyobjs,
+		polyobj_polygons=args.polyobj_polygons,
+		xobjs=args.xobjs,
+		animated=args.animated,
+		xobj_polygons=args.xobj_polygons,
+		frames=args.frames,
+		lanes=args.lanes,
+		textures=args.textures,
+		texture_size=args.texture_size,
+		seed=args.seed,
+	)
+	write_frd(args.filename, track)
+	if args.texture_dir:
+		write_textures(args.texture_dir, track)
+	print(f"{track.blocks} blocks, {track.block_vertices()} vertices per block, atlas size {atlas_size(track)}")
@@ -0,0 +1,26 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frd import FRD
+from synthetic_frd import SyntheticTrack, generate
+
+@pytest.fixture(scope="session")
+def track():
+	return SyntheticTrack(blocks=12, seed=3)
+
+@pytest.fixture(scope="session")
+def data(track):
+	return generate(track)
+
+@pytest.fixture(scope="session")
+def filename(data, tmp_path_factory):
+	path = tmp_path_factory.mktemp("frd") / "TR.FRD"
+	path.write_bytes(data)
+	return str(path)
+
+@pytest.fixture(scope="session")
+def eager(data):
+	return FRD(data)
@@ -0,0 +1,37 @@
+import json
+import pytest
+from frd import FRDStream
+from frd_exporter import export_gltf
+
+def read_glb(filename):
+	"""(JSON document, BIN chunk bytes) of a GLB file"""
+	with open(filename, "rb") as f:
+		data = f.read()
+	assert data[:4] == b"glTF" and int.from_bytes(data[8:12], "little") == len(data)
+	length = int.from_bytes(data[12:16], "little")
+	assert data[16:20] == b"JSON"
+	document = json.loads(data[20:20 + length])
+	binary = data[20 + length:]
+	if binary:
+		assert binary[4:8] == b"BIN\x00"
+		binary = binary[8:8 + int.from_bytes(binary[:4], "little")]
+	return document, binary
+
+@pytest.mark.parametrize("options", [
+	{},
+	{"quantize": True, "normals": True},
+	{"lods": True},
+	{"blocks": [3, 4, 5]},
+	{"blocks": []},
+], ids=["default", "quantize-normals", "lods", "working-set", "empty"])
+def test_stream_matches_memory(eager, filename, tmp_path, options):
+	export_gltf(eager, str(tmp_path / "memory.glb"), **options)
+	export_gltf(eager, str(tmp_path / "stream.glb"), stream=True, **options)
+	with open(filename, "rb") as f:
+		export_gltf(FRDStream(f), str(tmp_path / "frdstream.glb"), stream=True, **options)
+
+	document, binary = read_glb(tmp_path / "memory.glb")
+	# glTF allows no empty top-level arrays
+	assert all(value != [] for value in document.values())
+	for name in ("stream.glb", "frdstream.glb"):
+		assert read_glb(tmp_path / name) == (document, binary)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+def set_based_mesh(mesh, vertex_buffer, flipped=False, shading_buffer=None):
+	"""VertexOps.to_mesh as it was before vectorizing, one polygon at a time through a vertex set"""
+	vertex_set = list(mesh.get_vertex_set())
+	vertices = vertex_buffer[vertex_set]
+	shading = shading_buffer[vertex_set] if shading_buffer is not None else None
+	map = {v: i for i, v in enumerate(vertex_set)}
+	polygons = np.zeros((len(mesh.poly), 4), dtype=np.uint32)
+	textures = set()
+	for i, p in enumerate(mesh.poly):
+		corners = [map[p.vertex[j]] for j in range(4)]
+		polygons[i] = corners[::-1] if flipped else corners
+		textures.add(p.texture)
+	return vertices, polygons, textures, shading
+
+def meshes(frd):
+	"""(VertexOps, vertex buffer, shading buffer) of every non-empty chunk, polygon object and extra object"""
+	for i, track, polyblock in frd.iter_track_blocks():
+		vertex_buffer, shading_buffer = track.vertices_to_buffer(), track.shading_to_buffer()
+		for chunk in polyblock.poly:
+			yield chunk, vertex_buffer, shading_buffer
+		for objPolyBlock in polyblock.obj:
+			for polyObjData in objPolyBlock.obj:
+				if polyObjData.type == 1:
+					yield polyObjData, vertex_buffer, shading_buffer
+	for i, xobjBlock in frd.iter_xobj_blocks():
+		for xobjData in xobjBlock.obj:
+			yield xobjData, xobjData.vertices_to_buffer(), xobjData.shading_to_buffer()
+
+def face_set(vertices, polygons):
+	return {tuple(map(tuple, face)) for face in vertices[polygons].tolist()}
+
+@pytest.mark.parametrize("flipped", [False, True])
+def test_to_mesh_matches_set_based(eager, flipped):
+	count = 0
+	for mesh, vertex_buffer, shading_buffer in meshes(eager):
+		if len(mesh.polyArray) == 0:
+			continue
+		vertices, polygons, textures, shading = mesh.to_mesh(vertex_buffer, flipped, shading_buffer)
+		expected = set_based_mesh(mesh, vertex_buffer, flipped, shading_buffer)
+
+		assert face_set(vertices, polygons) == face_set(expected[0], expected[1])
+		# same polygon order, so the faces also match one by one
+		np.testing.assert_array_equal(vertices[polygons], expected[0][expected[1]])
+		np.testing.assert_array_equal(shading[polygons], expected[3][expected[1]])
+		assert textures == expected[2]
+		assert len(vertices) == len(expected[0])
+		count += 1
+	assert count > 0
+
+def test_to_mesh_compacts_in_ascending_order(eager):
+	mesh = eager.poly[0].poly[4]
+	vertex_buffer = eager.trk[0].vertices_to_buffer()
+	vertices = mesh.to_mesh(vertex_buffer)[0]
+	np.testing.assert_array_equal(vertices, vertex_buffer[sorted(mesh.get_vertex_set())])
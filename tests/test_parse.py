@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from frd import FRD, FRDStream
+from frd_cache import FRDCache
+
+def block_arrays(frd):
+	"""everything the exporters read from a parsed FRD, as (name, array) pairs in file order"""
+	for i, track, polyblock in frd.iter_track_blocks():
+		yield f"trk[{i}].vertices", track.vertices_to_buffer()
+		yield f"trk[{i}].shading", track.shading_to_buffer()
+		yield f"trk[{i}].centre", np.array([track.ptCentre.x, track.ptCentre.y, track.ptCentre.z])
+		for chunk, polygons in enumerate(polyblock.poly):
+			yield f"poly[{i}].poly[{chunk}]", polygons.polyArray
+		for j, polygons in enumerate(polyblock.iter_polygon_arrays()):
+			yield f"poly[{i}].arrays[{j}]", polygons
+	for i, xobjBlock in frd.iter_xobj_blocks():
+		for j, xobjData in enumerate(xobjBlock.obj):
+			yield f"xobj[{i}].obj[{j}].vertices", xobjData.vertices_to_buffer()
+			yield f"xobj[{i}].obj[{j}].shading", xobjData.shading_to_buffer()
+			yield f"xobj[{i}].obj[{j}].polygons", xobjData.polyArray
+			yield f"xobj[{i}].obj[{j}].position", np.asarray(xobjData.get_position())
+	yield "textures", np.array([texture.uv_pairs() for texture in frd.textures])
+
+def assert_same_parse(frd, expected):
+	names, arrays = zip(*block_arrays(expected))
+	parsed = list(block_arrays(frd))
+	assert [name for name, array in parsed] == list(names)
+	for (name, array), other in zip(parsed, arrays):
+		np.testing.assert_array_equal(array, other, err_msg=name)
+
+@pytest.mark.parametrize("options", [
+	{"columnar": True},
+	{"lazy": True},
+	{"lazy": True, "columnar": True},
+	{"workers": 2},
+], ids=["columnar", "lazy", "lazy-columnar", "parallel"])
+def test_parse_modes_match_eager(data, eager, options):
+	assert_same_parse(FRD(data, **options), eager)
+
+def test_stream_matches_eager(filename, eager):
+	with open(filename, "rb") as f:
+		assert_same_parse(FRDStream(f, columnar=True), eager)
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_cache_matches_eager(filename, eager, tmp_path, columnar):
+	cache = FRDCache(str(tmp_path))
+	missed = FRD.open(filename, columnar=columnar, cache=cache)
+	assert len(list(tmp_path.iterdir())) == 1
+	hit = FRD.open(filename, columnar=columnar, cache=cache)
+	for frd in (missed, hit):
+		assert frd.nBlocks == eager.nBlocks
+		assert frd.get_used_texture_set() == eager.get_used_texture_set()
+		assert_same_parse(frd, eager)
+
+def test_lazy_parses_only_accessed_blocks(data):
+	frd = FRD(data, lazy=True)
+	list(frd.iter_track_blocks([2, 5]))
+	assert frd.trk.loaded() == 2
+	assert frd.poly.loaded() == 2
+	assert frd.xobj.loaded() == 0
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from frd_cache import FRDCache
+from frd_raycast import RAY_CHUNKS, RayCaster, collect_triangles
+
+def brute_force_cast(corners: np.ndarray, origins: np.ndarray, directions: np.ndarray, tmin=1e-4):
+	"""(rays, triangles) Möller–Trumbore distance of every pair, inf on a miss"""
+	corners = corners.astype(np.float64)
+	v0, e1, e2 = corners[:, 0], corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]
+	d = directions[:, None]
+	p = np.cross(d, e2[None])
+	det = np.einsum("rtk,tk->rt", p, e1)
+	parallel = np.abs(det) < 1e-12
+	inverse = 1.0 / np.where(parallel, 1.0, det)
+	s = origins[:, None] - v0[None]
+	u = np.einsum("rtk,rtk->rt", s, p) * inverse
+	q = np.cross(s, e1[None])
+	v = np.einsum("rk,rtk->rt", directions, q) * inverse
+	t = np.einsum("tk,rtk->rt", e2, q) * inverse
+	hit = ~parallel & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > tmin)
+	return np.where(hit, t, np.inf)
+
+@pytest.fixture(scope="module")
+def triangles(eager):
+	return collect_triangles(eager, RAY_CHUNKS)
+
+@pytest.fixture(scope="module")
+def rays(triangles):
+	rng = np.random.default_rng(4)
+	corners = triangles[0]
+	lower, upper = corners.min(axis=(0, 1)), corners.max(axis=(0, 1))
+	n = 1000
+	origins = rng.uniform(lower - 5, upper + 5, (n, 3))
+	origins[:, 2] = rng.uniform(1, 10, n)
+	# mostly downwards onto the road, the rest in any direction
+	directions = rng.normal(0, 1, (n, 3))
+	directions[: n // 2, 2] = -np.abs(directions[: n // 2, 2]) - 2
+	return origins, directions / np.linalg.norm(directions, axis=1)[:, None]
+
+@pytest.mark.parametrize("leafSize", [1, 4, 16])
+def test_cast_matches_brute_force(triangles, rays, leafSize):
+	corners, sources = triangles
+	origins, directions = rays
+	caster = RayCaster.from_triangles(corners, sources, leafSize)
+	distances = brute_force_cast(corners, origins, directions)
+	expected = distances.min(axis=1)
+
+	hits = caster.cast(origins, directions)
+	hit = np.isfinite(expected)
+	assert hit.any() and not hit.all()
+	np.testing.assert_array_equal(np.isfinite(hits.distance), hit)
+	np.testing.assert_allclose(hits.distance[hit], expected[hit], rtol=1e-5)
+	assert np.all(hits.triangle[~hit] == -1)
+	# the reported triangle is one of those at the nearest distance
+	nearest = np.abs(distances[hit] - expected[hit, None]) <= 1e-4 * np.maximum(1, expected[hit, None])
+	reported = caster.sources[hits.triangle[hit]]
+	for row, source in zip(nearest, reported):
+		assert source in sources[row]
+
+	tmax = np.where(hit, expected * 0.5, np.inf)
+	np.testing.assert_array_equal(caster.occluded(origins, directions), hit)
+	assert not caster.occluded(origins[hit], directions[hit], tmax[hit]).any()
+
+def test_open_matches_build(eager, filename, tmp_path):
+	expected = RayCaster.build(eager).to_arrays()
+	cache = FRDCache(str(tmp_path))
+	for caster in (RayCaster.open(filename), RayCaster.open(filename, cache), RayCaster.open(filename, cache)):
+		for name, array in caster.to_arrays().items():
+			np.testing.assert_array_equal(array, expected[name], err_msg=name)
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from frd_road import SURFACE_CHUNKS, RoadSurface
+from polygonblock import TRIANGLE_CORNERS
+
+def surface_triangles(frd):
+	"""(n, 3, 3) corners and (block, chunk, polygon) of every road triangle"""
+	corners, ids = [], []
+	for i, track, polyblock in frd.iter_track_blocks():
+		vertex_buffer = track.vertices_to_buffer()
+		for chunk in SURFACE_CHUNKS:
+			for polygon, quad in enumerate(polyblock.poly[chunk].quad_indices()):
+				for triangle in TRIANGLE_CORNERS:
+					corners.append(vertex_buffer[quad[triangle]])
+					ids.append((i, chunk, polygon))
+	return np.array(corners, dtype=np.float64), np.array(ids)
+
+def brute_force_heights(corners: np.ndarray, points: np.ndarray, below=None):
+	"""(points, triangles) height of every triangle over every point, NaN where it is not under it"""
+	a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+	e1, e2, p = (b - a)[None, :, :2], (c - a)[None, :, :2], points[:, None, :2] - a[None, :, :2]
+	det = e1[..., 0] * e2[..., 1] - e1[..., 1] * e2[..., 0]
+	u = (p[..., 0] * e2[..., 1] - p[..., 1] * e2[..., 0]) / det
+	v = (e1[..., 0] * p[..., 1] - e1[..., 1] * p[..., 0]) / det
+	height = a[None, :, 2] + u * (b - a)[None, :, 2] + v * (c - a)[None, :, 2]
+	inside = (det != 0) & (u >= -1e-6) & (v >= -1e-6) & (u + v <= 1 + 1e-6)
+	if below is not None:
+		inside &= height <= below[:, None]
+	return np.where(inside, height, np.nan)
+
+@pytest.fixture(scope="module")
+def surface(eager):
+	return RoadSurface.build(eager)
+
+@pytest.fixture(scope="module")
+def points(eager):
+	rng = np.random.default_rng(2)
+	centres = np.array([[track.ptCentre.x, track.ptCentre.y] for track in eager.trk])
+	lower, upper = centres.min(axis=0) - 30, centres.max(axis=0) + 30
+	return rng.uniform(lower, upper, (2000, 2))
+
+@pytest.mark.parametrize("offset", [None, 0.0], ids=["highest", "below"])
+def test_sample_matches_brute_force(eager, surface, points, offset):
+	corners, ids = surface_triangles(eager)
+	below = None
+	if offset is not None:
+		# below a surface some points have nothing left, others fall to a lower one
+		below = np.random.default_rng(3).uniform(-0.1, 0.1, len(points)) + offset
+	heights = brute_force_heights(corners, points, below)
+	hit = ~np.all(np.isnan(heights), axis=1)
+	expected = np.where(hit, np.nanmax(np.where(hit[:, None], heights, 0), axis=1), np.nan)
+
+	samples = surface.sample(points, below)
+	assert hit.any() and not hit.all()
+	np.testing.assert_array_equal(np.isnan(samples.height), ~hit)
+	np.testing.assert_allclose(samples.height[hit], expected[hit], atol=1e-5)
+	assert np.all(samples.block[~hit] == -1)
+
+	# the reported polygon is one of the triangles at that height
+	for point in np.flatnonzero(hit):
+		top = np.flatnonzero(np.abs(heights[point] - expected[point]) <= 1e-5)
+		assert (samples.block[point], samples.chunk[point], samples.polygon[point]) in set(map(tuple, ids[top].tolist()))
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from frd import FRD
+from frd_cache import FRDCache
+from frd_spatial import SpatialIndex
+
+@pytest.fixture(scope="module")
+def index(eager):
+	return SpatialIndex.build(eager)
+
+def assert_same_index(index, expected):
+	for name, array in expected.to_arrays().items():
+		np.testing.assert_array_equal(index.to_arrays()[name], array, err_msg=name)
+
+def test_build_leaves_lazy_blocks_unparsed(data, index):
+	frd = FRD(data, lazy=True)
+	assert_same_index(SpatialIndex.build(frd), index)
+	assert frd.trk.loaded() == 0
+	assert frd.xobj.loaded() == 0
+
+def test_open_matches_build(filename, index, tmp_path):
+	cache = FRDCache(str(tmp_path))
+	assert_same_index(SpatialIndex.open(filename), index)
+	assert_same_index(SpatialIndex.open(filename, cache), index)
+	assert_same_index(SpatialIndex.open(filename, cache), index)
+
+def test_queries_match_brute_force(index):
+	rng = np.random.default_rng(0)
+	lower, upper = index.blockMin.min(axis=0), index.blockMax.max(axis=0)
+	points = index.objects["point"]
+	for i in range(50):
+		center = rng.uniform(lower, upper).astype(np.float32)
+		size = rng.uniform(0, (upper - lower) / 4).astype(np.float32)
+		# the track is nearly flat, boxes of full height keep objects in them
+		size[2] = upper[2] - lower[2]
+		lo, hi = center - size, center + size
+
+		result = index.query_aabb(lo, hi)
+		blocks = np.flatnonzero(np.all((index.blockMin <= hi) & (index.blockMax >= lo), axis=1))
+		objects = np.flatnonzero(np.all((points >= lo) & (points <= hi), axis=1))
+		np.testing.assert_array_equal(np.sort(result.blocks), blocks)
+		np.testing.assert_array_equal(np.sort(result.objects), objects)
+
+		radius = float(size[:2].max())
+		result = index.query_radius(center, radius)
+		nearest = np.clip(center, index.blockMin, index.blockMax)
+		blocks = np.flatnonzero(np.sum((nearest - center) ** 2, axis=1) <= radius * radius)
+		objects = np.flatnonzero(np.sum((points - center) ** 2, axis=1) <= radius * radius)
+		np.testing.assert_array_equal(np.sort(result.blocks), blocks)
+		np.testing.assert_array_equal(np.sort(result.objects), objects)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from frd_mesh import VertexPool, weld
+
+def brute_force_weld(vertices: np.ndarray, tolerance: float):
+	"""lowest index of the group of every vertex, from all pairwise distances"""
+	offset = vertices[:, None].astype(np.float64) - vertices[None]
+	close = np.einsum("ijk,ijk->ij", offset, offset) <= tolerance * tolerance
+	group = np.arange(len(vertices))
+	while True:
+		updated = np.where(close, group[None], len(vertices)).min(axis=1)
+		if np.array_equal(updated, group):
+			return group
+		group = updated
+
+def assert_same_groups(kept, remap, expected):
+	np.testing.assert_array_equal(kept[remap], expected)
+	np.testing.assert_array_equal(kept, np.unique(expected))
+
+@pytest.mark.parametrize("tolerance", [0.0, 1e-3, 0.05])
+def test_weld_matches_brute_force(tolerance):
+	rng = np.random.default_rng(1)
+	points = rng.uniform(-1, 1, (300, 3)).astype(np.float32)
+	# exact copies, copies just inside and just outside the tolerance, and chains of near points
+	vertices = np.concatenate((
+		points,
+		points[:100],
+		points[100:150] + np.float32(0.4e-3),
+		points[150:200] + np.float32(2e-3),
+		(points[200:220, None] + np.arange(5, dtype=np.float32)[:, None] * np.float32(0.025)).reshape(-1, 3),
+	))
+	vertices = vertices[rng.permutation(len(vertices))]
+	kept, remap = weld(vertices, tolerance)
+	assert_same_groups(kept, remap, brute_force_weld(vertices, tolerance))
+
+def test_pool_matches_brute_force(eager):
+	pool = VertexPool.build(eager)
+	vertices = np.concatenate([track.vertices_to_buffer() for track in eager.trk])
+	expected = brute_force_weld(vertices, 1e-3)
+	kept = np.unique(expected)
+	np.testing.assert_array_equal(pool.vertices, vertices[kept])
+	np.testing.assert_array_equal(kept[pool.remap], expected)
+
+	for i, track, polyblock in eager.iter_track_blocks():
+		quads = polyblock.poly[4].quad_indices().astype(np.int64) + pool.blockOffsets[i]
+		polygons = pool.polygonBlocks["hires"] == i
+		np.testing.assert_array_equal(pool.quads["hires"][polygons], np.searchsorted(kept, expected[quads]))
@@ -0,0 +1,149 @@
+'''
+Post-transform vertex cache optimization of triangle index buffers.
+
+Triangles are reordered with Tipsify (Sander, Nehab and Barczak, "Fast
+Triangle Reordering for Vertex Locality and Reduced Overdraw", 2007), then
+vertices are renumbered in order of first use so vertex fetches follow the
+index buffer. ACMR, the average cache miss ratio, is the number of
+transformed vertices per triangle through a FIFO cache: 3 is the worst case,
+0.5 is about the best a large regular grid can reach.
+'''
+
+from dataclasses import dataclass
+import numpy as np
+
+# FIFO size assumed for the post-transform cache
+CACHE_SIZE = 16
+
+def cache_misses(indices: np.ndarray, cacheSize=CACHE_SIZE):
+	"""vertices transformed when drawing indices through a FIFO cache of cacheSize entries"""
+	indices = np.asarray(indices).ravel()
+	if len(indices) == 0:
+		return 0
+	# a vertex is cached while fewer than cacheSize misses happened since it was loaded
+	loaded = [-cacheSize - 1] * (int(indices.max()) + 1)
+	misses = 0
+	for v in indices.tolist():
+		if misses - loaded[v] > cacheSize:
+			loaded[v] = misses
+			misses += 1
+	return misses
+
+def acmr(indices: np.ndarray, cacheSize=CACHE_SIZE):
+	triangles = len(np.asarray(indices).ravel()) // 3
+	return cache_misses(indices, cacheSize) / triangles if triangles else 0.0
+
+def tipsify(triangles: np.ndarray, nVertices: int, cacheSize=CACHE_SIZE):
+	"""
+	Order of the (n, 3) triangles that fans around one vertex at a time,
+	moving on to the cached vertex with the most remaining triangles that
+	will still be cached after emitting them.
+	"""
+	triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+	if len(triangles) == 0:
+		return np.zeros(0, dtype=np.int64)
+	flat = triangles.ravel()
+	counts = np.bincount(flat, minlength=nVertices)
+	# triangles around each vertex as CSR
+	start = np.concatenate(([0], np.cumsum(counts))).tolist()
+	adjacent = (np.argsort(flat, kind="stable") // 3).tolist()
+	corners = triangles.tolist()
+	live = counts.tolist()
+	cached = [0] * nVertices
+	emitted = [False] * len(corners)
+	deadEnd = []
+	order = []
+	time = cacheSize + 1
+	cursor = 0
+	fanning = int(flat[0])
+
+	while fanning >= 0:
+		candidates = []
+		for t in adjacent[start[fanning]:start[fanning + 1]]:
+			if emitted[t]:
+				continue
+			emitted[t] = True
+			order.append(t)
+			for v in corners[t]:
+				deadEnd.append(v)
+				candidates.append(v)
+				live[v] -= 1
+				if time - cached[v] > cacheSize:
+					cached[v] = time
+					time += 1
+
+		fanning = -1
+		best = -1
+		for v in candidates:
+			if live[v] == 0:
+				continue
+			priority = 0
+			if time - cached[v] + 2 * live[v] <= cacheSize:
+				priority = time - cached[v]
+			if priority > best:
+				best, fanning = priority, v
+
+		if fanning < 0:
+			while deadEnd:
+				v = deadEnd.pop()
+				if live[v] > 0:
+					fanning = v
+					break
+		if fanning < 0:
+			while cursor < nVertices and live[cursor] == 0:
+				cursor += 1
+			if cursor < nVertices:
+				fanning = cursor
+
+	return np.array(order, dtype=np.int64)
+
+def first_use_order(indices: np.ndarray, nVertices: int):
+	"""vertex ids sorted by first reference in indices, unreferenced vertices last"""
+	indices = np.asarray(indices).ravel()
+	used, first = np.unique(indices, return_index=True)
+	unused = np.setdiff1d(np.arange(nVertices), used, assume_unique=True)
+	return np.concatenate((used[np.argsort(first)], unused)).astype(np.int64)
+
+@dataclass
+class VertexCacheOptimizer:
+	"""
+	Reorders index buffers in the export path and sums the cache misses
+	of every buffer it has seen, before and after.
+	"""
+	cacheSize: int = CACHE_SIZE
+	triangles: int = 0
+	missesBefore: int = 0
+	missesAfter: int = 0
+
+	@property
+	def acmr_before(self):
+		return self.missesBefore / self.triangles if self.triangles else 0.0
+
+	@property
+	def acmr_after(self):
+		return self.missesAfter / self.triangles if self.triangles else 0.0
+
+	def optimize(self, indices: np.ndarray, nVertices: int, ranges=None):
+		"""
+		Triangles are reordered within each (start, end) index range, so
+		per-material ranges stay valid. Returns the new indices and the old
+		vertex id of every new vertex.
+		"""
+		indices = np.asarray(indices).ravel()
+		if ranges is None:
+			ranges = [(0, len(indices))]
+		reordered = np.empty_like(indices)
+		for start, end in ranges:
+			triangles = indices[start:end].reshape(-1, 3)
+			order = tipsify(triangles, nVertices, self.cacheSize)
+			reordered[start:end] = triangles[order].ravel()
+
+		vertexOrder = first_use_order(reordered, nVertices)
+		remap = np.empty(nVertices, dtype=indices.dtype)
+		remap[vertexOrder] = np.arange(nVertices, dtype=indices.dtype)
+		reordered = remap[reordered]
+
+		self.triangles += len(indices) // 3
+		self.missesBefore += cache_misses(indices, self.cacheSize)
+		self.missesAfter += cache_misses(reordered, self.cacheSize)
+		return reordered, vertexOrder